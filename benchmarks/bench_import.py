@@ -0,0 +1,65 @@
+"""
+Benchmark the time taken to import yt_georaster.
+
+Each import is run in a fresh interpreter. The time taken to import
+yt itself is measured separately and subtracted.
+
+Usage:
+    $ python benchmarks/bench_import.py [-n RUNS]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# modules that should only be imported on first use
+lazy_modules = (
+    "fiona",
+    "shapely",
+    "yaml",
+    "yt_georaster.polygon",
+    "yt_georaster.polygon_selector",
+)
+
+
+def time_import(statement, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def loaded_modules(statement, modules):
+    code = (
+        f"{statement}\n"
+        "import sys\n"
+        f"print(' '.join(m for m in {modules!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    return output.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    statement = "import yt.extensions.georaster"
+    t_python = time_import("pass", args.runs)
+    t_yt = time_import("import yt", args.runs)
+    t_ytgr = time_import(statement, args.runs)
+
+    print(f"python startup:        {t_python:.3f} s")
+    print(f"import yt:             {t_yt - t_python:.3f} s")
+    print(f"import yt_georaster:   {t_ytgr - t_yt:.3f} s (excluding yt)")
+    loaded = loaded_modules(statement, lazy_modules)
+    print(f"lazy modules imported: {', '.join(loaded) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark common operations on synthetic Landsat-8 and Sentinel-2 scenes.
+
+Scenes are written with yt_georaster.testing, so no sample data or
+network access is needed. The Sentinel-2 scene is in a different CRS
+than the Landsat-8 scene (the base image), so queries of Sentinel-2
+fields are reprojected. Each case is run with empty caches and the
+median time is reported, along with the bytes read from disk.
+
+Results can be saved as json and compared with an earlier run. If any
+case is slower than the earlier run by more than the threshold, the
+exit status is 1.
+
+Usage:
+    $ python benchmarks/bench_scenes.py [--size 2000] [--repeat 3] [--output results.json]
+    $ python benchmarks/bench_scenes.py --compare results.json --threshold 1.25
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import yt
+import yt.extensions.georaster  # noqa: F401
+from yt.config import ytcfg
+
+from yt_georaster.testing import (
+    landsat8_prefix,
+    make_landsat8_scene,
+    make_polygon_file,
+    make_sentinel2_scene,
+)
+from yt_georaster.utilities import save_as_geotiff
+
+l8_type = landsat8_prefix
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+def make_scenes(directory, args):
+    """
+    Write the synthetic scenes and a polygon over their center.
+    """
+
+    kwargs = {
+        "tiled": not args.no_tiled,
+        "blocksize": args.blocksize,
+        "compress": args.compress,
+    }
+    l8_fns = make_landsat8_scene(
+        os.path.join(directory, "landsat"), size=args.size, **kwargs
+    )
+    # the same area at 10 m
+    s2_fns = make_sentinel2_scene(
+        os.path.join(directory, "sentinel2"), size=3 * args.size,
+        bands=["B02", "B03", "B04", "B8A", "B11"], **kwargs
+    )
+    extent = 30 * args.size
+    center = (399960 + extent / 2, -100020 - extent / 2)
+    polygon = make_polygon_file(
+        os.path.join(directory, "polygon.shp"), center, extent / 8, "EPSG:32636"
+    )
+    return l8_fns, s2_fns, polygon
+
+
+def case_load(ctx):
+    ds = yt.load(*ctx["fns"], io_threads=ctx["io_threads"])
+    ds.index
+    return ds
+
+
+def case_rectangle(ds, ctx):
+    width = ds.domain_width[0] / 2
+    rec = ds.rectangle_from_center(ds.domain_center, width, width)
+    rec[l8_type, "red"]
+
+
+def case_circle(ds, ctx):
+    circle = ds.circle(ds.domain_center, ds.domain_width[0] / 4)
+    circle[l8_type, "red"]
+
+
+def case_polygon(ds, ctx):
+    poly = ds.polygon(ctx["polygon"])
+    poly[l8_type, "red"]
+
+
+def case_reproject(ds, ctx):
+    circle = ds.circle(ds.domain_center, ds.domain_width[0] / 4)
+    circle[s2_type, "red"]
+    circle[s2_type, "nir"]
+
+
+def case_indices(ds, ctx):
+    ad = ds.all_data()
+    ad[l8_type, "NDVI"]
+    ad[l8_type, "EVI"]
+    ad[s2_type, "NDWI"]
+
+
+def case_quantiles(ds, ctx):
+    ad = ds.all_data()
+    ad.quantities.quantiles((l8_type, "NDVI"), [0.02, 0.98])
+
+
+def case_plot(ds, ctx):
+    p = ds.plot((l8_type, "NDVI"))
+    p.save(os.path.join(ctx["tmpdir"], "plot.png"))
+
+
+def case_save_as_geotiff(ds, ctx):
+    circle = ds.circle(ds.domain_center, ds.domain_width[0] / 4)
+    fields = [(l8_type, "red"), (l8_type, "NDVI"), (s2_type, "red")]
+    save_as_geotiff(
+        ds, os.path.join(ctx["tmpdir"], "saved.tif"), fields=fields, data_source=circle
+    )
+
+
+cases = {
+    "rectangle": case_rectangle,
+    "circle": case_circle,
+    "polygon": case_polygon,
+    "reproject": case_reproject,
+    "indices": case_indices,
+    "quantiles": case_quantiles,
+    "plot": case_plot,
+    "save_as_geotiff": case_save_as_geotiff,
+}
+
+
+def run_case(func, ctx, repeat):
+    """
+    Run a case several times with empty caches.
+
+    Returns the median time and the bytes read in the last run.
+    """
+
+    times = []
+    for _ in range(repeat):
+        if func is case_load:
+            start = time.perf_counter()
+            ds = func(ctx)
+            times.append(time.perf_counter() - start)
+            ctx["ds"] = ds
+            nbytes = 0
+            continue
+
+        ds = ctx["ds"]
+        ds.index.io.close()
+        ds._window_datasets.clear()
+        with ds.index.io.stats.measure() as stats:
+            start = time.perf_counter()
+            func(ds, ctx)
+            times.append(time.perf_counter() - start)
+        nbytes = stats.bytes_read
+    return statistics.median(times), nbytes
+
+
+def compare(results, baseline, threshold, min_change=0.05):
+    """
+    Print the change from a baseline and return the slower cases.
+
+    Cases that changed by less than min_change seconds are not counted
+    as slower, since very short timings are noisy.
+    """
+
+    slower = []
+    print(f"\n{'case':<16} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, result in results["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        old = baseline["cases"][name]["time"]
+        ratio = result["time"] / old if old > 0 else float("inf")
+        is_slower = ratio > threshold and result["time"] - old > min_change
+        flag = " *" if is_slower else ""
+        print(f"{name:<16} {old:>9.3f}s {result['time']:>9.3f}s {ratio:>7.2f}{flag}")
+        if is_slower:
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=2000,
+                        help="width and height of the Landsat-8 scene in pixels")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", nargs="+", choices=list(cases),
+                        default=list(cases))
+    parser.add_argument("--compress", default=None,
+                        help="GeoTIFF compression, e.g., deflate")
+    parser.add_argument("--no-tiled", action="store_true",
+                        help="write GeoTIFFs in strips instead of tiles")
+    parser.add_argument("--blocksize", type=int, default=256)
+    parser.add_argument("--io-threads", type=int, default=None)
+    parser.add_argument("--directory", default=None,
+                        help="directory for the scenes (kept afterward)")
+    parser.add_argument("--output", default=None, help="save results as json")
+    parser.add_argument("--compare", default=None,
+                        help="json results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    yt.set_log_level(40)
+    # divisions by zero in nodata regions are expected for the indices
+    warnings.simplefilter("ignore", RuntimeWarning)
+    ytcfg["yt", "skip_dataset_cache"] = True
+
+    tmpdir = tempfile.mkdtemp()
+    directory = args.directory or os.path.join(tmpdir, "scenes")
+    try:
+        start = time.perf_counter()
+        l8_fns, s2_fns, polygon = make_scenes(directory, args)
+        print(f"wrote scenes in {time.perf_counter() - start:.1f} s")
+
+        ctx = {
+            "fns": l8_fns + s2_fns,
+            "polygon": polygon,
+            "tmpdir": tmpdir,
+            "io_threads": args.io_threads,
+        }
+        results = {"args": vars(args), "cases": {}}
+        print(f"{'case':<16} {'time':>10} {'read':>10}")
+        for name, func in [("load", case_load)] + [(c, cases[c]) for c in args.cases]:
+            try:
+                t, nbytes = run_case(func, ctx, args.repeat)
+            except Exception as err:
+                print(f"{name:<16} failed: {err!r}")
+                continue
+            results["cases"][name] = {"time": t, "bytes_read": nbytes}
+            print(f"{name:<16} {t:>9.3f}s {nbytes / 1024**2:>8.2f}MB")
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if args.output is not None:
+        with open(args.output, mode="w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, mode="r") as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.threshold)
+        if slower:
+            print(f"\nslower than baseline: {', '.join(slower)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
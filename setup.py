@@ -105,6 +105,9 @@ setup(
     extras_require={
         "dev": dev_requirements,
     },
+    entry_points={
+        "console_scripts": ["yt-georaster=yt_georaster.cli:main"],
+    },
     cmdclass={"sdist": sdist, "build_ext": build_ext},
     ext_modules=cython_extensions,
     python_requires=">=3.7",
@@ -0,0 +1,91 @@
+import numpy as np
+from numpy.testing import assert_equal
+import os
+import yt
+import yt.extensions.georaster
+
+from yt_georaster.aligned_cache import AlignedCache
+from yt_georaster.testing import (
+    TempDirTest,
+    landsat8_prefix,
+    make_landsat8_scene,
+    make_sentinel2_scene,
+)
+
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+class AlignedCacheTest(TempDirTest):
+    def setUp(self):
+        super().setUp()
+        self.fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4", "SR_B5"])
+        self.fns += make_sentinel2_scene("s2", size=600, bands=["B04", "B8A"])
+
+    def assert_same_values(self, ref, ds, fields):
+        for dobjs in [
+            (ref.all_data(), ds.all_data()),
+            (ref.circle(ref.domain_center, (2, "km")),
+             ds.circle(ds.domain_center, (2, "km"))),
+        ]:
+            for field in fields:
+                assert_equal(dobjs[1][field].d, dobjs[0][field].d)
+
+    def test_aligned_cache(self):
+        for kwargs in ({}, {"mask_nodata": True}):
+            ref = yt.load(*self.fns, **kwargs)
+            ds = yt.load(*self.fns, **kwargs)
+            cache = ds.build_aligned_cache(None, "aligned.tif", rebuild=True)
+            assert os.path.exists("aligned.tif.json")
+
+            # only the Sentinel-2 fields are not on the base grid
+            aligned = ds.index.io._aligned_fields
+            assert_equal(
+                sorted(aligned),
+                [(s2_type, "S2_B04_10m"), (s2_type, "S2_B8A_20m")],
+            )
+            assert_equal(len(cache.get_valid_fields()), 2)
+
+            fields = [(s2_type, "red"), (s2_type, "NDVI"), (landsat8_prefix, "red")]
+            with ds.index.io.stats.measure() as stats:
+                self.assert_same_values(ref, ds, fields)
+            # no reprojection
+            assert_equal(stats.times["reproject"], 0)
+            assert all("jp2" not in fn for fn in stats.files)
+
+    def test_aligned_cache_invalidation(self):
+        ds = yt.load(*self.fns)
+        field = (s2_type, "red")
+        ds.build_aligned_cache([field], "aligned.tif")
+        mtime = os.stat("aligned.tif").st_mtime_ns
+
+        # reused by a new dataset with the same files
+        ds = yt.load(*self.fns)
+        ds.build_aligned_cache([field], "aligned.tif")
+        assert_equal(os.stat("aligned.tif").st_mtime_ns, mtime)
+        assert_equal(len(ds.index.io._aligned_fields), 1)
+
+        # not used with a different resampling method
+        ds2 = yt.load(*self.fns, resample_method="bilinear")
+        assert_equal(AlignedCache(ds2, "aligned.tif").get_valid_fields(), [])
+
+        # adding a field keeps the fields already cached
+        ds.build_aligned_cache([(s2_type, "nir")], "aligned.tif")
+        assert_equal(len(ds.index.io._aligned_fields), 2)
+
+        # only fields from changed images are out of date
+        s2_fn = ds.index.geo_manager.fields[s2_type, "S2_B04_10m"]["filename"]
+        st = os.stat(s2_fn)
+        os.utime(s2_fn, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        ds = yt.load(*self.fns)
+        cache = AlignedCache(ds, "aligned.tif")
+        assert_equal(cache.get_valid_fields(), [(s2_type, "S2_B8A_20m")])
+        cache.update([field])
+        assert_equal(
+            sorted(cache.get_valid_fields()),
+            [(s2_type, "S2_B04_10m"), (s2_type, "S2_B8A_20m")],
+        )
+
+        ref = yt.load(*self.fns)
+        values = ds.all_data()[s2_type, "NDVI"]
+        assert_equal(values.d, ref.all_data()[s2_type, "NDVI"].d)
+        assert np.isfinite(values).any()
@@ -0,0 +1,104 @@
+import glob
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+import os
+import pytest
+import yt
+import yt.extensions.georaster
+
+from yt.config import ytcfg
+
+from yt_georaster.band_math import BandMathExpression
+from yt_georaster.testing import requires_file
+
+test_data_dir = ytcfg.get("yt", "test_data_dir")
+landsat = "Landsat-8_sample_L2/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF"
+s2 = "M2_Sentinel-2_test_data/S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE_20210315T092856_B01.jp2"
+
+landsat_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(landsat), "*.TIF"))
+s2_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(s2), "*.jp2"))
+
+
+def test_expression_evaluation():
+    rng = np.random.default_rng(0)
+    nir = rng.random((37, 23, 1))
+    red = rng.random((37, 23, 1))
+    blue = rng.random((37, 23, 1))
+
+    expr = BandMathExpression("(nir - red) / (nir + red)", block_size=100)
+    assert_equal(expr.variables, ("nir", "red"))
+    assert_allclose(expr(nir, red), (nir - red) / (nir + red))
+
+    expr = BandMathExpression(
+        "2.5 * (nir - red) / ((nir + 6.0 * red - 7.5 * blue) + 1.0)",
+        block_size=64,
+    )
+    assert_equal(expr.dependencies, ("nir", "red", "blue"))
+    assert_allclose(
+        expr(nir, red, blue),
+        2.5 * (nir - red) / ((nir + 6.0 * red - 7.5 * blue) + 1.0),
+    )
+
+    expr = BandMathExpression("sqrt(abs(-nir)) + nir**2 + max(nir, red) - 2**3")
+    assert_allclose(
+        expr(nir, red),
+        np.sqrt(nir) + nir ** 2 + np.maximum(nir, red) - 8,
+    )
+
+    expr = BandMathExpression("nir")
+    assert_allclose(expr(nir), nir)
+
+
+def test_common_subexpressions():
+    expr = BandMathExpression("(nir - red) / (nir + red) + (red + nir)")
+    # subtract, add, divide, add
+    assert_equal(expr.num_instructions, 4)
+
+    expr = BandMathExpression("(2 * 3) * nir")
+    assert_equal(expr.num_instructions, 1)
+
+    # registers read twice by one instruction
+    rng = np.random.default_rng(1)
+    a = rng.random((41, 19, 1)) + 0.5
+    b = rng.random((41, 19, 1)) + 0.5
+    cases = {
+        "(a+b)*(a+b) + (a-b)": (a + b) * (a + b) + (a - b),
+        "(a+b)*(a+b) - (a-b)*(a*b)": (a + b) * (a + b) - (a - b) * (a * b),
+        "max(a+b, a+b) + (a-b)*(b/a)": np.maximum(a + b, a + b) + (a - b) * (b / a),
+    }
+    for expression, expected in cases.items():
+        expr = BandMathExpression(expression, block_size=100)
+        assert_allclose(expr(a, b), expected)
+
+    # non-contiguous output
+    out = np.zeros((41, 19, 2))
+    result = expr(a[..., 0], b[..., 0], out=out[..., 0])
+    assert_allclose(out[..., 0], expected[..., 0])
+    assert np.shares_memory(result, out)
+
+
+def test_invalid_expressions():
+    for expression in ["nir +", "nir.attr", "foo(nir)", "nir[0]", "sqrt(nir, red)"]:
+        with pytest.raises(ValueError):
+            BandMathExpression(expression)
+
+
+@requires_file(landsat)
+@requires_file(s2)
+def test_band_math_fields():
+    fns = landsat_fns + s2_fns
+    ds = yt.load(*fns)
+
+    new_fields = ds.add_band_math("my_NDVI", "(nir - red) / (nir + red)")
+    ftypes = [
+        "LC08_L2SP_171060_20210227_20210304_02_T1",
+        "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE",
+    ]
+    assert_equal(sorted(field[0] for field in new_fields), ftypes)
+
+    circle = ds.circle(ds.domain_center, (5, "km"))
+    for ftype in ftypes:
+        assert_allclose(circle[ftype, "my_NDVI"], circle[ftype, "NDVI"])
+
+    deps = ds.band_math[(ftypes[0], "my_NDVI")].dependencies
+    assert_equal(deps, ((ftypes[0], "L8_B5_30m"), (ftypes[0], "L8_B4_30m")))
@@ -0,0 +1,145 @@
+import json
+import multiprocessing
+from numpy.testing import assert_equal
+import os
+import pytest
+import rasterio
+from unittest import mock
+import yaml
+import yt
+import yt.extensions.georaster
+
+from yt_georaster import batch
+from yt_georaster.batch import parse_memory, read_manifest, run_batch
+from yt_georaster.cli import main
+from yt_georaster.testing import TempDirTest, make_sentinel2_scene
+from yt_georaster.utilities import save_as_geotiff
+
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+run_task = batch.run_task
+
+
+def _run_or_die(task):
+    # a task that kills its worker, as if out of memory
+    if task["name"] == "dying":
+        os._exit(1)
+    return run_task(task)
+
+
+class BatchTest(TempDirTest):
+    def setUp(self):
+        super().setUp()
+        self.fns = {}
+        for name in ["a", "b"]:
+            self.fns[name] = make_sentinel2_scene(name, size=200, bands=["B04", "B8A"])
+        manifest = {
+            "output_dir": "out",
+            "load": {"nodata": 0},
+            "expressions": {"my_NDVI": "(nir - red) / (nir + red)"},
+            "fields": ["my_NDVI", [s2_type, "red"]],
+            "dtype": "float32",
+            "scenes": [
+                {"name": "a", "files": "a/*.jp2"},
+                {"name": "b", "files": [os.path.abspath(fn) for fn in self.fns["b"]]},
+                {"name": "missing", "files": "missing/*.jp2"},
+            ],
+        }
+        with open("manifest.yaml", mode="w") as f:
+            yaml.dump(manifest, f)
+
+    def _get_status(self):
+        with open(os.path.join("out", "batch_state.json"), mode="r") as f:
+            tasks = json.load(f)["tasks"]
+        return {name: (record["status"], record["time"])
+                for name, record in tasks.items()}
+
+    def test_batch(self):
+        tasks = read_manifest("manifest.yaml")
+        assert_equal([task["name"] for task in tasks], ["a", "b", "missing"])
+        assert_equal(len(tasks[0]["files"]), 2)
+
+        # the missing scene fails without stopping the others
+        assert_equal(main(["batch", "manifest.yaml", "--workers", "2"]), 1)
+        status = self._get_status()
+        assert_equal({name: s for name, (s, _) in status.items()},
+                     {"a": "done", "b": "done", "missing": "failed"})
+
+        ds = yt.load(*self.fns["a"], nodata=0)
+        ds.add_band_math("my_NDVI", "(nir - red) / (nir + red)")
+        fields = [(s2_type, "my_NDVI"), (s2_type, "red")]
+        save_as_geotiff(ds, "ref.tif", fields=fields, dtype="float32")
+        with rasterio.open("ref.tif") as ref, rasterio.open("out/a.tif") as out:
+            assert_equal(out.read(), ref.read())
+
+        # up-to-date scenes are skipped and failed ones are run again
+        state = run_batch("manifest.yaml", workers=2)
+        new_status = self._get_status()
+        for name in ["a", "b"]:
+            assert_equal(new_status[name], status[name])
+        assert_equal(state.tasks["missing"]["status"], "failed")
+
+        # only the scene with a changed file is run again
+        st = os.stat(self.fns["b"][0])
+        os.utime(self.fns["b"][0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        run_batch("manifest.yaml", workers=2)
+        new_status = self._get_status()
+        assert_equal(new_status["a"], status["a"])
+        assert new_status["b"] != status["b"]
+        assert_equal(new_status["b"][0], "done")
+
+        # everything is run again when forced
+        run_batch("manifest.yaml", workers=1, force=True)
+        new_status = self._get_status()
+        assert new_status["a"] != status["a"]
+
+        # failed records of scenes no longer in the manifest are ignored
+        with open("manifest.yaml", mode="r") as f:
+            manifest = yaml.safe_load(f)
+        manifest["scenes"] = manifest["scenes"][:2]
+        with open("manifest.yaml", mode="w") as f:
+            yaml.dump(manifest, f)
+        assert_equal(main(["batch", "manifest.yaml", "--workers", "2"]), 0)
+        assert_equal(self._get_status()["missing"][0], "failed")
+
+    def test_manifest_aoi(self):
+        # areas of interest are relative to the manifest
+        os.makedirs("project")
+        scenes = [
+            {"name": "a", "files": "../a/*.jp2"},
+            {"name": "b", "files": "../a/*.jp2", "aoi": "shapes/b.shp"},
+            {"name": "c", "files": "../a/*.jp2", "aoi": None},
+        ]
+        with open(os.path.join("project", "manifest.yaml"), mode="w") as f:
+            yaml.dump({"fields": ["NDVI"], "aoi": "shapes/all.shp",
+                       "scenes": scenes}, f)
+        tasks = read_manifest(os.path.join("project", "manifest.yaml"))
+        root = os.path.abspath("project")
+        assert_equal([task["aoi"] for task in tasks],
+                     [os.path.join(root, "shapes", "all.shp"),
+                      os.path.join(root, "shapes", "b.shp"), None])
+
+    @pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                        reason="workers must inherit the patched task")
+    def test_dying_worker(self):
+        scenes = [{"name": f"s{i}", "files": "a/*.jp2"} for i in range(5)]
+        scenes.insert(2, {"name": "dying", "files": "a/*.jp2"})
+        with open("manifest.yaml", mode="w") as f:
+            yaml.dump({"output_dir": "out", "fields": ["NDVI"], "scenes": scenes}, f)
+
+        with mock.patch.object(batch, "run_task", _run_or_die):
+            state = run_batch("manifest.yaml", workers=3)
+        status = {name: record["status"] for name, record in state.tasks.items()}
+        # only the task killing its worker fails
+        assert_equal(status.pop("dying"), "failed")
+        assert_equal(set(status.values()), {"done"})
+        assert_equal(len(status), 5)
+        # times are of each task, not since the start of the batch
+        for record in state.tasks.values():
+            assert 0 < record["time"] < 60
+
+    def test_parse_memory(self):
+        assert_equal(parse_memory("512M"), 512 * 1024 ** 2)
+        assert_equal(parse_memory("4GB"), 4 * 1024 ** 3)
+        assert_equal(parse_memory("1.5k"), 1536)
+        assert_equal(parse_memory(1000), 1000)
+        assert parse_memory(None) is None
@@ -0,0 +1,150 @@
+import numpy as np
+from numpy.testing import assert_equal
+import os
+import pickle
+import time
+import yt
+import yt.extensions.georaster
+from rasterio.transform import from_origin
+
+from yt_georaster.block_cache import BlockCache
+from yt_georaster.testing import (
+    TempDirTest,
+    make_landsat8_scene,
+    make_sentinel2_scene,
+)
+
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+class BlockCacheTest(TempDirTest):
+    def test_block_cache(self):
+        cache = BlockCache("blocks.sqlite", max_bytes=10000, compress=False)
+        data = np.arange(1000, dtype="float32").reshape(20, 50)
+        cache.put("a", data)
+        value = cache.get("a")
+        assert_equal(value, data)
+        assert_equal(value.dtype, data.dtype)
+        assert cache.get("b") is None
+
+        # visible to other instances, e.g., in other processes
+        other = BlockCache("blocks.sqlite", max_bytes=10000)
+        assert_equal(other.get("a"), data)
+
+        # the least recently used block is removed
+        cache._touch_interval = 0
+        cache.put("b", data)
+        cache.get("a")
+        cache.put("c", data)
+        assert_equal(len(cache), 2)
+        assert cache.get("b") is None
+        assert cache.nbytes <= 10000
+
+        # the running total matches the stored blocks
+        cache.put("c", data[:5])
+        total = cache._connect().execute("SELECT SUM(size) FROM blocks").fetchone()[0]
+        assert_equal(cache.nbytes, total)
+
+        # old blocks are removed
+        cache.max_age = 0.01
+        time.sleep(0.05)
+        cache.put("d", data[:2])
+        assert_equal(len(cache), 1)
+
+        cache.clear()
+        assert_equal(len(cache), 0)
+        assert_equal(cache.nbytes, 0)
+
+        # keyword arguments to yt.load must be picklable
+        copy = pickle.loads(pickle.dumps(cache))
+        assert_equal((copy.filename, copy.max_bytes), (cache.filename, cache.max_bytes))
+
+    def test_old_block_cache(self):
+        import sqlite3
+
+        # caches made before the total size was stored
+        con = sqlite3.connect("old.sqlite")
+        with con:
+            con.execute(
+                "CREATE TABLE blocks (key TEXT PRIMARY KEY, dtype TEXT, shape TEXT, "
+                "compressed INTEGER, data BLOB, size INTEGER, accessed REAL)"
+            )
+            con.execute("INSERT INTO blocks VALUES ('a', '<f4', '[2]', 0, ?, 8, ?)",
+                        (np.ones(2, dtype="float32").tobytes(), time.time()))
+        con.close()
+
+        cache = BlockCache("old.sqlite", compress=False)
+        assert_equal(cache.nbytes, 8)
+        assert_equal(cache.get("a"), np.ones(2, dtype="float32"))
+        cache.put("b", np.ones(4, dtype="float32"))
+        assert_equal(cache.nbytes, 24)
+        assert_equal(BlockCache("old.sqlite").nbytes, 24)
+
+    def test_block_cache_reads(self):
+        fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4", "SR_B5"])
+        fns += make_sentinel2_scene("s2", size=600, bands=["B04", "B8A"])
+        field = (s2_type, "NDVI")
+        disk_fields = [(s2_type, "S2_B04_10m"), (s2_type, "S2_B8A_20m")]
+        # a grid in another CRS for reading directly
+        grid = ("EPSG:32736", from_origin(401000, 9898000, 25, 25), 100, 100)
+
+        ref = yt.load(*fns)
+        ref_values = ref.circle(ref.domain_center, (2, "km"))[field]
+        ref_warped = ref.index.io.read_warped(disk_fields, *grid)
+
+        for i in range(2):
+            # a new dataset each time, as in another process
+            ds = yt.load(*fns, block_cache="blocks.sqlite")
+            ds.index.io.close()
+            with ds.index.io.stats.measure() as stats:
+                values = ds.circle(ds.domain_center, (2, "km"))[field]
+                warped = ds.index.io.read_warped(disk_fields, *grid)
+            assert_equal(values, ref_values)
+            for dfield in disk_fields:
+                assert_equal(warped[dfield], ref_warped[dfield])
+            if i == 0:
+                assert stats.block_cache_misses > 0
+                assert stats.bytes_read > 0
+                # the warped read uses blocks decoded for the circle
+                assert stats.block_cache_hits > 0
+            else:
+                assert_equal(stats.block_cache_misses, 0)
+                assert_equal(stats.bytes_read, 0)
+
+        # changed files are read again
+        s2_fn = ds.index.geo_manager.fields[disk_fields[0]]["filename"]
+        st = os.stat(s2_fn)
+        os.utime(s2_fn, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        ds = yt.load(*fns, block_cache="blocks.sqlite")
+        with ds.index.io.stats.measure() as stats:
+            ds.circle(ds.domain_center, (2, "km"))[field]
+        for fn, fstats in stats.files.items():
+            if fn == s2_fn:
+                assert_equal(fstats.get("block_cache_hits", 0), 0)
+                assert fstats["block_cache_misses"] > 0
+            else:
+                assert_equal(fstats.get("block_cache_misses", 0), 0)
+
+    def test_overlapping_windows(self):
+        fns = make_sentinel2_scene("s2", size=1200, bands=["B04", "B8A"])
+        field = (s2_type, "NDVI")
+        ref = yt.load(*fns, mask_nodata=True)
+        center = ref.domain_center
+        shifts = [ref.arr([0, 0, 0], "m"), ref.arr([130, -70, 0], "m")]
+        ref_values = [ref.circle(center + shift, (1.5, "km"))[field]
+                      for shift in shifts]
+
+        ds = yt.load(*fns, mask_nodata=True, block_cache="blocks.sqlite")
+        ds.circle(center + shifts[0], (1.5, "km"))[field]
+        # a different window over the same area reads nothing new
+        ds = yt.load(*fns, mask_nodata=True, block_cache="blocks.sqlite")
+        with ds.index.io.stats.measure() as stats:
+            values = ds.circle(center + shifts[1], (1.5, "km"))[field]
+        assert_equal(values, ref_values[1])
+        assert_equal(stats.block_cache_misses, 0)
+        assert_equal(stats.bytes_read, 0)
+
+        # masked pixels are kept with the blocks
+        ad_values = ds.all_data()[field]
+        assert_equal(ad_values, ref.all_data()[field])
+        assert np.isnan(ad_values).any()
@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from numpy.testing import assert_equal
+import pickle
+from unittest import mock
+import yt
+import yt.extensions.georaster
+
+from yt_georaster.testing import (
+    TempDirTest,
+    make_landsat8_scene,
+    make_sentinel2_scene,
+)
+
+l8_type = "LC08_L2SP_171060_20210227_20210304_02_T1"
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+def _double_red(field, data):
+    return 2 * data[s2_type, "red"]
+
+
+def _get_values(ds):
+    circle = ds.circle(ds.domain_center, (2, "km"))
+    return {field: circle[field].d
+            for field in [(s2_type, "my_NDVI"), (s2_type, "double_red"),
+                          (l8_type, "my_NDVI")]}
+
+
+class DescriptorTest(TempDirTest):
+    def test_descriptor(self):
+        fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4", "SR_B5"])
+        fns += make_sentinel2_scene("s2", size=400, bands=["B04", "B8A"])
+        ds = yt.load(*fns, nodata=0, block_cache="blocks.sqlite")
+        ds.add_band_math("my_NDVI", "(nir - red) / (nir + red)")
+        ds.add_field((s2_type, "double_red"), function=_double_red,
+                     sampling_type="local", units="")
+        ds.build_aligned_cache([(s2_type, "S2_B8A_20m")], "aligned.tif")
+        expected = _get_values(ds)
+
+        data = pickle.dumps(ds)
+        assert len(data) < 100000
+        # no files are opened to make the dataset
+        with mock.patch("rasterio.open", side_effect=AssertionError):
+            copy = pickle.loads(data)
+        assert copy is not ds
+        assert_equal(copy.nodata, 0)
+        assert_equal(copy.block_cache.filename, "blocks.sqlite")
+        assert_equal(list(copy.index.io._aligned_fields),
+                     list(ds.index.io._aligned_fields))
+        for field, values in _get_values(copy).items():
+            assert_equal(values, expected[field])
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(_get_values, [ds, ds]))
+        for result in results:
+            for field, values in result.items():
+                assert_equal(values, expected[field])
+        assert np.isfinite(expected[s2_type, "my_NDVI"]).any()
@@ -1,11 +1,12 @@
 import glob
-from numpy.testing import assert_equal
+from numpy.testing import assert_allclose, assert_equal
 import os
 import yt
 import yt.extensions.georaster
 
 from yt.config import ytcfg
 
+from yt_georaster.data_structures import GeoRasterHierarchy, _get_tile_size
 from yt_georaster.testing import requires_file
 
 test_data_dir = ytcfg.get("yt", "test_data_dir")
@@ -26,3 +27,37 @@ def test_grid():
     n2 = ds.data[("S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE", "S2_B01")].shape
     assert_equal(n1, n2)
     assert_equal(n1, tuple(ds.data.ActiveDimensions))
+
+
+@requires_file(landsat)
+def test_tile_chunks():
+    ds = yt.load(*landsat_fns)
+    ds.index._tile_size = 64
+    field = ("LC08_L2SP_171060_20210227_20210304_02_T1", "red")
+
+    for dobj in (ds.all_data(), ds.circle(ds.domain_center, (2, "km"))):
+        values = dobj[field]
+        chunks = list(dobj.chunks([], "io"))
+        assert len(chunks) > 1
+        assert_equal(sum(chunk._current_chunk.data_size for chunk in dobj.chunks([], "io")),
+                     values.size)
+
+        # reductions over tiles match the whole selection
+        vmin, vmax = dobj.quantities.extrema(field)
+        assert_equal((vmin, vmax), (values.min(), values.max()))
+        assert_allclose(dobj.quantities.total_quantity(field), values.sum())
+
+
+def test_tile_size():
+    args = (GeoRasterHierarchy._tile_size, GeoRasterHierarchy._min_tile_size,
+            GeoRasterHierarchy._tiles_per_process)
+    assert_equal(_get_tile_size(10000 ** 2, *args), 2048)
+
+    nprocs = ytcfg.get("yt", "internals", "global_parallel_size")
+    ytcfg.set("yt", "internals", "global_parallel_size", 128)
+    try:
+        # several tiles per process, in multiples of 256 pixels
+        assert_equal(_get_tile_size(10000 ** 2, *args), 256 * 1)
+        assert_equal(_get_tile_size(40000 ** 2, *args), 256 * 6)
+    finally:
+        ytcfg.set("yt", "internals", "global_parallel_size", nprocs)
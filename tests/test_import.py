@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+lazy_modules = (
+    "fiona",
+    "shapely",
+    "yaml",
+    "yt_georaster.polygon",
+    "yt_georaster.polygon_selector",
+)
+
+
+def test_lazy_imports():
+    code = (
+        "import sys\n"
+        "import yt.extensions.georaster\n"
+        f"print(' '.join(m for m in {lazy_modules!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    assert output.stdout.split() == []
+
+
+def test_lazy_attributes():
+    import yt_georaster
+    from yt_georaster.polygon import YTPolygon
+    from yt_georaster.utilities import save_as_geotiff
+
+    assert yt_georaster.YTPolygon is YTPolygon
+    assert yt_georaster.save_as_geotiff is save_as_geotiff
+    assert "MetadataIndex" in dir(yt_georaster)
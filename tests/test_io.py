@@ -0,0 +1,240 @@
+import glob
+import json
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal, assert_equal
+import os
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+import yaml
+import yt
+import yt.extensions.georaster
+
+from yt.config import ytcfg
+
+from yt_georaster.io import IOStats, RasterHandlePool
+from yt_georaster.testing import (
+    TempDirTest,
+    make_landsat8_scene,
+    make_sentinel2_scene,
+    requires_file,
+    write_synthetic_image,
+)
+
+test_data_dir = ytcfg.get("yt", "test_data_dir")
+landsat = "Landsat-8_sample_L2/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF"
+s2 = "M2_Sentinel-2_test_data/S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE_20210315T092856_B01.jp2"
+
+landsat_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(landsat), "*.TIF"))
+s2_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(s2), "*.jp2"))
+
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+@requires_file(landsat)
+@requires_file(s2)
+def test_disk_dependencies():
+    fns = landsat_fns + s2_fns
+    ds = yt.load(*fns)
+
+    deps = ds.field_info.get_disk_dependencies(
+        [(s2_type, "EVI"), (s2_type, "NDVI")]
+    )
+    assert_equal(
+        sorted(deps),
+        [(s2_type, "S2_B02_10m"), (s2_type, "S2_B04_10m"), (s2_type, "S2_B8A_20m")],
+    )
+
+
+@requires_file(landsat)
+@requires_file(s2)
+def test_batched_reads():
+    fns = landsat_fns + s2_fns
+    ds = yt.load(*fns)
+    io = ds.index.io
+
+    fields = [(s2_type, fname) for fname in ["EVI", "NDVI", "NDWI", "CDOM", "MCI"]]
+    disk_fields = ds.field_info.get_disk_dependencies(fields)
+
+    circle = ds.circle(ds.domain_center, (5, "km"))
+    misses = io._misses
+    values = {field: circle[field] for field in fields}
+    # each band is read only once
+    assert_equal(io._misses - misses, len(disk_fields))
+
+    circle.clear_data()
+    misses = io._misses
+    for field in fields:
+        assert_array_equal(circle[field], values[field])
+    assert_equal(io._misses, misses)
+
+
+class BatchedReadsTest(TempDirTest):
+    def test_batched_reads(self):
+        l8_type = "LC08_L2SP_171060_20210227_20210304_02_T1"
+        fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4", "SR_B5"])
+        fns += make_sentinel2_scene("s2", size=400, bands=["B03", "B04", "B8A", "B11"])
+        ds = yt.load(*fns)
+        io = ds.index.io
+
+        fields = [(s2_type, fname) for fname in ["NDVI", "NDWI"]]
+        fields += [(l8_type, "NDVI")]
+        disk_fields = ds.field_info.get_disk_dependencies(fields)
+        filenames = {ds.index.geo_manager.fields[field]["filename"]
+                     for field in disk_fields}
+
+        circle = ds.circle(ds.domain_center, (2, "km"))
+        with io.stats.measure() as stats:
+            circle.get_data(fields)
+        # each file is opened and read once for all of its bands
+        assert_equal(set(stats.files), filenames)
+        for filename in filenames:
+            assert_equal(stats.files[filename]["reads"], 1)
+            assert_equal(stats.files[filename]["opens"], 1)
+
+
+class GeoRasterScaleTest(TempDirTest):
+    @requires_file(landsat)
+    def test_field_map_scaling(self):
+        ds = yt.load(*landsat_fns)
+        ftype = "LC08_L2SP_171060_20210227_20210304_02_T1"
+        fname = "L8_B4_30m"
+        filename = ds.index.geo_manager.fields[ftype, fname]["filename"]
+        fbase = os.path.splitext(os.path.basename(filename))[0]
+
+        fm_fn = "scaling.yaml"
+        with open(fm_fn, mode="w") as f:
+            yaml.dump(
+                {fbase: {fname: {"scale_factor": 2.75e-05, "add_offset": -0.2}}}, f
+            )
+        ds_scaled = yt.load(*landsat_fns, field_map=fm_fn)
+        assert ds_scaled.field_info.is_rescaled((ftype, "red"))
+
+        raw = ds.all_data()[ftype, fname].d
+        scaled = ds_scaled.all_data()[ftype, fname].d
+        nodata = raw == ds.index.geo_manager.fields[ftype, fname]["nodata"]
+        assert_allclose(
+            scaled[~nodata],
+            raw[~nodata] * np.float32(2.75e-05) + np.float32(-0.2),
+            atol=1e-6,
+        )
+        assert_array_equal(scaled[nodata], raw[nodata])
+
+        ds_masked = yt.load(*landsat_fns, field_map=fm_fn, mask_nodata=True)
+        masked = ds_masked.all_data()[ftype, fname].d
+        assert_equal(np.isnan(masked), nodata)
+
+
+@requires_file(landsat)
+def test_handle_pool():
+    pool = RasterHandlePool()
+    fn = os.path.join(test_data_dir, landsat)
+    with pool.open(fn) as src1:
+        # a file in use is not handed out twice
+        with pool.open(fn) as src2:
+            assert src1 is not src2
+    assert_equal(len(pool), 2)
+    with pool.open(fn) as src3:
+        assert src3 in (src1, src2)
+    pool.close()
+    assert_equal(len(pool), 0)
+    assert src1.closed and src2.closed
+
+
+def test_io_stats_record():
+    stats = IOStats()
+    with stats.measure() as scoped:
+        stats.record(filename="a.tif", reads=1, bytes_read=100, read_time=0.5,
+                     peak_buffer_bytes=400, largest_window=(10, 10))
+        stats.record(field=("f", "b"), totals=False, bytes_read=100)
+    stats.record(field=("f", "b"), cache_hits=1)
+
+    assert_equal(scoped.bytes_read, 100)
+    assert_equal(scoped.cache_hits, 0)
+    assert_equal(stats.cache_hits, 1)
+    assert_equal(stats.to_dict()["files"]["a.tif"],
+                 {"reads": 1, "bytes_read": 100, "read_time": 0.5,
+                  "peak_buffer_bytes": 400, "largest_window": [10, 10]})
+    assert_equal(stats.to_dict()["fields"]["f/b"], {"bytes_read": 100, "cache_hits": 1})
+    assert_equal(json.loads(stats.to_json())["times"]["read"], 0.5)
+
+    stats.reset()
+    assert_equal(stats.bytes_read, 0)
+    assert_equal(stats.files, {})
+
+
+@requires_file(landsat)
+def test_io_stats():
+    ds = yt.load(*landsat_fns)
+    field = ("LC08_L2SP_171060_20210227_20210304_02_T1", "NDVI")
+    disk_fields = ds.field_info.get_disk_dependencies([field])
+    circle = ds.circle(ds.domain_center, (5, "km"))
+
+    with ds.index.io.stats.measure() as stats:
+        circle[field]
+    assert_equal(stats.cache_misses, len(disk_fields))
+    assert_equal(len(stats.files), len(disk_fields))
+    assert_equal(len(stats.fields), len(disk_fields))
+    assert stats.bytes_read > 0
+    assert stats.pixels_decoded >= 2 * circle[field].size
+    assert stats.times["read"] > 0
+    assert stats.times["select"] > 0
+
+    circle.clear_data()
+    with ds.index.io.stats.measure() as stats:
+        circle[field]
+    assert_equal(stats.cache_hits, len(disk_fields))
+    assert_equal(stats.bytes_read, 0)
+    assert_equal(ds.index.io.stats.cache_hits, len(disk_fields))
+
+
+class ReadWindowTest(TempDirTest):
+    def test_read_window(self):
+        ds = yt.load(write_synthetic_image(
+            "image.tif", 40, 30, from_origin(0, 300, 10, 10), "EPSG:32636"
+        ))
+        io = ds.index.io
+        windows = [
+            Window(5, 5, 10, 10),     # inside
+            Window(-4, 25, 10, 10),   # over a corner
+            Window(-2, -3, 45, 36),   # around the image
+            Window(50, 0, 10, 10),    # outside
+        ]
+        for nodata in (0, None):
+            write_synthetic_image(
+                "image.tif", 40, 30, from_origin(0, 300, 10, 10), "EPSG:32636",
+                nodata=nodata, nodata_corner=nodata is not None,
+            )
+            with rasterio.open("image.tif") as src:
+                for window in windows:
+                    for masked, fill_value in [(False, None), (False, -1), (True, None)]:
+                        ref = src.read(
+                            [1], window=window, out_dtype="float32", boundless=True,
+                            fill_value=fill_value, masked=masked,
+                        )
+                        data, read_window = io._read_window(
+                            src, [1], window, "float32", fill_value=fill_value,
+                            masked=masked,
+                        )
+                        assert_equal(data, ref)
+                        if masked:
+                            assert_equal(np.ma.getmaskarray(data),
+                                         np.ma.getmaskarray(ref))
+                        if window.col_off >= src.width:
+                            assert read_window is None
+                        else:
+                            assert_equal(
+                                read_window,
+                                window.intersection(Window(0, 0, src.width, src.height)),
+                            )
+
+        # only the part of a window inside the image counts as read
+        window = Window(-4, 25, 10, 10)
+        with rasterio.open("image.tif") as src, io.stats.measure() as stats:
+            data, read_window = io._read_window(src, [1], window, "float32")
+            io._record_read(src, "image.tif", [(("image", "band_1"), 1)], data,
+                            read_window, window=window)
+            itemsize = np.dtype(src.dtypes[0]).itemsize
+        assert_equal(stats.pixels_decoded, 6 * 5)
+        assert_equal(stats.bytes_read, 6 * 5 * itemsize)
+        assert_equal(stats.peak_buffer_bytes, data.nbytes)
@@ -0,0 +1,88 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+from rasterio.crs import CRS
+from rasterio.warp import transform_geom
+from shapely.geometry import box, mapping, Point, shape
+from unittest import mock
+import yt
+import yt.extensions.georaster
+
+from yt_georaster.label_cache import LabelCache
+from yt_georaster.testing import (
+    TempDirTest,
+    make_landsat8_scene,
+    make_sentinel2_scene,
+)
+
+l8_type = "LC08_L2SP_171060_20210227_20210304_02_T1"
+
+
+class LabelCacheTest(TempDirTest):
+    def setUp(self):
+        import fiona
+
+        super().setUp()
+        self.fns = make_landsat8_scene("landsat", size=300, bands=["SR_B4", "SR_B5"])
+        ds = yt.load(*self.fns)
+        utm = CRS.from_epsg(32636)
+        geo = CRS.from_epsg(4326)
+        x, y = ds.domain_center.d[:2]
+        features = [
+            Point(x - 2000, y).buffer(1500).difference(Point(x - 2000, y).buffer(500)),
+            Point(x + 2000, y + 1000).buffer(900),
+            box(x - 500, y - 3000, x + 1500, y - 1800),
+        ]
+        self.features = features
+        schema = {"geometry": "Polygon", "properties": {"name": "str"}}
+        with fiona.open("parcels.shp", "w", driver="ESRI Shapefile", schema=schema,
+                        crs_wkt=geo.to_wkt()) as f:
+            for i, feature in enumerate(features):
+                f.write({
+                    "geometry": transform_geom(utm, geo, mapping(feature)),
+                    "properties": {"name": f"p{i}"},
+                })
+
+    def test_label_raster(self):
+        field = (l8_type, "NDVI")
+        ds = yt.load(*self.fns)
+        labels = ds.label_raster("parcels.shp", "labels", id_field="name")
+        assert_equal(labels.ids, ["p0", "p1", "p2"])
+        assert_equal(labels.counts, np.bincount(labels.read().ravel())[1:])
+
+        # per-feature selection and zonal statistics agree
+        ad = ds.all_data()
+        stats = ad.quantities.zonal_statistics(field, labels, tile_size=100)
+        assert_equal(stats["count"], labels.counts)
+        for i, fid in enumerate(labels.ids):
+            values = labels.get_feature_data(ds, fid, [field])[field]
+            assert_equal(values.size, stats["count"][i])
+            assert_allclose(stats["mean"][i], values.mean(), rtol=1e-10)
+            assert_allclose(stats["std"][i], values.std(), rtol=1e-6)
+            assert_equal(stats["min"][i], values.min())
+            assert_equal(stats["max"][i], values.max())
+            # the feature is about the same as the polygon container
+            poly = ds.polygon(shape(self.features[i]))
+            assert_allclose(values.size, poly[field].size, rtol=0.1)
+
+        # reused by another dataset on the same grid
+        ds2 = yt.load(*self.fns)
+        with mock.patch.object(LabelCache, "build") as build:
+            labels2 = ds2.label_raster("parcels.shp", "labels", id_field="name")
+        build.assert_not_called()
+        assert_equal(labels2.filename, labels.filename)
+
+        # rasterized again when the shapefile changes
+        with open("parcels.dbf", mode="rb") as f:
+            data = f.read()
+        with open("parcels.dbf", mode="wb") as f:
+            f.write(data.replace(b"p2", b"p9"))
+        labels3 = ds2.label_raster("parcels.shp", "labels", id_field="name")
+        assert labels3.filename != labels.filename
+        assert_equal(labels3.ids, ["p0", "p1", "p9"])
+
+        # other grids are rejected
+        s2_fns = make_sentinel2_scene("s2", size=300, bands=["B04"])
+        with self.assertRaises(ValueError):
+            yt.load(*s2_fns).all_data().quantities.zonal_statistics(
+                ("S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE", "red"), labels
+            )
@@ -1,3 +1,4 @@
+from numpy.testing import assert_equal
 import os
 import yt
 import yt.extensions.georaster
@@ -5,6 +6,7 @@ import yt.extensions.georaster
 from yt.config import ytcfg
 
 from yt_georaster.data_structures import GeoRasterDataset
+from yt_georaster.image_types import GeoManager
 from yt_georaster.testing import requires_file
 
 test_data_dir = ytcfg.get("yt", "test_data_dir")
@@ -42,3 +44,31 @@ def test_load_group():
     fns = [land_use_data, s2l1c_data, s2l2a_data]
     ds = yt.load(*fns)
     assert isinstance(ds, GeoRasterDataset)
+
+
+def test_identify_files():
+    gm = GeoManager(None)
+    fns = [
+        "data/S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE_20210315T092856_B01.jp2",
+        "data/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF",
+        "data/200km_2p5m_N38E34.TIF",
+    ]
+    assert_equal(
+        gm.identify_files(fns),
+        [
+            ("S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE", "S2_B01"),
+            ("LC08_L2SP_171060_20210227_20210304_02_T1", "L8_B1"),
+            ("200km_2p5m_N38E34", None),
+        ],
+    )
+
+
+@requires_file(land_use_data)
+@requires_file(s2l1c_data)
+@requires_file(s2l2a_data)
+def test_load_order():
+    fns = [land_use_data, s2l1c_data, s2l2a_data]
+    ds1 = yt.load(*fns, io_threads=1)
+    ds4 = yt.load(*fns, io_threads=4)
+    assert_equal(ds4.field_list, ds1.field_list)
+    assert_equal(ds4.index.geo_manager.ftypes, ds1.index.geo_manager.ftypes)
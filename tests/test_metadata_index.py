@@ -0,0 +1,61 @@
+import glob
+from numpy.testing import assert_array_equal, assert_equal
+import os
+import shutil
+import yt
+import yt.extensions.georaster
+
+from yt.config import ytcfg
+
+from yt_georaster import build_metadata_index, MetadataIndex
+from yt_georaster.testing import requires_file, TempDirTest
+
+test_data_dir = ytcfg.get("yt", "test_data_dir")
+landsat = "Landsat-8_sample_L2/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF"
+s2 = "M2_Sentinel-2_test_data/S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE_20210315T092856_B01.jp2"
+
+landsat_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(landsat), "*.TIF"))
+s2_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(s2), "*.jp2"))
+
+
+class GeoRasterMetadataIndexTest(TempDirTest):
+    @requires_file(landsat)
+    @requires_file(s2)
+    def test_load_from_index(self):
+        fns = landsat_fns + s2_fns
+        ds = yt.load(*fns)
+
+        mindex = build_metadata_index(fns, "index.json")
+        assert os.path.exists("index.json")
+        assert_equal(len(mindex), len(fns))
+
+        ds_index = yt.load(*fns, metadata_index="index.json")
+        assert_equal(ds_index.parameters["crs"], ds.parameters["crs"])
+        assert_equal(ds_index.parameters["transform"], ds.parameters["transform"])
+        assert_equal(dict(ds_index.parameters["profile"]), dict(ds.parameters["profile"]))
+        assert_equal(ds_index.field_list, ds.field_list)
+        assert_equal(ds_index.index.geo_manager.fields, ds.index.geo_manager.fields)
+
+        field = ("LC08_L2SP_171060_20210227_20210304_02_T1", "NDVI")
+        assert_array_equal(ds_index.all_data()[field], ds.all_data()[field])
+
+    @requires_file(landsat)
+    def test_stale_entries(self):
+        fn = "copy.TIF"
+        shutil.copy(os.path.join(test_data_dir, landsat), fn)
+
+        mindex = MetadataIndex("index.json")
+        assert_equal(mindex.update([fn]), [fn])
+        assert_equal(mindex.update([fn]), [])
+        assert fn in MetadataIndex("index.json")
+
+        # a changed file is read again
+        stat = os.stat(fn)
+        os.utime(fn, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert fn not in mindex
+        assert_equal(mindex.update([fn]), [fn])
+
+        # a missing file is removed
+        os.remove(fn)
+        mindex.refresh()
+        assert_equal(len(MetadataIndex("index.json")), 0)
@@ -1,4 +1,5 @@
 import glob
+from numpy.testing import assert_allclose, assert_equal
 import os
 
 import yt
@@ -80,3 +81,45 @@ class GeoRasterPlotTest(TempDirTest):
         for field in fields:
             p = ds.plot(field, data_source=polygon)
             p.save()
+
+    @requires_file(
+        os.path.join(LS_dir, "LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF")
+    )
+    def test_plot_resolution(self):
+        fns = glob.glob(os.path.join(test_data_dir, LS_dir, "*.TIF"))
+        ds = yt.load(*fns)
+        field = ("LC08_L2SP_171060_20210227_20210304_02_T1", "L8_B1_30m")
+
+        # data is read at the resolution of the plot image
+        p = ds.plot(field, buff_size=400)
+        assert p.ds.domain_dimensions[:2].max() <= 400
+        image = p.frb[field]
+
+        p = ds.plot(field, buff_size=400, full_resolution=True)
+        assert_equal(p.ds.domain_dimensions, ds.domain_dimensions)
+        image_full = p.frb[field]
+        assert_equal(image.shape, image_full.shape)
+        assert_allclose(image.mean(), image_full.mean(), rtol=0.05)
+
+    @requires_file(
+        os.path.join(LS_dir, "LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF")
+    )
+    def test_plot_window_cache(self):
+        fns = glob.glob(os.path.join(test_data_dir, LS_dir, "*.TIF"))
+        ds = yt.load(*fns)
+        ftype = "LC08_L2SP_171060_20210227_20210304_02_T1"
+
+        p1 = ds.plot((ftype, "NDVI"), width=(2, "km"))
+        p2 = ds.plot((ftype, "nir"), width=(2, "km"))
+        assert p1.ds is p2.ds
+        assert p1.ds.index.geo_manager is ds.index.geo_manager
+        assert p1.ds.index.io._handle_pool is ds.index.io._handle_pool
+
+        # fields added later are available to cached window datasets
+        ds.add_band_math("my_NDVI", "(nir - red) / (nir + red)", ftype=ftype)
+        p3 = ds.plot((ftype, "my_NDVI"), width=(2, "km"))
+        assert p3.ds is p1.ds
+        assert_allclose(p3.frb[ftype, "my_NDVI"], p1.frb[ftype, "NDVI"])
+
+        p4 = ds.plot((ftype, "NDVI"), width=(3, "km"))
+        assert p4.ds is not p1.ds
@@ -1,12 +1,27 @@
 import glob
-from numpy.testing import assert_equal
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
 import os
+from rasterio.crs import CRS
+from rasterio.warp import transform_geom
+import shapely
+from shapely.geometry import box, LineString, mapping, MultiPolygon, Point, Polygon, shape
+import types
+from unittest import mock
 import yt
 import yt.extensions.georaster
 
 from yt.config import ytcfg
 
-from yt_georaster.testing import requires_file
+from yt.geometry.selection_routines import SelectorObject
+
+from yt_georaster.data_structures import _merge_windows
+from yt_georaster.testing import (
+    make_landsat8_scene,
+    make_sentinel2_scene,
+    requires_file,
+    TempDirTest,
+)
 
 test_data_dir = ytcfg.get("yt", "test_data_dir")
 landsat = "Landsat-8_sample_L2/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF"
@@ -44,3 +59,158 @@ def test_polygon_multi():
         polygon["LC08_L2SP_171060_20210227_20210304_02_T1", "L8_B10"].size, 551624
     )
     assert_equal(polygon["S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE", "S2_B10"].size, 551624)
+
+
+class SparsePolygonTest(TempDirTest):
+    def test_sparse_polygon_reads(self):
+        fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4", "SR_B5"])
+        fns += make_sentinel2_scene("s2", size=600, bands=["B04", "B8A"])
+        fields = [
+            ("LC08_L2SP_171060_20210227_20210304_02_T1", "NDVI"),
+            ("S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE", "NDVI"),
+        ]
+
+        for kwargs in ({}, {"mask_nodata": True, "resample_method": "bilinear"}):
+            ds = yt.load(*fns, **kwargs)
+            io = ds.index.io
+            left = ds.domain_left_edge.d
+            width = ds.domain_width.d
+            # a thin, bent corridor covering little of its bounding box
+            line = LineString([
+                left[:2] + 0.1 * width[:2],
+                left[:2] + [0.9 * width[0], 0.15 * width[1]],
+                left[:2] + 0.9 * width[:2],
+            ])
+            poly = ds.polygon(line.buffer(100))
+
+            values = {}
+            bytes_read = {}
+            for block_size in (32, 100000):
+                io.close()
+                io._sparse_block_size = block_size
+                with io.stats.measure() as stats:
+                    values[block_size] = [poly[field].d for field in fields]
+                bytes_read[block_size] = stats.bytes_read
+                poly.field_data.clear()
+
+            for sparse, dense in zip(values[32], values[100000]):
+                assert_equal(sparse, dense)
+            assert bytes_read[32] < bytes_read[100000] / 2
+
+    def test_multipolygon_windows(self):
+        fns = make_landsat8_scene("landsat", size=600, bands=["SR_B4", "SR_B5"])
+        field = ("LC08_L2SP_171060_20210227_20210304_02_T1", "NDVI")
+        ds = yt.load(*fns)
+        left = ds.domain_left_edge.d
+        width = ds.domain_width.d
+        # two nearby parts and one far away
+        parts = [
+            Point(left[0] + fx * width[0], left[1] + fy * width[1]).buffer(radius)
+            for fx, fy, radius in [(0.1, 0.1, 500), (0.12, 0.14, 300), (0.9, 0.85, 700)]
+        ]
+        poly = ds.polygon(MultiPolygon(parts))
+
+        grid = ds.index.grids[0]
+        wgrids = grid._get_polygon_window_grids(poly.selector)
+        assert_equal(len(wgrids), 2)
+        with ds.index.io.stats.measure() as stats:
+            values = poly[field].d
+            x = poly["index", "x"].d
+            y = poly["index", "y"].d
+        bytes_read = stats.bytes_read
+
+        # compare with a single window around all parts
+        grid._max_window_fraction = 0
+        try:
+            ds.index.io.close()
+            ref = ds.polygon(MultiPolygon(parts))
+            with ds.index.io.stats.measure() as stats:
+                ref_values = ref[field].d
+                ref_x = ref["index", "x"].d
+                ref_y = ref["index", "y"].d
+        finally:
+            del grid._max_window_fraction
+        order = np.lexsort((y, x))
+        ref_order = np.lexsort((ref_y, ref_x))
+        assert_equal(values[order], ref_values[ref_order])
+        assert bytes_read < stats.bytes_read / 4
+
+    def test_merge_windows(self):
+        windows = _merge_windows(
+            [[0, 0, 10, 10], [12, 0, 20, 10], [100, 100, 110, 110], [105, 105, 120, 108]],
+            2,
+        )
+        assert_equal(
+            sorted(windows.tolist()), [[0, 0, 20, 10], [100, 100, 120, 110]]
+        )
+
+    def test_shapefile_features(self):
+        import fiona
+
+        fns = make_landsat8_scene("landsat", size=300, bands=["SR_B4", "SR_B5"])
+        ds = yt.load(*fns)
+        utm = CRS.from_epsg(32636)
+        geo = CRS.from_epsg(4326)
+        x, y = ds.domain_center.d[:2]
+        # a polygon with a hole and a two part MultiPolygon
+        features = [
+            Point(x - 2000, y).buffer(1500).difference(Point(x - 2000, y).buffer(500)),
+            MultiPolygon([Point(x + 2000, y - 2000).buffer(800),
+                          Point(x + 2000, y + 2000).buffer(800)]),
+        ]
+        features = [shape(transform_geom(utm, geo, mapping(f))) for f in features]
+        schema = {"geometry": "Polygon", "properties": {"id": "int"}}
+        with fiona.open("features.shp", "w", driver="ESRI Shapefile", schema=schema,
+                        crs_wkt=geo.to_wkt()) as f:
+            for i, feature in enumerate(features):
+                f.write({"geometry": mapping(feature), "properties": {"id": i}})
+
+        expected = [shape(transform_geom(geo, utm, mapping(f))) for f in features]
+        # also without shapely.transform (shapely < 2)
+        for module in (shapely, types.SimpleNamespace()):
+            with mock.patch("yt_georaster.polygon.shapely", module):
+                poly = ds.polygon("features.shp")
+            assert_equal(poly._number_features, 2)
+            parts = list(poly.polygon.geoms)
+            assert_equal(len(parts), 3)
+            assert_equal(sum(len(part.interiors) for part in parts), 1)
+            assert_allclose(poly.polygon.area, sum(f.area for f in expected), rtol=1e-9)
+
+        simple = ds.polygon("features.shp", simplify=True)
+        assert len(simple.polygon.geoms[0].exterior.coords) < \
+            len(poly.polygon.geoms[0].exterior.coords)
+        assert poly.polygon.hausdorff_distance(simple.polygon) <= 30
+
+    def test_polygon_mask(self):
+        fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4"])
+        ds = yt.load(*fns)
+        left = ds.domain_left_edge.d
+        center = left[:2] + ds.domain_width.d[:2] / 2
+        rng = np.random.default_rng(0)
+        angles = np.linspace(0, 2 * np.pi, 5000, endpoint=False)
+        radii = 2000 + 2 * rng.random(angles.size)
+        shapes = [
+            # a hole
+            Point(*center).buffer(1500).difference(Point(*center).buffer(600)),
+            # edges along pixel edges
+            box(left[0] + 300, left[1] + 600, left[0] + 1500, left[1] + 2400),
+            # many vertices
+            Polygon(np.column_stack([center[0] + radii * np.cos(angles),
+                                     center[1] + radii * np.sin(angles)])),
+        ]
+
+        grid = ds.index.grids[0]
+        for shape_ in shapes:
+            poly = ds.polygon(shape_)
+            wgrid = grid._get_window_grid(poly.selector)
+            # the same as testing every cell
+            assert_equal(
+                poly.selector.fill_mask_regular_grid(wgrid),
+                SelectorObject.fill_mask_regular_grid(poly.selector, wgrid),
+            )
+
+        # selection uses the exact polygon unless a tolerance is set
+        assert poly.selection_polygon is poly.polygon
+        poly = ds.polygon(shapes[-1], selection_tolerance=0.1)
+        assert len(poly.selection_polygon.exterior.coords) < angles.size / 2
+        assert_equal(len(poly.polygon.exterior.coords), angles.size + 1)
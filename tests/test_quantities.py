@@ -0,0 +1,97 @@
+import glob
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+import os
+import yt
+import yt.extensions.georaster
+
+from yt.config import ytcfg
+
+from yt_georaster.quantities import StreamingHistogram, TDigest
+from yt_georaster.testing import requires_file
+
+test_data_dir = ytcfg.get("yt", "test_data_dir")
+landsat = "Landsat-8_sample_L2/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF"
+landsat_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(landsat), "*.TIF"))
+ftype = "LC08_L2SP_171060_20210227_20210304_02_T1"
+
+
+def test_fixed_histogram():
+    values = np.random.default_rng(0).normal(size=10000)
+    ref, edges = np.histogram(values, bins=20, range=(-2, 2))
+
+    hist = StreamingHistogram(bins=20, range=(-2, 2))
+    other = StreamingHistogram(bins=20, range=(-2, 2))
+    hist.add(values[:3000])
+    other.add(values[3000:])
+    hist.merge(other)
+    assert_allclose(hist.edges, edges)
+    assert_equal(hist.counts, ref)
+    assert_equal(hist.underflow, (values < -2).sum())
+    assert_equal(hist.overflow, (values > 2).sum())
+    assert_equal(hist.total, values.size)
+
+
+def test_adaptive_histogram():
+    rng = np.random.default_rng(1)
+    parts = [rng.normal(size=1000), 100 + rng.normal(size=1000), [np.nan]]
+
+    hist = StreamingHistogram(bins=64)
+    merged = StreamingHistogram(bins=64)
+    for part in parts:
+        hist.add(part)
+        sub = StreamingHistogram(bins=64)
+        sub.add(part)
+        merged.merge(sub)
+
+    values = np.concatenate(parts[:2])
+    for h in (hist, merged):
+        assert h.counts.size <= 64
+        assert_equal(h.total, values.size)
+        edges = h.edges
+        assert edges[0] <= values.min() and edges[-1] > values.max()
+        assert_equal(h.counts, np.histogram(values, bins=edges)[0])
+    assert_equal(hist.edges, merged.edges)
+    assert_equal(hist.counts, merged.counts)
+
+
+def test_tdigest():
+    rng = np.random.default_rng(2)
+    values = rng.lognormal(size=200000)
+    q = [0, 0.02, 0.5, 0.98, 1]
+
+    digest = TDigest()
+    for part in np.array_split(values, 7):
+        sub = TDigest()
+        sub.add(part)
+        digest.merge(sub)
+    assert_equal(digest.count, values.size)
+    assert digest.means.size < 200
+
+    # compare ranks rather than values
+    ranks = np.searchsorted(np.sort(values), digest.quantile(q)) / values.size
+    assert_allclose(ranks, q, atol=2e-3)
+    assert_equal(digest.quantile(0), values.min())
+    assert_equal(digest.quantile(1), values.max())
+
+
+@requires_file(landsat)
+def test_quantities():
+    ds = yt.load(*landsat_fns)
+    # use small tiles to make sure there are several
+    ds.index._tile_size = 256
+    field = (ftype, "red")
+    q = [0.02, 0.5, 0.98]
+
+    for dobj in (ds.all_data(), ds.circle(ds.domain_center, (5, "km"))):
+        values = dobj[field]
+        values = values[np.isfinite(values) & (values != 0)]
+        ref = np.sort(values.d)
+
+        result = dobj.quantities.quantiles(field, q)
+        assert_equal(str(result.units), str(values.units))
+        ranks = np.searchsorted(ref, result.d) / ref.size
+        assert_allclose(ranks, q, atol=5e-3)
+
+        hist = dobj.quantities.histogram(field, bins=32, range=(ref[0], ref[-1]))
+        assert_equal(hist.counts, np.histogram(ref, bins=32, range=(ref[0], ref[-1]))[0])
@@ -0,0 +1,79 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+import rasterio
+import yt
+import yt.extensions.georaster
+
+from yt_georaster.testing import (
+    TempDirTest,
+    landsat8_prefix,
+    make_landsat8_scene,
+    make_polygon_file,
+    make_sentinel2_scene,
+)
+
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+class SyntheticSceneTest(TempDirTest):
+    def test_landsat8_scene(self):
+        fns = make_landsat8_scene(
+            "landsat", size=(300, 200), bands=["SR_B4", "SR_B5"],
+            blocksize=64, compress="deflate"
+        )
+        assert_equal(len(fns), 2)
+        for fn in fns:
+            with rasterio.open(fn) as src:
+                assert_equal(src.driver, "GTiff")
+                assert_equal((src.width, src.height), (300, 200))
+                assert_equal(src.crs.to_epsg(), 32636)
+                assert_equal(src.res, (30, 30))
+                assert_equal(src.block_shapes[0], (64, 64))
+                assert_equal(src.compression.value, "DEFLATE")
+                data = src.read(1)
+            # one corner has no data
+            assert_equal(data[0, 0], 0)
+            assert (data != 0).mean() > 0.85
+
+        ds = yt.load(*fns)
+        assert_equal(ds.parameters["crs"].to_epsg(), 32636)
+        ad = ds.all_data()
+        ndvi = ad[landsat8_prefix, "NDVI"]
+        assert_equal(ndvi.size, 300 * 200)
+
+    def test_sentinel2_scene(self):
+        fns = make_sentinel2_scene(
+            "s2", size=120, bands=["B04", "B8A", "B01"]
+        )
+        res = {}
+        for fn in fns:
+            with rasterio.open(fn) as src:
+                assert_equal(src.driver, "JP2OpenJPEG")
+                assert_equal(src.crs.to_epsg(), 32736)
+                res[fn[-7:-4]] = (src.res[0], src.width)
+        assert_equal(res, {"B04": (10, 120), "B8A": (20, 60), "B01": (60, 20)})
+
+        ds = yt.load(*fns)
+        assert_equal(ds.domain_dimensions[:2], (120, 120))
+        assert (s2_type, "red") in ds.derived_field_list
+
+    def test_mixed_scenes(self):
+        l8_fns = make_landsat8_scene("landsat", size=100, bands=["SR_B4"], tiled=False)
+        with rasterio.open(l8_fns[0]) as src:
+            # strips span the full width
+            assert_equal(src.block_shapes[0][1], 100)
+
+        s2_fns = make_sentinel2_scene("s2", size=300, bands=["B04"])
+        # away from the corners with no data
+        center = (399960 + 2000, -100020 - 2000)
+        polygon = make_polygon_file("polygon.shp", center, 600, "EPSG:32636")
+
+        ds = yt.load(*(l8_fns + s2_fns))
+        poly = ds.polygon(polygon)
+        # the scenes overlap after reprojection
+        l8_red = poly[landsat8_prefix, "red"]
+        s2_red = poly[s2_type, "red"]
+        assert_equal(l8_red.shape, s2_red.shape)
+        assert np.isfinite(s2_red).all() and (s2_red > 0).all()
+        # roughly the area of the polygon in pixels
+        assert_allclose(l8_red.size * 900, np.pi * 600**2, rtol=0.1)
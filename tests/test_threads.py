@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numpy.testing import assert_equal
+import threading
+import yt
+import yt.extensions.georaster
+from shapely.geometry import Point
+
+from yt_georaster.testing import (
+    TempDirTest,
+    make_landsat8_scene,
+    make_sentinel2_scene,
+)
+
+l8_type = "LC08_L2SP_171060_20210227_20210304_02_T1"
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+class ThreadsTest(TempDirTest):
+    def setUp(self):
+        super().setUp()
+        fns = make_landsat8_scene("landsat", size=200, bands=["SR_B4", "SR_B5"])
+        fns += make_sentinel2_scene("s2", size=400, bands=["B04", "B8A"])
+        self.ds = yt.load(*fns)
+
+    def test_concurrent_queries(self):
+        ds = self.ds
+        center = ds.domain_center.d[:2]
+        rng = np.random.default_rng(0)
+        queries = []
+        for i in range(24):
+            x, y = center + rng.uniform(-2000, 2000, 2)
+            size = rng.uniform(300, 1500)
+            field = [(l8_type, "NDVI"), (s2_type, "NDVI"), (s2_type, "red")][i % 3]
+            queries.append((i % 3, (x, y), size, field))
+
+        def run(query):
+            kind, (x, y), size, field = query
+            if kind == 0:
+                dobj = ds.circle(ds.arr([x, y], "m"), ds.quan(size, "m"))
+            elif kind == 1:
+                dobj = ds.rectangle(ds.arr([x - size, y - size], "m"),
+                                    ds.arr([x + size, y + size], "m"))
+            else:
+                dobj = ds.polygon(Point(x, y).buffer(size))
+            return dobj[field].d, dobj["index", "x"].d
+
+        expected = [run(query) for query in queries]
+        for _ in range(3):
+            ds.index.io.close()
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(run, queries))
+            for (ref_values, ref_x), (values, x) in zip(expected, results):
+                assert_equal(values, ref_values)
+                assert_equal(x, ref_x)
+
+    def test_thread_local_window_grid(self):
+        ds = self.ds
+        grid = ds.index.grids[0]
+        circles = [ds.circle(ds.domain_center, (r, "km")) for r in (1, 2)]
+        wgrids = {}
+        barrier = threading.Barrier(2)
+
+        def run(i):
+            wgrid = grid._get_window_grid(circles[i].selector)
+            # both threads have made their window grids
+            barrier.wait()
+            wgrids[i] = (wgrid, grid._get_window_grid(circles[i].selector))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # each thread keeps its own last window grid
+        for i in range(2):
+            assert wgrids[i][0] is wgrids[i][1]
+        assert wgrids[0][0] is not wgrids[1][0]
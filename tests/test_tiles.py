@@ -0,0 +1,144 @@
+import glob
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+import os
+import yaml
+import yt
+import yt.extensions.georaster
+
+from yt.config import ytcfg
+
+from yt_georaster.testing import make_landsat8_scene, requires_file, TempDirTest
+from yt_georaster.tiles import (
+    WEB_MERCATOR_EXTENT,
+    TileCache,
+    _get_tile_cache_key,
+    colorize,
+    get_field_on_grid,
+    tile_bounds,
+)
+
+test_data_dir = ytcfg.get("yt", "test_data_dir")
+landsat = "Landsat-8_sample_L2/LC08_L2SP_171060_20210227_20210304_02_T1_SR_B1.TIF"
+landsat_fns = glob.glob(os.path.join(test_data_dir, os.path.dirname(landsat), "*.TIF"))
+ftype = "LC08_L2SP_171060_20210227_20210304_02_T1"
+
+
+def test_tile_bounds():
+    assert_allclose(
+        tile_bounds(0, 0, 0),
+        (-WEB_MERCATOR_EXTENT, -WEB_MERCATOR_EXTENT, WEB_MERCATOR_EXTENT, WEB_MERCATOR_EXTENT),
+    )
+    assert_allclose(tile_bounds(1, 1, 0), (0, 0, WEB_MERCATOR_EXTENT, WEB_MERCATOR_EXTENT))
+
+
+def test_colorize():
+    data = np.array([[0.0, 0.5], [1.0, np.nan]])
+    image = colorize(data, cmap="gray", vmin=0, vmax=1)
+    assert_equal(image.shape, (2, 2, 4))
+    assert_equal(image.dtype, np.uint8)
+    assert_equal(image[..., 0], [[0, 128], [255, 0]])
+    assert_equal(image[..., 3], [[255, 255], [255, 0]])
+
+
+class TileCacheTest(TempDirTest):
+    def test_tile_cache(self):
+        cache = TileCache("tiles", max_bytes=250)
+        key = cache.get_key("a", 1)
+        assert cache.get(key) is None
+        cache.put(key, b"x" * 100)
+        assert_equal(cache.get(key), b"x" * 100)
+
+        for i in range(3):
+            cache.put(cache.get_key("b", i), b"y" * 100)
+        # oldest tiles are removed to stay under max_bytes
+        assert_equal(len(cache), 2)
+        assert_equal(len(TileCache("tiles")), 2)
+
+        cache.clear()
+        assert_equal(len(TileCache("tiles")), 0)
+
+
+class RenderTileTest(TempDirTest):
+    @requires_file(landsat)
+    def test_field_on_grid(self):
+        ds = yt.load(*landsat_fns)
+        params = ds.parameters
+        field = (ftype, "NDVI")
+        data = get_field_on_grid(
+            ds, field, params["crs"], params["transform"],
+            params["width"], params["height"],
+        )
+        assert_equal(str(data.units), str(ds.data[field].units))
+        # on the dataset grid, this matches reading the whole image
+        data = np.flip(data.d.T, axis=1)
+        ref = ds.data[field][:, :, 0].d
+        valid = np.isfinite(data) & np.isfinite(ref)
+        assert_allclose(data[valid], ref[valid], rtol=1e-6)
+
+    @requires_file(landsat)
+    def test_render_tile(self):
+        ds = yt.load(*landsat_fns)
+        field = (ftype, "NDVI")
+        center = ds.domain_center.d
+        z = 10
+        # find the tile containing the domain center
+        from rasterio.warp import transform
+        xs, ys = transform(ds.parameters["crs"], "EPSG:3857", [center[0]], [center[1]])
+        size = 2 * WEB_MERCATOR_EXTENT / 2 ** z
+        x = int((xs[0] + WEB_MERCATOR_EXTENT) // size)
+        y = int((WEB_MERCATOR_EXTENT - ys[0]) // size)
+
+        image = ds.render_tile(field, z, x, y, vmin=-1, vmax=1, output="rgba")
+        assert_equal(image.shape, (256, 256, 4))
+        assert (image[..., 3] > 0).any()
+
+        png = ds.render_tile(field, z, x, y, vmin=-1, vmax=1, cache="tiles")
+        assert png.startswith(b"\x89PNG")
+        assert_equal(len(TileCache("tiles")), 1)
+        assert_equal(ds.render_tile(field, z, x, y, vmin=-1, vmax=1, cache="tiles"), png)
+
+        # tiles outside the dataset are empty
+        image = ds.render_tile(field, z, 0, 0, output="rgba")
+        assert_equal(image.max(), 0)
+
+    def test_tile_cache_key(self):
+        fns = make_landsat8_scene("landsat", size=100, bands=["SR_B4", "SR_B5"])
+        field = (ftype, "NDVI")
+
+        def get_key(ds, field=field):
+            return _get_tile_cache_key(ds, field, 10, 1, 2, "viridis", -1, 1,
+                                       False, 256, "png")
+
+        key = get_key(yt.load(*fns))
+        assert_equal(get_key(yt.load(*fns)), key)
+
+        # settings and field map metadata changing values make new keys
+        fbase = os.path.splitext(os.path.basename(fns[0]))[0]
+        with open("scaling.yaml", mode="w") as f:
+            yaml.dump({fbase: {"L8_B4_30m": {"scale_factor": 2.0}}}, f)
+        keys = [
+            get_key(yt.load(*fns, mask_nodata=True)),
+            get_key(yt.load(*fns, field_map="scaling.yaml")),
+            get_key(yt.load(*fns, crs="EPSG:32637")),
+        ]
+        assert key not in keys
+        assert_equal(len(set(keys)), len(keys))
+
+        # as do derived field functions
+        ds = yt.load(*fns)
+        ds.add_field(("gas", "my_field"), function=_red_times_two,
+                     sampling_type="local", units="")
+        key = get_key(ds, ("gas", "my_field"))
+        ds = yt.load(*fns)
+        ds.add_field(("gas", "my_field"), function=_red_times_three,
+                     sampling_type="local", units="")
+        assert get_key(ds, ("gas", "my_field")) != key
+
+
+def _red_times_two(field, data):
+    return 2 * data[ftype, "red"]
+
+
+def _red_times_three(field, data):
+    return 3 * data[ftype, "red"]
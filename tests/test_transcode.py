@@ -0,0 +1,87 @@
+from concurrent.futures import ThreadPoolExecutor
+import glob
+from numpy.testing import assert_equal
+import os
+import rasterio
+import time
+import yt
+import yt.extensions.georaster
+
+from yt_georaster.testing import TempDirTest, make_sentinel2_scene
+from yt_georaster.transcode import TranscodeCache, pretranscode, transcode_file
+
+s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+
+
+class TranscodeTest(TempDirTest):
+    def setUp(self):
+        super().setUp()
+        self.fns = make_sentinel2_scene("s2", size=600, bands=["B04", "B8A"])
+
+    def test_transcode_file(self):
+        transcode_file(self.fns[0], "copy.tif", blocksize=256)
+        with rasterio.open(self.fns[0]) as src, rasterio.open("copy.tif") as dst:
+            assert_equal(dst.driver, "GTiff")
+            assert_equal(dst.block_shapes[0], (256, 256))
+            assert_equal(dst.compression.value, "DEFLATE")
+            for attr in ("crs", "transform", "nodata", "dtypes", "scales", "offsets"):
+                assert_equal(getattr(dst, attr), getattr(src, attr))
+            assert_equal(dst.read(), src.read())
+
+    def test_transcode_cache(self):
+        ref = yt.load(*self.fns)
+        cache = TranscodeCache("jp2_cache")
+        ds = yt.load(*self.fns, transcode_cache=cache)
+        field = (s2_type, "red")
+
+        # the original is read until the copy is ready
+        with ds.index.io.stats.measure() as stats:
+            ds.all_data()[field]
+        assert all(fn.endswith(".jp2") for fn in stats.files)
+        cache.wait()
+        path = cache.get_path(self.fns[0])
+        assert os.path.exists(path)
+
+        ds.index.io.close()
+        with ds.index.io.stats.measure() as stats:
+            values = ds.all_data()[field]
+        assert path in stats.files
+        assert_equal(values, ref.all_data()[field])
+
+        # changed files are transcoded again
+        st = os.stat(self.fns[0])
+        os.utime(self.fns[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert cache.get_path(self.fns[0]) != path
+        assert_equal(cache.get(self.fns[0]), self.fns[0])
+        cache.wait()
+        assert_equal(len(glob.glob("jp2_cache/*.tif")), 2)
+
+        # the least recently used copy is removed
+        os.utime(path, (0, 0))
+        removed = cache.cleanup(max_bytes=os.path.getsize(path) + 1)
+        assert_equal(removed, [path])
+
+    def test_pretranscode(self):
+        paths = pretranscode("s2", "jp2_cache", threads=2)
+        assert_equal(len(paths), 2)
+        cache = TranscodeCache("jp2_cache", background=False)
+        assert_equal(sorted(cache.get(fn) for fn in self.fns), sorted(paths))
+
+    def test_pretranscode_locked(self):
+        cache = TranscodeCache("jp2_cache", background=False)
+        cache._poll_interval = 0.05
+        path = cache.get_path(self.fns[0])
+        # another process is transcoding the first file
+        with open(f"{path}.lock", mode="w"):
+            pass
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(pretranscode, self.fns, cache)
+            time.sleep(0.5)
+            assert not future.done()
+            transcode_file(self.fns[0], "copy.tif")
+            os.replace("copy.tif", path)
+            os.remove(f"{path}.lock")
+            paths = future.result(timeout=30)
+        # the original is not reported as transcoded
+        assert_equal(paths, [path, cache.get_path(self.fns[1])])
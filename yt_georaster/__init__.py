@@ -1,5 +1,38 @@
 from yt_georaster.data_structures import GeoRasterDataset
 from yt_georaster.io import IOHandlerGeoRaster
-from yt_georaster.utilities import save_as_geotiff, get_field_as_raster_array
+# registers the histogram, quantiles, and zonal statistics derived quantities
+from yt_georaster.quantities import StreamingHistogram, TDigest
 
 __version__ = "1.0.dev0"
+
+# Everything not needed to load a dataset is imported on first use.
+_lazy_imports = {
+    "AlignedCache": "yt_georaster.aligned_cache",
+    "BlockCache": "yt_georaster.block_cache",
+    "DatasetDescriptor": "yt_georaster.descriptor",
+    "LabelCache": "yt_georaster.label_cache",
+    "MetadataIndex": "yt_georaster.metadata_index",
+    "TileCache": "yt_georaster.tiles",
+    "TranscodeCache": "yt_georaster.transcode",
+    "build_metadata_index": "yt_georaster.metadata_index",
+    "YTPolygon": "yt_georaster.polygon",
+    "get_field_as_raster_array": "yt_georaster.utilities",
+    "pretranscode": "yt_georaster.transcode",
+    "save_as_geotiff": "yt_georaster.utilities",
+    "serve_tiles": "yt_georaster.tiles",
+}
+
+
+def __getattr__(name):
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+
+    value = getattr(importlib.import_module(_lazy_imports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_imports))
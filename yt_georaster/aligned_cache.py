@@ -0,0 +1,304 @@
+import json
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import array_bounds
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+
+from yt.funcs import mylog
+
+from yt_georaster.io import _field_key
+from yt_georaster.utilities import _get_grid_record, _write_json
+
+
+class AlignedCache:
+    """
+    A file of on-disk fields reprojected onto the base image grid.
+
+    Fields from images with a different CRS or resolution than the
+    base image are reprojected every time they are read. An aligned
+    cache does this once, block by block, and writes the results to a
+    tiled GeoTIFF on the base grid. Cached fields are then read
+    without reprojection.
+
+    A json sidecar file (the cache filename plus ".json") records the
+    base grid, the resampling method, and the path, size, and
+    modification time of the image each field came from. Cached fields
+    are only used while all of these are unchanged.
+
+    Parameters
+    ----------
+    ds : GeoRasterDataset
+        The dataset.
+    filename : str
+        Path to the cache file.
+
+    Examples
+    --------
+    >>> from yt_georaster.aligned_cache import AlignedCache
+    >>> cache = AlignedCache(ds, "aligned.tif")
+    >>> cache.update([("S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE", "NDVI")])
+    """
+
+    _version = 1
+    # pixels per side of the blocks reprojected at once
+    _block_size = 2048
+    # pixels per side of the tiles in the cache file
+    _tile_size = 256
+
+    def __init__(self, ds, filename):
+        self.ds = ds
+        self.filename = filename
+        self.sidecar = f"{filename}.json"
+        self.records = {}
+        self.grid = None
+        self.load()
+
+    def __repr__(self):
+        return f"AlignedCache ({self.filename}: {len(self.records)} fields)"
+
+    def load(self):
+        """
+        Read the sidecar file, if it and the cache file exist.
+        """
+
+        self.records = {}
+        self.grid = None
+        if not (os.path.exists(self.sidecar) and os.path.exists(self.filename)):
+            return
+
+        try:
+            with open(self.sidecar, mode="r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            mylog.warning(f"Could not read aligned cache {self.sidecar}: {e}.")
+            return
+
+        if data.get("version") != self._version:
+            mylog.info(f"Ignoring outdated aligned cache {self.filename}.")
+            return
+        self.grid = data["grid"]
+        self.records = data["fields"]
+
+    def _save(self):
+        data = {"version": self._version, "grid": self.grid, "fields": self.records}
+        _write_json(self.sidecar, data)
+
+    def _get_grid_record(self):
+        """
+        Return everything about the dataset that affects cached values.
+        """
+
+        return _get_grid_record(self.ds, values=True)
+
+    def _get_source_record(self, field):
+        """
+        Return everything about a field's image that affects cached values.
+        """
+
+        read_info = self.ds.index.geo_manager.fields[field]
+        filename = os.path.abspath(read_info["filename"])
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        nodata = read_info["nodata"]
+        return {
+            "filename": filename,
+            "stat": [st.st_size, st.st_mtime_ns],
+            "band": read_info["band"],
+            "scale": read_info["scale"],
+            "offset": read_info["offset"],
+            "nodata": None if nodata is None else repr(float(nodata)),
+        }
+
+    def get_valid_fields(self):
+        """
+        Return the cached fields that are still up to date.
+        """
+
+        if self.grid != self._get_grid_record():
+            return []
+        geo_fields = self.ds.index.geo_manager.fields
+        valid = []
+        for record in self.records.values():
+            field = tuple(record["field"])
+            if field not in geo_fields:
+                continue
+            if record["source"] == self._get_source_record(field):
+                valid.append(field)
+        return valid
+
+    def get_unaligned_fields(self):
+        """
+        Return all on-disk fields from images not on the base grid.
+        """
+
+        params = self.ds.parameters
+        base_grid = (params["crs"], params["transform"], params["width"], params["height"])
+        geo_fields = self.ds.index.geo_manager.fields
+        fields = []
+        for field, read_info in geo_fields.items():
+            metadata = self.ds._get_file_metadata(read_info["filename"])
+            grid = (metadata["crs"], metadata["transform"],
+                    metadata["width"], metadata["height"])
+            if grid != base_grid:
+                fields.append(field)
+        return fields
+
+    def update(self, fields=None, compress=None, rebuild=False):
+        """
+        Build the cache if it is missing or out of date and use it
+        for reading.
+
+        Parameters
+        ----------
+        fields : optional, list of tuples
+            Fields to cache. Derived fields are replaced by the on-disk
+            fields they depend on. If not given, all on-disk fields from
+            images not on the base grid are cached.
+        compress : optional, str
+            GeoTIFF compression (e.g., "deflate" or "zstd"). By default,
+            the cache is uncompressed, which is the fastest to read.
+        rebuild : optional, bool
+            If True, build the cache even if it is up to date.
+            Default: False.
+
+        Returns
+        -------
+        fields : list of tuples
+            The cached on-disk fields.
+        """
+
+        if fields is None:
+            fields = self.get_unaligned_fields()
+        else:
+            fields = self.ds.field_info.get_disk_dependencies(fields)
+
+        valid = self.get_valid_fields()
+        if rebuild or not set(fields).issubset(valid):
+            # keep fields already cached
+            fields = valid + [field for field in fields if field not in valid]
+            self.build(fields, compress=compress)
+        else:
+            mylog.info(f"Using {len(fields)} fields from aligned cache {self.filename}.")
+        self.register()
+        return fields
+
+    def build(self, fields, compress=None):
+        """
+        Reproject on-disk fields onto the base grid and write the cache.
+
+        Any fields already in the cache are replaced.
+
+        Parameters
+        ----------
+        fields : list of tuples
+            On-disk fields to cache.
+        compress : optional, str
+            GeoTIFF compression (e.g., "deflate" or "zstd").
+        """
+
+        ds = self.ds
+        io = ds.index.io
+        params = ds.parameters
+        width = int(params["width"])
+        height = int(params["height"])
+        geo_fields = ds.index.geo_manager.fields
+
+        # stop reading from the old cache before replacing it
+        self.unregister()
+        io.close()
+
+        dtype = io._get_read_dtype([geo_fields[field] for field in fields])
+        profile = {
+            "driver": "GTiff",
+            "width": width,
+            "height": height,
+            "count": len(fields),
+            "dtype": dtype,
+            "crs": params["crs"],
+            "transform": params["transform"],
+            "nodata": np.nan,
+            "tiled": True,
+            "blockxsize": self._tile_size,
+            "blockysize": self._tile_size,
+            "BIGTIFF": "IF_SAFER",
+        }
+        if compress is not None:
+            profile.update(compress=compress, predictor=3)
+
+        mylog.info(
+            f"Writing {len(fields)} fields to aligned cache {self.filename}."
+        )
+        bs = self._block_size
+        tmpfn = f"{self.filename}.{os.getpid()}.tmp"
+        with rasterio.open(tmpfn, "w", **profile) as dst:
+            for row_off in range(0, height, bs):
+                for col_off in range(0, width, bs):
+                    window = Window(
+                        col_off, row_off,
+                        min(bs, width - col_off), min(bs, height - row_off)
+                    )
+                    data = io.read_warped(
+                        fields, params["crs"],
+                        window_transform(window, params["transform"]),
+                        window.width, window.height, decimate=False
+                    )
+                    for i, field in enumerate(fields):
+                        dst.write(data[field].astype(dtype, copy=False),
+                                  i + 1, window=window)
+        os.replace(tmpfn, self.filename)
+
+        self.grid = self._get_grid_record()
+        self.records = {
+            _field_key(field): {
+                "field": list(field),
+                "band": i + 1,
+                "dtype": dtype,
+                "source": self._get_source_record(field),
+            }
+            for i, field in enumerate(fields)
+        }
+        self._save()
+
+    def register(self):
+        """
+        Read all up to date cached fields from the cache file.
+        """
+
+        params = self.ds.parameters
+        bounds = array_bounds(params["height"], params["width"], params["transform"])
+        geo_fields = self.ds.index.geo_manager.fields
+        aligned = self.ds.index.io._aligned_fields
+        for field in self.get_valid_fields():
+            record = self.records[_field_key(field)]
+            nodata = self.ds.nodata
+            if nodata is None:
+                nodata = geo_fields[field]["nodata"]
+            if nodata is None:
+                # what is read from outside an image with no nodata value
+                nodata = 0
+            aligned[field] = {
+                "filename": self.filename,
+                "band": record["band"],
+                "dtype": record["dtype"],
+                "scale": 1.0,
+                "offset": 0.0,
+                "nodata": np.nan,
+                "fill_value": nodata,
+                "aligned": True,
+                "bounds": bounds,
+            }
+
+    def unregister(self):
+        """
+        Stop reading any fields from the cache file.
+        """
+
+        aligned = self.ds.index.io._aligned_fields
+        for field, read_info in list(aligned.items()):
+            if read_info["filename"] == self.filename:
+                del aligned[field]
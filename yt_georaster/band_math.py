@@ -0,0 +1,377 @@
+"""
+Band-math expressions compiled to blockwise vectorized kernels.
+
+
+
+"""
+
+import ast
+
+import numpy as np
+
+
+class BandMathExpression:
+    """
+    An arithmetic expression of band names compiled to a vectorized kernel.
+
+    The expression is parsed once. Common subexpressions are eliminated,
+    constant subexpressions are folded, and the result is a flat list of
+    numpy ufunc calls. Evaluation proceeds in blocks of ``block_size``
+    elements so that all temporaries stay small and are reused between
+    instructions.
+
+    Parameters
+    ----------
+    expression : str
+        An arithmetic expression, e.g., "(nir - red) / (nir + red)".
+        Names refer to fields or band aliases. Supported operators
+        are +, -, *, /, and **, as well as the functions listed in
+        ``BandMathExpression.functions``.
+    block_size : optional, int
+        The number of elements evaluated at a time.
+        Default: 65536.
+
+    Examples
+    --------
+    >>> expr = BandMathExpression("(nir - red) / (nir + red)")
+    >>> expr.variables
+    ('nir', 'red')
+    >>> ndvi = expr(nir_array, red_array)
+    """
+
+    functions = {
+        "abs": np.absolute,
+        "arctan": np.arctan,
+        "cos": np.cos,
+        "exp": np.exp,
+        "log": np.log,
+        "log10": np.log10,
+        "max": np.maximum,
+        "min": np.minimum,
+        "sin": np.sin,
+        "sqrt": np.sqrt,
+        "tan": np.tan,
+    }
+
+    _binary_ops = {
+        ast.Add: ("add", np.add),
+        ast.Sub: ("subtract", np.subtract),
+        ast.Mult: ("multiply", np.multiply),
+        ast.Div: ("divide", np.true_divide),
+        ast.Pow: ("power", np.power),
+    }
+    _unary_ops = {
+        ast.USub: ("negative", np.negative),
+        ast.UAdd: None,
+    }
+    _commutative = ("add", "multiply", "maximum", "minimum")
+
+    def __init__(self, expression, block_size=65536):
+        self.expression = expression
+        self.block_size = int(block_size)
+
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as err:
+            raise ValueError(
+                f"Could not parse band-math expression {expression!r}: {err.msg}."
+            )
+
+        self._variables = []
+        self._nodes = {}
+        self._instructions = []
+        self._result = self._compile(tree.body)
+        if self._result[0] == "reg":
+            # drop anything computed after the result
+            del self._instructions[self._result[1] + 1:]
+        self._allocate_buffers()
+
+    def __repr__(self):
+        return f"BandMathExpression({self.expression!r})"
+
+    @property
+    def variables(self):
+        """Names used in the expression, in order of first appearance."""
+        return tuple(self._variables)
+
+    @property
+    def dependencies(self):
+        """Alias for variables."""
+        return self.variables
+
+    @property
+    def num_instructions(self):
+        """Number of vectorized operations performed per block."""
+        return len(self._instructions)
+
+    def _compile(self, node):
+        """
+        Turn an ast node into an operand reference.
+
+        Operands are tuples of ("var", index), ("const", value), or
+        ("reg", index), where registers hold intermediate results.
+        """
+
+        if isinstance(node, ast.Name):
+            if node.id not in self._variables:
+                self._variables.append(node.id)
+            return ("var", self._variables.index(node.id))
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+          and not isinstance(node.value, bool):
+            return ("const", float(node.value))
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self._unary_ops:
+            operand = self._compile(node.operand)
+            op = self._unary_ops[type(node.op)]
+            if op is None:
+                return operand
+            return self._emit(*op, (operand,))
+
+        if isinstance(node, ast.BinOp) and type(node.op) in self._binary_ops:
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            name, func = self._binary_ops[type(node.op)]
+
+            # strength reduction for common powers
+            if name == "power" and right[0] == "const":
+                if right[1] == 1:
+                    return left
+                if right[1] == 2:
+                    return self._emit("square", np.square, (left,))
+                if right[1] == 0.5:
+                    return self._emit("sqrt", np.sqrt, (left,))
+            return self._emit(name, func, (left, right))
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            fname = node.func.id
+            if fname not in self.functions:
+                raise ValueError(
+                    f"Unknown function {fname!r} in band-math expression "
+                    f"{self.expression!r}. Available functions are "
+                    f"{sorted(self.functions)}."
+                )
+            if node.keywords:
+                raise ValueError(
+                    f"Keyword arguments are not supported: {self.expression!r}."
+                )
+            func = self.functions[fname]
+            if len(node.args) != func.nin:
+                raise ValueError(
+                    f"Function {fname!r} takes {func.nin} argument(s), "
+                    f"got {len(node.args)}."
+                )
+            args = tuple(self._compile(arg) for arg in node.args)
+            return self._emit(func.__name__, func, args)
+
+        raise ValueError(
+            f"Unsupported syntax in band-math expression {self.expression!r}: "
+            f"{ast.dump(node)}."
+        )
+
+    def _emit(self, name, func, args):
+        """
+        Add an instruction unless an identical one already exists.
+        """
+
+        # fold constant subexpressions
+        if all(arg[0] == "const" for arg in args):
+            return ("const", float(func(*[arg[1] for arg in args])))
+
+        key_args = args
+        if name in self._commutative:
+            key_args = tuple(sorted(args, key=repr))
+        key = (name,) + key_args
+        if key in self._nodes:
+            return self._nodes[key]
+
+        ref = ("reg", len(self._instructions))
+        self._instructions.append([func, args, ref[1]])
+        self._nodes[key] = ref
+        return ref
+
+    def _allocate_buffers(self):
+        """
+        Map registers onto as few scratch buffers as possible.
+
+        A buffer is returned to the pool after the last instruction
+        that reads from it.
+        """
+
+        last_use = {}
+        for i, (_, args, _) in enumerate(self._instructions):
+            for arg in args:
+                if arg[0] == "reg":
+                    last_use[arg[1]] = i
+
+        free = []
+        buffers = {}
+        self._num_buffers = 0
+        for i, inst in enumerate(self._instructions):
+            _, args, reg = inst
+            # a register may be read more than once by an instruction
+            for r in sorted({arg[1] for arg in args if arg[0] == "reg"}):
+                if last_use[r] == i:
+                    free.append(buffers[r])
+            if free:
+                buffers[reg] = free.pop()
+            else:
+                buffers[reg] = self._num_buffers
+                self._num_buffers += 1
+            inst[2] = buffers[reg]
+
+        self._program = [
+            (func, tuple(self._resolve_ref(arg, buffers) for arg in args), buf)
+            for func, args, buf in self._instructions
+        ]
+        self._result_ref = self._resolve_ref(self._result, buffers)
+
+    def _resolve_ref(self, ref, buffers):
+        if ref[0] == "reg":
+            return ("buf", buffers[ref[1]])
+        return ref
+
+    def __call__(self, *arrays, out=None):
+        """
+        Evaluate the expression.
+
+        Parameters
+        ----------
+        arrays : array_like
+            One array per variable, given in the order of ``variables``.
+        out : optional, array
+            Array in which to place the result.
+
+        Returns
+        -------
+        result : array
+            The evaluated expression with the shape of the inputs.
+        """
+
+        if len(arrays) != len(self._variables):
+            raise ValueError(
+                f"Expected {len(self._variables)} arrays for "
+                f"{self._variables}, got {len(arrays)}."
+            )
+        if not arrays:
+            raise ValueError(
+                f"Expression {self.expression!r} has no variables."
+            )
+
+        arrays = [np.asarray(arr, dtype=np.float64) for arr in arrays]
+        shape = np.broadcast_shapes(*[arr.shape for arr in arrays])
+        flat = [np.ascontiguousarray(np.broadcast_to(arr, shape)).reshape(-1)
+                for arr in arrays]
+        if out is None:
+            out = np.empty(shape, dtype=np.float64)
+        if out.flags.c_contiguous and out.dtype == np.float64:
+            result = out.reshape(-1)
+        else:
+            # reshaping would copy, so evaluate into a buffer and write back
+            result = np.empty(out.size, dtype=np.float64)
+        size = result.size
+
+        bsize = min(self.block_size, max(size, 1))
+        scratch = [np.empty(bsize, dtype=np.float64)
+                   for _ in range(self._num_buffers)]
+        last = len(self._program) - 1
+
+        for start in range(0, size, bsize):
+            stop = min(start + bsize, size)
+            n = stop - start
+            block = [arr[start:stop] for arr in flat]
+
+            def get(ref):
+                if ref[0] == "var":
+                    return block[ref[1]]
+                if ref[0] == "buf":
+                    return scratch[ref[1]][:n]
+                return ref[1]
+
+            for i, (func, args, buf) in enumerate(self._program):
+                dest = result[start:stop] if i == last else scratch[buf][:n]
+                func(*[get(arg) for arg in args], out=dest)
+
+            if last < 0:
+                # expression is a single variable or constant
+                result[start:stop] = get(self._result_ref)
+
+        if not np.shares_memory(result, out):
+            out[...] = result.reshape(out.shape)
+        return out
+
+
+def get_band_map(band_aliases):
+    """
+    Invert a GeoManager band alias map.
+
+    Returns a dictionary of alias name to the list of band field names
+    that provide it.
+    """
+
+    inverse = {}
+    for fname, aliases in band_aliases.items():
+        for alias in aliases:
+            inverse.setdefault(alias, []).append(fname)
+    return inverse
+
+
+def resolve_band_names(names, ftype, field_info, band_aliases):
+    """
+    Resolve expression variables to field names for a given field type.
+
+    Band aliases (e.g., "nir") are translated into the satellite band
+    (e.g., "L8_B5") through the GeoManager band aliases and then into
+    the on-disk field by following field aliases.
+
+    Returns a list of field names or None if any name cannot be resolved.
+    """
+
+    inverse = get_band_map(band_aliases)
+    resolved = []
+    for name in names:
+        candidates = [name] + inverse.get(name, [])
+        for candidate in candidates:
+            if (ftype, candidate) in field_info:
+                break
+        else:
+            return None
+        field = (ftype, candidate)
+        # follow alias chains to the field that is actually read
+        seen = set()
+        while _is_alias(field_info[field]) and field not in seen:
+            seen.add(field)
+            field = field_info[field].alias_name
+        if field[0] != ftype:
+            field = (ftype, candidate)
+        resolved.append(field[1])
+    return resolved
+
+
+
+def _is_alias(finfo):
+    try:
+        return finfo.is_alias
+    except AttributeError:
+        # older versions of yt
+        return finfo.alias_field
+
+
+def make_band_math_function(expression, ftype, fnames):
+    """
+    Create a yt field function evaluating a band-math expression.
+
+    The returned function carries the compiled ``expression`` and its
+    on-disk ``dependencies`` so they can be inspected before any data
+    is read.
+    """
+
+    dependencies = tuple((ftype, fname) for fname in fnames)
+
+    def _band_math(field, data):
+        inputs = [data[dep].d for dep in dependencies]
+        return data.ds.arr(expression(*inputs), field.units)
+
+    _band_math.expression = expression
+    _band_math.dependencies = dependencies
+    return _band_math
@@ -0,0 +1,548 @@
+"""
+Batch processing of many scenes with a local process pool.
+
+A manifest lists groups of scene files and the fields to save for
+each. Every scene is loaded in a worker process, any band math
+expressions are added, and the fields (optionally within an area of
+interest) are saved to a GeoTIFF with
+:func:`~yt_georaster.utilities.save_as_geotiff`. Progress is kept in
+a state file, so an interrupted run can be resumed and outputs that
+are up to date are skipped.
+
+An example manifest:
+
+.. code-block:: yaml
+
+   output_dir: ndvi
+   aoi: mabira_forest.shp
+   load:
+     nodata: 0
+   expressions:
+     my_NDVI: (nir - red) / (nir + red)
+   fields:
+     - my_NDVI
+     - NDWI
+   dtype: float32
+   scenes:
+     - name: T36MVE_20210315
+       files: S2/T36MVE_20210315/*.jp2
+     - name: T36MVE_20210320
+       files:
+         - S2/T36MVE_20210320/*B04.jp2
+         - S2/T36MVE_20210320/*B8A.jp2
+
+Relative paths are relative to the manifest and file names may be
+glob patterns. Fields given by name alone are saved for every field
+type that has them.
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import glob
+import hashlib
+import json
+import os
+import time
+
+from yt.funcs import mylog
+
+from yt_georaster.utilities import _write_json
+
+
+def parse_memory(value):
+    """
+    Return a number of bytes from an int or a string like "512M" or "4G".
+    """
+
+    if value is None or isinstance(value, int):
+        return value
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _get_paths(patterns, root):
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    paths = []
+    for pattern in patterns:
+        pattern = os.path.join(root, os.path.expanduser(pattern))
+        matches = sorted(glob.glob(pattern))
+        # missing files are reported when the scene is loaded
+        paths.extend(matches or [pattern])
+    return [os.path.abspath(path) for path in paths]
+
+
+def _get_file_ids(filenames):
+    ids = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            ids.append([filename, None, None])
+            continue
+        ids.append([filename, st.st_size, st.st_mtime_ns])
+    return ids
+
+
+def _get_fields(fields):
+    return [field if isinstance(field, str) else tuple(field) for field in fields]
+
+
+def read_manifest(filename):
+    """
+    Read a manifest and return its list of tasks.
+
+    Parameters
+    ----------
+    filename : str
+        Path to a yaml (or json) manifest file.
+
+    Returns
+    -------
+    tasks : list of dicts
+        One task for each scene, with the scene's files, the fields
+        and expressions, the area of interest, the load keyword
+        arguments, and the output file.
+    """
+
+    import yaml
+
+    with open(filename, mode="r") as f:
+        manifest = yaml.safe_load(f)
+
+    root = os.path.dirname(os.path.abspath(filename))
+    output_dir = os.path.join(root, manifest.get("output_dir", "."))
+    aoi = manifest.get("aoi")
+    if aoi is not None:
+        aoi = os.path.abspath(os.path.join(root, aoi))
+    fields = _get_fields(manifest.get("fields", []))
+    expressions = manifest.get("expressions", {})
+    if not fields:
+        fields = list(expressions)
+    if not fields:
+        raise ValueError(f"No fields or expressions given in {filename}.")
+
+    tasks = []
+    names = set()
+    for i, scene in enumerate(manifest.get("scenes", [])):
+        if isinstance(scene, (str, list)):
+            scene = {"files": scene}
+        name = scene.get("name", f"scene_{i:04d}")
+        if name in names:
+            raise ValueError(f"Scene name {name!r} is used more than once.")
+        names.add(name)
+        scene_aoi = scene.get("aoi", aoi)
+        if "aoi" in scene and scene_aoi is not None:
+            scene_aoi = os.path.abspath(os.path.join(root, scene_aoi))
+        tasks.append({
+            "name": name,
+            "files": _get_paths(scene["files"], root),
+            "fields": _get_fields(scene.get("fields", fields)),
+            "expressions": dict(expressions, **scene.get("expressions", {})),
+            "aoi": scene_aoi,
+            "load": dict(manifest.get("load", {}), **scene.get("load", {})),
+            "dtype": scene.get("dtype", manifest.get("dtype")),
+            "output": os.path.join(output_dir, f"{name}.tif"),
+        })
+    return tasks
+
+
+def get_task_key(task):
+    """
+    Return a hash of everything that affects the output of a task.
+
+    This includes the path, size, and modification time of each input
+    file, so a task is run again when any of its files change.
+    """
+
+    from yt_georaster.label_cache import _get_shapefile_paths
+
+    files = _get_file_ids(task["files"])
+    aoi = None
+    if task["aoi"] is not None:
+        aoi = _get_file_ids(_get_shapefile_paths(task["aoi"]))
+    record = {
+        "version": BatchState._version,
+        "files": files,
+        "aoi": aoi,
+        "fields": task["fields"],
+        "expressions": task["expressions"],
+        "load": task["load"],
+        "dtype": task["dtype"],
+        "output": task["output"],
+    }
+    text = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class BatchState:
+    """
+    The state of a batch run, kept in a json file.
+
+    The state records, for each task, whether it succeeded or failed,
+    the key of its inputs (see
+    :func:`~yt_georaster.batch.get_task_key`), and how long it took.
+    The file is replaced after every task, so it is always complete.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the state file. It will be created if needed.
+    """
+
+    _version = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tasks = {}
+        if not os.path.exists(filename):
+            return
+        try:
+            with open(filename, mode="r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            mylog.warning(f"Could not read batch state {filename}: {e}.")
+            return
+        if data.get("version") == self._version:
+            self.tasks = data["tasks"]
+
+    def __repr__(self):
+        return f"BatchState ({self.filename}: {len(self.tasks)} tasks)"
+
+    def is_done(self, task, key):
+        """
+        Return True if a task has succeeded with the same inputs and
+        its output exists.
+        """
+
+        record = self.tasks.get(task["name"])
+        return (
+            record is not None and record["status"] == "done" and
+            record["key"] == key and os.path.exists(task["output"])
+        )
+
+    def update(self, name, **record):
+        """
+        Set the record of a task and write the state file.
+        """
+
+        self.tasks[name] = record
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(dirname, exist_ok=True)
+        data = {"version": self._version, "tasks": self.tasks}
+        _write_json(self.filename, data, indent=1)
+
+
+def _init_worker(memory_limit, log_level):
+    """
+    Set the memory limit and log level of a worker process.
+    """
+
+    import yt
+
+    yt.set_log_level(log_level)
+    if memory_limit is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        mylog.warning("Memory limits are not supported on this platform.")
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _resolve_fields(ds, fields):
+    """
+    Return (field type, field name) tuples for fields given by name
+    or as tuples.
+    """
+
+    resolved = []
+    for field in fields:
+        if isinstance(field, tuple):
+            resolved.append(field)
+            continue
+        matches = [
+            (ftype, field) for ftype in ds.index.geo_manager.ftypes
+            if (ftype, field) in ds.field_info
+        ]
+        if not matches:
+            raise ValueError(f"No field type of {ds} has a field named {field!r}.")
+        resolved.extend(matches)
+    return resolved
+
+
+def run_task(task):
+    """
+    Load a scene and save its fields to the task's output file.
+
+    Returns
+    -------
+    fields : list of tuples
+        The fields saved.
+    """
+
+    import yt
+    import yt.extensions.georaster  # noqa: F401
+
+    from yt_georaster.utilities import save_as_geotiff
+
+    load_kwargs = dict(task["load"])
+    # workers share the cores, so read with a single thread by default
+    load_kwargs.setdefault("io_threads", 1)
+    ds = yt.load(*task["files"], **load_kwargs)
+    for name, expression in task["expressions"].items():
+        ds.add_band_math(name, expression)
+    fields = _resolve_fields(ds, task["fields"])
+
+    data_source = None
+    if task["aoi"] is not None:
+        data_source = ds.polygon(task["aoi"])
+
+    os.makedirs(os.path.dirname(task["output"]), exist_ok=True)
+    save_as_geotiff(
+        ds, task["output"], fields=fields, data_source=data_source,
+        dtype=task["dtype"],
+    )
+    return fields
+
+
+_worker_died = "The worker process died (e.g., from exceeding the memory limit)."
+
+
+def _run_timed_task(task):
+    """
+    Run a task and return the fields saved and the time it took.
+    """
+
+    start = time.perf_counter()
+    fields = run_task(task)
+    return fields, time.perf_counter() - start
+
+
+def _get_outcome(future, submitted):
+    """
+    Return the fields, error, and duration of a finished task.
+
+    The error is None if the task succeeded. A task whose worker died
+    returns BrokenProcessPool as its error.
+    """
+
+    try:
+        fields, duration = future.result()
+    except BrokenProcessPool:
+        return None, BrokenProcessPool, time.perf_counter() - submitted
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - submitted
+    return fields, None, duration
+
+
+def _run_tasks(tasks, workers, initargs, callback):
+    """
+    Run tasks in a process pool and call callback(task, fields, error,
+    duration) as each one finishes.
+
+    A worker that dies (e.g., killed for running out of memory) breaks
+    the whole pool, failing every task in it. Only as many tasks as
+    there are workers are submitted at a time, so the ones running
+    when a pool breaks are known. Each is run again in a pool of its
+    own, and only a task that breaks its own pool fails. The rest
+    continue in a new pool.
+    """
+
+    pending = list(tasks)
+    suspects = []
+    while pending or suspects:
+        if suspects:
+            executors = []
+            futures = {}
+            for task in suspects:
+                executor = ProcessPoolExecutor(
+                    max_workers=1, initializer=_init_worker, initargs=initargs
+                )
+                executors.append(executor)
+                futures[executor.submit(_run_timed_task, task)] = \
+                    (task, time.perf_counter())
+            suspects = []
+            for future in wait(futures).done:
+                task, submitted = futures[future]
+                fields, error, duration = _get_outcome(future, submitted)
+                if error is BrokenProcessPool:
+                    error = _worker_died
+                callback(task, fields, error, duration)
+            for executor in executors:
+                executor.shutdown()
+            continue
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=initargs
+        ) as executor:
+            running = {}
+            broken = []
+            while (pending or running) and not broken:
+                while pending and len(running) < workers:
+                    task = pending.pop(0)
+                    running[executor.submit(_run_timed_task, task)] = \
+                        (task, time.perf_counter())
+                done = wait(running, return_when=FIRST_COMPLETED).done
+                if any(isinstance(future.exception(), BrokenProcessPool)
+                       for future in done):
+                    # the other running tasks are also lost
+                    done = wait(running).done
+                for future in done:
+                    task, submitted = running.pop(future)
+                    fields, error, duration = _get_outcome(future, submitted)
+                    if error is BrokenProcessPool:
+                        broken.append((task, duration))
+                    else:
+                        callback(task, fields, error, duration)
+
+        if len(broken) == 1:
+            task, duration = broken[0]
+            callback(task, None, _worker_died, duration)
+        else:
+            suspects = [task for task, _ in broken]
+            if suspects:
+                mylog.warning(
+                    f"A worker process died while running {len(suspects)} "
+                    f"tasks. Running each of them again on its own."
+                )
+
+
+def run_batch(manifest, workers=None, memory_limit=None, state=None, force=False,
+              log_level=30):
+    """
+    Run all tasks of a manifest that are not up to date.
+
+    Scenes are processed in parallel in a pool of worker processes.
+    Tasks that succeeded with the same inputs in an earlier run (as
+    recorded in the state file) are skipped, so an interrupted or
+    partly failed run can be resumed by running it again. A failed
+    task does not stop the others.
+
+    Parameters
+    ----------
+    manifest : str
+        Path to the manifest file.
+    workers : optional, int
+        Number of worker processes. By default, the number of cores.
+    memory_limit : optional, int or str
+        Maximum memory (address space) of each worker, e.g., "4G".
+        Tasks exceeding it fail. Only supported on Unix.
+    state : optional, str
+        Path to the state file. By default, "batch_state.json" in the
+        output directory.
+    force : optional, bool
+        If True, run all tasks, even if up to date.
+        Default: False.
+    log_level : optional, int
+        Log level of yt in the worker processes.
+        Default: 30 (warnings).
+
+    Returns
+    -------
+    state : :class:`~yt_georaster.batch.BatchState`
+
+    Examples
+    --------
+    >>> from yt_georaster.batch import run_batch
+    >>> state = run_batch("manifest.yaml", workers=8, memory_limit="4G")
+    """
+
+    tasks = read_manifest(manifest)
+    if state is None:
+        if tasks:
+            output_dir = os.path.dirname(tasks[0]["output"])
+        else:
+            output_dir = os.path.dirname(os.path.abspath(manifest))
+        state = os.path.join(output_dir, "batch_state.json")
+    batch_state = BatchState(state)
+
+    keys = {task["name"]: get_task_key(task) for task in tasks}
+    to_run = [
+        task for task in tasks
+        if force or not batch_state.is_done(task, keys[task["name"]])
+    ]
+    nskipped = len(tasks) - len(to_run)
+    mylog.info(
+        f"Running {len(to_run)} of {len(tasks)} tasks ({nskipped} up to date)."
+    )
+    if not to_run:
+        return batch_state
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(int(workers), len(to_run)))
+    memory_limit = parse_memory(memory_limit)
+
+    start = time.perf_counter()
+    counts = {"done": 0, "failed": 0}
+
+    def record(task, fields, error, duration):
+        name = task["name"]
+        if error is None:
+            batch_state.update(
+                name, status="done", key=keys[name], output=task["output"],
+                fields=[list(field) for field in fields], time=duration,
+            )
+            status = "done"
+            counts["done"] += 1
+        else:
+            batch_state.update(
+                name, status="failed", key=keys[name], output=task["output"],
+                error=error, time=duration,
+            )
+            status = f"failed ({error})"
+            counts["failed"] += 1
+
+        ndone = counts["done"] + counts["failed"]
+        elapsed = time.perf_counter() - start
+        remaining = elapsed / ndone * (len(to_run) - ndone)
+        log = mylog.info if error is None else mylog.warning
+        log(
+            f"[{ndone}/{len(to_run)}] {name} {status} in {duration:.1f} s. "
+            f"Elapsed: {elapsed:.1f} s, remaining: about {remaining:.0f} s."
+        )
+
+    _run_tasks(to_run, workers, (memory_limit, log_level), record)
+
+    mylog.info(
+        f"Finished {counts['done']} tasks, {counts['failed']} failed, "
+        f"{nskipped} skipped in {time.perf_counter() - start:.1f} s."
+    )
+    return batch_state
+
+
+def main(args=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Save fields of many scenes in parallel."
+    )
+    parser.add_argument("manifest", help="Manifest yaml file.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes.")
+    parser.add_argument("--memory-limit", default=None,
+                        help="Memory limit per worker, e.g., 4G.")
+    parser.add_argument("--state", default=None, help="Batch state file.")
+    parser.add_argument("--force", action="store_true",
+                        help="Run all tasks, even if up to date.")
+    pargs = parser.parse_args(args)
+
+    state = run_batch(
+        pargs.manifest, workers=pargs.workers, memory_limit=pargs.memory_limit,
+        state=pargs.state, force=pargs.force,
+    )
+    # the state file may hold records of scenes no longer in the manifest
+    names = {task["name"] for task in read_manifest(pargs.manifest)}
+    failed = [name for name, record in state.tasks.items()
+              if name in names and record["status"] == "failed"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from yt.funcs import mylog
+
+
+class BlockCache:
+    """
+    An on-disk cache of decoded and reprojected blocks of image data.
+
+    Blocks are stored in an sqlite database, so one cache can be
+    used by many processes (e.g., web server or task queue workers)
+    at once. Each block is the decoded data for one band of one file
+    in one block of the file's internal tiling, before reprojection,
+    so queries with different windows or target grids share blocks.
+    Reads at reduced resolution are instead stored whole, per read
+    window and target grid, and are only used by identical queries.
+    Blocks are keyed by the path, size, and modification time of the
+    file, so changed files are read again.
+
+    When the total size of stored blocks exceeds max_bytes, the least
+    recently used blocks are removed. Blocks not used for more than
+    max_age seconds are also removed.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the database file. It will be created if needed.
+    max_bytes : optional, int
+        Maximum total size of stored (compressed) blocks in bytes.
+        Default: 1 GB.
+    max_age : optional, float
+        Maximum time in seconds since a block was last used. If None,
+        blocks are only removed to stay within max_bytes.
+        Default: None.
+    compress : optional, bool
+        Whether to compress blocks with zlib.
+        Default: True.
+
+    Examples
+    --------
+    >>> import glob
+    >>> from yt_georaster import BlockCache
+    >>> fns = glob.glob("M2_Sentinel-2_test_data/*.jp2")
+    >>> ds = yt.load(*fns, block_cache="/tmp/blocks.sqlite")
+    >>> # or, with a size limit
+    >>> cache = BlockCache("/tmp/blocks.sqlite", max_bytes=4 * 1024**3)
+    >>> ds = yt.load(*fns, block_cache=cache)
+    """
+
+    # seconds to wait for other processes writing to the database
+    _timeout = 60
+    # minimum seconds between updates of a block's last use time
+    _touch_interval = 60
+
+    def __init__(self, filename, max_bytes=1024 ** 3, max_age=None, compress=True):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self._local = threading.local()
+        dirname = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(dirname, exist_ok=True)
+        self._create_tables()
+
+    def __repr__(self):
+        return f"BlockCache ({self.filename}: {len(self)} blocks)"
+
+    def _create_tables(self):
+        con = self._connect()
+        # serialize with other processes creating the same cache
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # size and accessed come before the data so they can be
+            # read without reading through the data
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS blocks ("
+                "key TEXT PRIMARY KEY, dtype TEXT, shape TEXT, compressed INTEGER, "
+                "size INTEGER, accessed REAL, data BLOB)"
+            )
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS blocks_accessed ON blocks (accessed)"
+            )
+            # the total size of all blocks, kept up to date by triggers
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)"
+            )
+            if con.execute("SELECT COUNT(*) FROM stats").fetchone()[0] == 0:
+                con.execute(
+                    "INSERT INTO stats SELECT 0, COALESCE(SUM(size), 0) FROM blocks"
+                )
+            con.execute(
+                "CREATE TRIGGER IF NOT EXISTS blocks_insert AFTER INSERT ON blocks "
+                "BEGIN UPDATE stats SET size = size + new.size; END"
+            )
+            con.execute(
+                "CREATE TRIGGER IF NOT EXISTS blocks_delete AFTER DELETE ON blocks "
+                "BEGIN UPDATE stats SET size = size - old.size; END"
+            )
+            con.execute(
+                "CREATE TRIGGER IF NOT EXISTS blocks_update AFTER UPDATE OF size "
+                "ON blocks BEGIN UPDATE stats SET size = size - old.size + new.size; "
+                "END"
+            )
+        except BaseException:
+            con.rollback()
+            raise
+        con.commit()
+
+    def __reduce__(self):
+        # connections are not picklable
+        return (
+            self.__class__,
+            (self.filename, self.max_bytes, self.max_age, self.compress),
+        )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    @property
+    def nbytes(self):
+        """
+        The total size of stored blocks in bytes.
+        """
+
+        return self._get_size(self._connect())
+
+    def _get_size(self, con):
+        return con.execute("SELECT size FROM stats").fetchone()[0]
+
+    def _connect(self):
+        """
+        Return a connection for this thread and process.
+        """
+
+        con = getattr(self._local, "con", None)
+        # connections cannot be used by forked processes
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.filename, timeout=self._timeout)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    @staticmethod
+    def get_key(*args):
+        """
+        Return a cache key for a set of json-serializable arguments.
+        """
+
+        text = json.dumps(args, sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    @staticmethod
+    def get_file_id(filename):
+        """
+        Return the path, size, and modification time of a file.
+        """
+
+        st = os.stat(filename)
+        return (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+
+    def get(self, key):
+        """
+        Return the cached array for a key, or None.
+        """
+
+        con = self._connect()
+        try:
+            row = con.execute(
+                "SELECT dtype, shape, compressed, data, accessed FROM blocks "
+                "WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            mylog.debug(f"Could not read from block cache {self.filename}: {e}.")
+            return None
+        if row is None:
+            return None
+
+        dtype, shape, compressed, data, accessed = row
+        now = time.time()
+        if now - accessed > self._touch_interval:
+            try:
+                with con:
+                    con.execute(
+                        "UPDATE blocks SET accessed = ? WHERE key = ?", (now, key)
+                    )
+            except sqlite3.Error:
+                pass
+
+        if compressed:
+            data = zlib.decompress(data)
+        arr = np.frombuffer(data, dtype=dtype).reshape(json.loads(shape))
+        # frombuffer arrays are read-only
+        return arr.copy()
+
+    def put(self, key, arr):
+        """
+        Store an array for a key and remove old blocks if needed.
+        """
+
+        arr = np.ascontiguousarray(arr)
+        data = arr.tobytes()
+        if self.compress:
+            data = zlib.compress(data, 1)
+        con = self._connect()
+        try:
+            with con:
+                # delete rather than replace, so the delete trigger fires
+                con.execute("DELETE FROM blocks WHERE key = ?", (key,))
+                con.execute(
+                    "INSERT INTO blocks (key, dtype, shape, compressed, size, "
+                    "accessed, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, arr.dtype.str, json.dumps(arr.shape), int(self.compress),
+                     len(data), time.time(), data)
+                )
+                self._evict(con)
+        except sqlite3.Error as e:
+            mylog.debug(f"Could not write to block cache {self.filename}: {e}.")
+
+    def _evict(self, con):
+        if self.max_age is not None:
+            con.execute(
+                "DELETE FROM blocks WHERE accessed < ?", (time.time() - self.max_age,)
+            )
+
+        size = self._get_size(con)
+        if size <= self.max_bytes:
+            return
+        # remove the least recently used blocks until under the limit
+        rows = con.execute("SELECT key, size FROM blocks ORDER BY accessed")
+        to_remove = []
+        for key, bsize in rows:
+            if size <= self.max_bytes:
+                break
+            to_remove.append((key,))
+            size -= bsize
+        con.executemany("DELETE FROM blocks WHERE key = ?", to_remove)
+
+    def clear(self):
+        """
+        Remove all cached blocks.
+        """
+
+        con = self._connect()
+        with con:
+            con.execute("DELETE FROM blocks")
+        con.execute("VACUUM")
+
+
+def get_block_cache(block_cache):
+    """
+    Return a BlockCache from a filename or cache, or None.
+    """
+
+    if block_cache is None or isinstance(block_cache, BlockCache):
+        return block_cache
+    return BlockCache(block_cache)
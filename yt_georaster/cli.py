@@ -0,0 +1,33 @@
+"""
+The yt-georaster command.
+"""
+import sys
+
+commands = {
+    "batch": ("yt_georaster.batch", "Save fields of many scenes in parallel."),
+    "serve": ("yt_georaster.tiles", "Serve map tiles of image files."),
+    "transcode": ("yt_georaster.transcode",
+                  "Transcode JPEG 2000 images to tiled GeoTIFF."),
+}
+
+
+def main(args=None):
+    import argparse
+    import importlib
+
+    if args is None:
+        args = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog="yt-georaster")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+    for name, (_, description) in commands.items():
+        subparsers.add_parser(name, help=description, add_help=False)
+    pargs = parser.parse_args(args[:1])
+
+    module = importlib.import_module(commands[pargs.command][0])
+    return module.main(args[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import functools
 import math
 import numpy as np
+import os
 import rasterio
 from rasterio import warp
 from rasterio.windows import from_bounds, Window
 from rasterio.crs import CRS
 import re
+import sys
+import threading
 import weakref
 
 from unyt import dimensions
@@ -14,6 +19,7 @@ from yt.data_objects.static_output import Dataset
 from yt.data_objects.selection_objects.data_selection_objects import (
     YTSelectionContainer,
 )
+from yt.config import ytcfg
 from yt.funcs import mylog
 from yt.geometry.selection_routines import (
     DiskSelector,
@@ -22,15 +28,159 @@ from yt.geometry.selection_routines import (
     SphereSelector,
 )
 from yt.frontends.ytdata.data_structures import YTGridHierarchy, YTGrid
+from yt.geometry.geometry_handler import YTDataChunk
 from yt.utilities.parallel_tools.parallel_analysis_interface import parallel_root_only
-from yt.visualization.api import SlicePlot
 
-from yt_georaster.polygon import YTPolygon, PolygonSelector
+from yt_georaster.band_math import (
+    BandMathExpression,
+    make_band_math_function,
+    resolve_band_names,
+)
 from yt_georaster.fields import GeoRasterFieldInfo
 from yt_georaster.image_types import GeoManager
+from yt_georaster.block_cache import get_block_cache
+from yt_georaster.metadata_index import get_metadata_index, read_file_metadata
+from yt_georaster.transcode import get_transcode_cache
 from yt_georaster.utilities import validate_coord_array, validate_quantity, log_level
 
 
+def _get_window_dimensions(window, pixel_scale=None):
+    """
+    Return the width and height in pixels of a window dataset.
+
+    If pixel_scale is greater than 1, the window is covered exactly by
+    a whole number of pixels that are about pixel_scale times larger.
+    """
+
+    if pixel_scale is None or pixel_scale <= 1:
+        return int(window.width), int(window.height)
+    return (
+        max(1, math.ceil(window.width / pixel_scale)),
+        max(1, math.ceil(window.height / pixel_scale)),
+    )
+
+
+def _make_polygon(*args, **kwargs):
+    """
+    Create a YTPolygon.
+
+    The polygon module (and with it fiona, shapely, and the compiled
+    selector) is only imported when the first polygon is made.
+    """
+
+    from yt_georaster.polygon import YTPolygon
+
+    return YTPolygon(*args, **kwargs)
+
+
+def _is_polygon_selector(selector):
+    """
+    Return True if selector is a PolygonSelector.
+
+    If the selector module has not been imported, no polygons exist.
+    """
+
+    module = sys.modules.get("yt_georaster.polygon_selector")
+    return module is not None and isinstance(selector, module.PolygonSelector)
+
+
+def _get_window_areas(windows):
+    """
+    Return the areas of windows given as (col_off, row_off, col_end, row_end).
+    """
+
+    return (windows[:, 2] - windows[:, 0]) * (windows[:, 3] - windows[:, 1])
+
+
+def _merge_windows(windows, factor):
+    """
+    Merge overlapping or nearby windows.
+
+    Windows are given as an array of (col_off, row_off, col_end,
+    row_end). Pairs of windows are merged, smallest increase in area
+    first, while any pair overlaps or would, once merged, cover at
+    most factor times their combined area. The returned windows do
+    not overlap.
+    """
+
+    windows = np.asarray(windows)
+    while len(windows) > 1:
+        areas = _get_window_areas(windows)
+        start = np.maximum.outer(windows[:, 0], windows[:, 0]), \
+            np.maximum.outer(windows[:, 1], windows[:, 1])
+        end = np.minimum.outer(windows[:, 2], windows[:, 2]), \
+            np.minimum.outer(windows[:, 3], windows[:, 3])
+        overlap = (end[0] > start[0]) & (end[1] > start[1])
+        merged = (
+            (np.maximum.outer(windows[:, 2], windows[:, 2]) -
+             np.minimum.outer(windows[:, 0], windows[:, 0])) *
+            (np.maximum.outer(windows[:, 3], windows[:, 3]) -
+             np.minimum.outer(windows[:, 1], windows[:, 1]))
+        )
+        combined = np.add.outer(areas, areas)
+        candidates = overlap | (merged <= factor * combined)
+        np.fill_diagonal(candidates, False)
+        if not candidates.any():
+            break
+
+        cost = np.where(candidates, merged - combined, np.inf)
+        i, j = np.unravel_index(np.argmin(cost), cost.shape)
+        new = np.concatenate([
+            np.minimum(windows[i], windows[j])[:2],
+            np.maximum(windows[i], windows[j])[2:],
+        ])
+        keep = np.ones(len(windows), dtype=bool)
+        keep[[i, j]] = False
+        windows = np.vstack([windows[keep], new])
+    return windows
+
+
+def _thread_local(name, default=None):
+    """
+    Return a property keeping a separate value for each thread.
+
+    Values are stored in a threading.local made on first use, so
+    classes whose base __init__ sets the attribute need no changes.
+    """
+
+    def get_state(obj):
+        state = obj.__dict__.get("_thread_state")
+        if state is None:
+            # setdefault is atomic, so all threads get the same object
+            state = obj.__dict__.setdefault("_thread_state", threading.local())
+        return state
+
+    def fget(obj):
+        return getattr(get_state(obj), name, default)
+
+    def fset(obj, value):
+        setattr(get_state(obj), name, value)
+
+    return property(fget, fset)
+
+
+class GeoRasterTileChunk(YTDataChunk):
+    """
+    An io chunk holding a single tile of a selection.
+
+    The number of selected pixels is only counted when first needed,
+    so processes in a parallel run only do work for their own tiles.
+    """
+
+    def __init__(self, dobj, tile, cache=True):
+        super().__init__(dobj, "io", [tile], cache=cache)
+
+    @property
+    def data_size(self):
+        if self._data_size is None:
+            self._data_size = self.objs[0].count(self.dobj.selector)
+        return self._data_size
+
+    @data_size.setter
+    def data_size(self, value):
+        self._data_size = value
+
+
 class GeoRasterWindowGrid(YTGrid):
     """
     Grid representing the bounding box around a data container.
@@ -165,10 +315,25 @@ class GeoRasterWindowGrid(YTGrid):
 class GeoRasterGrid(YTGrid):
     """
     Grid object for GeoRasterDataset representing an entire image.
+
+    The selection mask and window grid for the last selector are
+    cached separately for each thread, so several threads can query
+    the same dataset at once.
     """
 
-    _last_wgrid = None
-    _last_wgrid_id = None
+    _last_mask = _thread_local("_last_mask")
+    _last_count = _thread_local("_last_count", -1)
+    _last_selector_id = _thread_local("_last_selector_id")
+    _last_wgrid = _thread_local("_last_wgrid")
+    _last_wgrid_id = _thread_local("_last_wgrid_id")
+    # Parts of a MultiPolygon are selected in separate windows if these
+    # cover at most this fraction of the polygon's bounding box.
+    _max_window_fraction = 0.5
+    # size in pixels of the cells in which parts are first grouped
+    _window_cell_size = 512
+    # windows are merged if the merged window is at most this many
+    # times their combined area
+    _window_merge_factor = 2
 
     def select(self, selector, source, dest, offset):
         if isinstance(selector, GridSelector):
@@ -255,6 +420,109 @@ class GeoRasterGrid(YTGrid):
         self._last_wgrid_id = hash(selector)
         return wgrid
 
+    def _get_tile_grids(self, selector, tile_size):
+        """
+        Split the window around a selector into square tiles.
+
+        Returns a list of GeoRasterWindowGrids, each at most tile_size
+        pixels on a side. Tiles that cannot contain any selected pixels
+        are left out.
+        """
+
+        transform = self.ds.parameters["transform"]
+        w = self._get_trimmed_rasterio_window(
+            selector, self.ds.parameters["crs"], transform
+        )
+        if tile_size is None:
+            tile_size = self._index._get_tile_size(w.width * w.height)
+        col_end = w.col_off + w.width
+        row_end = w.row_off + w.height
+
+        tiles = []
+        for row_off in range(w.row_off, row_end, tile_size):
+            for col_off in range(w.col_off, col_end, tile_size):
+                tw = Window(
+                    col_off, row_off,
+                    min(tile_size, col_end - col_off),
+                    min(tile_size, row_end - row_off),
+                )
+                x0, y0, x1, y1 = rasterio.windows.bounds(tw, transform)
+                left_edge = [min(x0, x1), min(y0, y1), 0]
+                right_edge = [max(x0, x1), max(y0, y1), 0]
+                tiles.append(GeoRasterWindowGrid(self, left_edge, right_edge, tw))
+
+        if len(tiles) > 1:
+            left_edges = np.array([tile.LeftEdge.d for tile in tiles])
+            right_edges = np.array([tile.RightEdge.d for tile in tiles])
+            levels = np.zeros((len(tiles), 1), dtype=np.int32)
+            keep = selector.select_grids(left_edges, right_edges, levels)
+            tiles = [tile for tile, k in zip(tiles, keep) if k]
+        return tiles
+
+    def _get_polygon_window_grids(self, selector):
+        """
+        Return window grids around the clusters of parts of a polygon.
+
+        Parts of a MultiPolygon close to each other are grouped into a
+        single window. Separate windows are used if together they cover
+        much less of the image than the bounding box of the polygon.
+        Otherwise, a list of just this grid is returned.
+        """
+
+        from shapely.geometry import MultiPolygon
+
+        polygon = selector.dobj.polygon
+        if not isinstance(polygon, MultiPolygon):
+            return [self]
+
+        transform = self.ds.parameters["transform"]
+        w = from_bounds(*polygon.bounds, transform)
+        bbox = np.array([
+            math.floor(w.col_off), math.floor(w.row_off),
+            math.ceil(w.col_off + w.width), math.ceil(w.row_off + w.height),
+        ])
+        bbox_area = np.prod(bbox[2:] - bbox[:2])
+        windows = []
+        for part in polygon.geoms:
+            w = from_bounds(*part.bounds, transform)
+            # include pixels only touching the edges of the part, as the
+            # selector does, but stay within the whole polygon's window
+            windows.append((
+                math.ceil(w.col_off) - 1, math.ceil(w.row_off) - 1,
+                math.floor(w.col_off + w.width) + 1,
+                math.floor(w.row_off + w.height) + 1,
+            ))
+        windows = np.array(windows, dtype=np.int64)
+        windows[:, :2] = np.maximum(windows[:, :2], bbox[:2])
+        windows[:, 2:] = np.minimum(windows[:, 2:], bbox[2:])
+        if _get_window_areas(windows).sum() > self._max_window_fraction * bbox_area:
+            return [self]
+
+        # start from the parts in each cell of a coarse grid
+        cell = self._window_cell_size
+        cells = {}
+        for window in windows:
+            key = tuple((window[:2] + window[2:]) // 2 // cell)
+            cells.setdefault(key, []).append(window)
+        windows = np.array([
+            np.concatenate([np.min(ws, axis=0)[:2], np.max(ws, axis=0)[2:]])
+            for ws in cells.values()
+        ])
+        windows = _merge_windows(windows, self._window_merge_factor)
+        if len(windows) == 1 or \
+          _get_window_areas(windows).sum() > self._max_window_fraction * bbox_area:
+            return [self]
+
+        grids = []
+        for col_off, row_off, col_end, row_end in sorted(
+                windows.tolist(), key=lambda w: (w[1], w[0])):
+            w = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+            x0, y0, x1, y1 = rasterio.windows.bounds(w, transform)
+            left_edge = [min(x0, x1), min(y0, y1), 0]
+            right_edge = [max(x0, x1), max(y0, y1), 0]
+            grids.append(GeoRasterWindowGrid(self, left_edge, right_edge, w))
+        return grids
+
     def _get_selection_window(self, selector):
         """
         Calculate bounding box for selectors.
@@ -276,7 +544,7 @@ class GeoRasterGrid(YTGrid):
             left_edge = np.array(selector.left_edge)
             right_edge = np.array(selector.right_edge)
 
-        elif isinstance(selector, PolygonSelector):
+        elif _is_polygon_selector(selector):
             left_edge, right_edge = selector.dobj._get_bbox()
             left_edge = left_edge.d
             right_edge = right_edge.d
@@ -387,6 +655,23 @@ class GeoRasterGrid(YTGrid):
         return f"GeoRasterGrid ({ad[0]}x{ad[1]})"
 
 
+def _get_tile_size(npixels, tile_size, min_tile_size, tiles_per_process):
+    """
+    Return the tile size for a selection of a given number of pixels.
+
+    When running in parallel, tiles are made smaller to give each
+    process several of them, in multiples of the minimum tile size.
+    """
+
+    nprocs = int(ytcfg.get("yt", "internals", "global_parallel_size"))
+    if nprocs > 1:
+        target = math.sqrt(npixels / (tiles_per_process * nprocs))
+        # keep to multiples of the minimum to line up with file blocks
+        target = min_tile_size * max(1, int(target // min_tile_size))
+        tile_size = min(tile_size, target)
+    return tile_size
+
+
 class GeoRasterHierarchy(YTGridHierarchy):
     """
     Hierarchy class for GeoRasterDataset.
@@ -395,11 +680,98 @@ class GeoRasterHierarchy(YTGridHierarchy):
     """
 
     grid = GeoRasterGrid
+    # size in pixels of the square tiles used for io chunks
+    _tile_size = 2048
+    # in parallel, tiles are made smaller to give each process this
+    # many to work on, down to _min_tile_size
+    _tiles_per_process = 4
+    _min_tile_size = 256
 
     def _count_grids(self):
         self.num_grids = 1
 
+    def _get_tile_size(self, npixels):
+        """
+        Return the tile size for a selection of a given number of pixels.
+        """
+
+        return _get_tile_size(
+            npixels, self._tile_size, self._min_tile_size, self._tiles_per_process
+        )
+
+    def _identify_base_chunk(self, dobj):
+        selector = getattr(dobj, "selector", None)
+        if not _is_polygon_selector(selector) or \
+          getattr(dobj, "_grids", None) is not None:
+            return super()._identify_base_chunk(dobj)
+
+        # Disjoint parts of a polygon are selected from separate
+        # windows, so work scales with the area of the parts rather
+        # than their bounding box.
+        gi = selector.select_grids(
+            self.grid_left_edge, self.grid_right_edge, self.grid_levels
+        )
+        grids = []
+        for g in self.grids[gi]:
+            grids.extend(g._get_polygon_window_grids(selector))
+        dobj._chunk_info = np.empty(len(grids), dtype="object")
+        for i, g in enumerate(grids):
+            dobj._chunk_info[i] = g
+        if getattr(dobj, "size", None) is None:
+            dobj.size = self._count_selection(dobj)
+        if getattr(dobj, "shape", None) is None:
+            dobj.shape = (dobj.size,)
+        dobj._current_chunk = list(self._chunk_all(dobj, cache=False))[0]
+
+    def _chunk(self, dobj, chunking_style, ngz=0, **kwargs):
+        # Iterating over io chunks (as derived quantities and profiles
+        # do) goes tile by tile, so memory use is bounded and yt can
+        # divide tiles among processors. yt passes cache=False when
+        # filling a single array in chunk order (as for fields needing
+        # ghost zones), so whole selections are kept for that.
+        if chunking_style == "io" and ngz == 0 and \
+          kwargs.get("cache", True) and self._tile_size is not None:
+            return self._chunk_tiles(dobj, **kwargs)
+        return super()._chunk(dobj, chunking_style, ngz=ngz, **kwargs)
+
+    def _chunk_tiles(self, dobj, tile_size=None, cache=True, **kwargs):
+        """
+        Yield io chunks covering a data container one tile at a time.
+
+        Unlike _chunk_io, which yields the whole selection of each
+        image at once, this keeps memory use bounded by the tile size
+        for streaming calculations over large selections.
+        """
+
+        selector = dobj.selector
+        if dobj._current_chunk is None:
+            # avoid counting the whole selection up front
+            gobjs = self.grids[selector.select_grids(
+                self.grid_left_edge, self.grid_right_edge, self.grid_levels
+            )]
+        else:
+            gobjs = getattr(dobj._current_chunk, "objs", dobj._chunk_info)
+
+        for g in gobjs:
+            if isinstance(selector, GridSelector) or \
+              not isinstance(g, GeoRasterGrid):
+                tiles = [g]
+            else:
+                tiles = g._get_tile_grids(selector, tile_size)
+
+            for tile in tiles:
+                yield GeoRasterTileChunk(dobj, tile, cache=cache)
+
     def _detect_output_fields(self):
+        parent_ds = getattr(self.ds, "_parent_ds", None)
+        if parent_ds is not None:
+            # window datasets share the field registry of their parent
+            self.geo_manager = parent_ds.index.geo_manager
+            self.field_list = list(parent_ds.index.field_list)
+            self.ds.field_units = parent_ds.field_units
+            self.ds.fluid_types = parent_ds.fluid_types
+            return
+
         self.field_list = []
         self.ds.field_units = self.ds.field_units or {}
 
@@ -430,25 +802,250 @@ class GeoRasterDataset(Dataset):
     cosmological_simulation = False
     refine_by = 2
     _con_attrs = ()
+    _decimate_reads = False
+    _window_cache_size = 8
 
     def __init__(self, *args, field_map=None, crs=None, nodata=None,
-                 scale_factor=None, resample_method=warp.Resampling.nearest):
+                 scale_factor=None, resample_method=warp.Resampling.nearest,
+                 io_threads=None, mask_nodata=False, metadata_index=None,
+                 block_cache=None, transcode_cache=None):
+        if self._instantiated:
+            # a dataset reused from yt's cache keeps its added fields
+            return
         self.filename_list = args
         filename = args[0]
         self.scale_factor = scale_factor
         self.field_map = field_map
         self.crs = crs
         self.nodata = nodata
+        self.mask_nodata = mask_nodata
         self.resample_method = self._parse_resample_method(resample_method)
-        
-        
+        if io_threads is None:
+            # share the cores with other processes in parallel runs
+            nprocs = int(ytcfg.get("yt", "internals", "global_parallel_size"))
+            io_threads = min(4, max(1, (os.cpu_count() or 1) // nprocs))
+        self.io_threads = max(1, int(io_threads))
+        self.metadata_index = get_metadata_index(metadata_index)
+        if self.metadata_index is not None:
+            self._update_metadata_index()
+        self.block_cache = get_block_cache(block_cache)
+        self.transcode_cache = get_transcode_cache(transcode_cache)
+        self._file_metadata = {}
+
         super().__init__(filename, self._dataset_type, unit_system="mks")
         self.data = self.index.grids[0]
         self._added_fields = []
+        self.band_math = {}
+        self._band_math_args = []
+        self._window_datasets = OrderedDict()
+
+    def __reduce__(self):
+        from yt_georaster.descriptor import _load_dataset
+
+        return (_load_dataset, (self.descriptor(),))
+
+    def descriptor(self):
+        """
+        Return a compact, picklable description of the dataset.
+
+        The descriptor holds the files, the keyword arguments used to
+        load them, their header metadata, and any added fields. A
+        dataset made from it with its load method does not open any
+        files until data are read, so it is much cheaper than calling
+        yt.load again. Datasets are pickled this way, so they can be
+        passed to worker processes directly.
+
+        Returns
+        -------
+        descriptor : :class:`~yt_georaster.descriptor.DatasetDescriptor`
+
+        Examples
+        --------
+        >>> import pickle
+        >>> desc = ds.descriptor()
+        >>> ds2 = pickle.loads(pickle.dumps(desc)).load()
+
+        >>> from concurrent.futures import ProcessPoolExecutor
+        >>> def mean_ndvi(ds):
+        ...     return ds.all_data()[("S2", "NDVI")].mean()
+        >>> with ProcessPoolExecutor() as executor:
+        ...     means = list(executor.map(mean_ndvi, datasets))
+        """
+
+        from yt_georaster.descriptor import DatasetDescriptor
+
+        return DatasetDescriptor.from_dataset(self)
+
+    _window_lock = None
+
+    def _get_window_lock(self):
+        if self._window_lock is None:
+            self.__dict__.setdefault("_window_lock", threading.RLock())
+        return self._window_lock
 
     def add_field(self, *args, **kwargs):
         self._added_fields.append({"args": args, "kwargs": kwargs})
         super().add_field(*args, **kwargs)
+        # keep cached window datasets up to date
+        with self._get_window_lock():
+            wdss = list(getattr(self, "_window_datasets", {}).values())
+        for wds in wdss:
+            wds.add_field(*args, **kwargs)
+
+    def _get_window_dataset(self, left_edge, right_edge, window, pixel_scale=None):
+        """
+        Return a window dataset, reusing a cached one if possible.
+
+        The most recently used window datasets are kept.
+        """
+
+        dims = _get_window_dimensions(window, pixel_scale)
+        key = (tuple(window.flatten()), dims)
+        with self._get_window_lock():
+            wds = self._window_datasets.get(key)
+            if wds is not None:
+                self._window_datasets.move_to_end(key)
+                return wds
+
+            with log_level(40):
+                wds = GeoRasterWindowDataset(
+                    self, left_edge, right_edge, window, pixel_scale=pixel_scale
+                )
+            self._window_datasets[key] = wds
+            while len(self._window_datasets) > self._window_cache_size:
+                self._window_datasets.popitem(last=False)
+        return wds
+
+    def add_band_math(self, name, expression, ftype=None, units="",
+                      display_name=None, take_log=False, force_override=False):
+        """
+        Add a derived field defined by an arithmetic expression of bands.
+
+        The expression is parsed and compiled once into a vectorized
+        kernel that is evaluated blockwise. Names in the expression can
+        be field names (e.g., "L8_B5") or band aliases (e.g., "nir"),
+        which are resolved for each field type separately.
+
+        Parameters
+        ----------
+        name : str
+            The name of the new field.
+        expression : str or BandMathExpression
+            The arithmetic expression, e.g., "(nir - red) / (nir + red)".
+        ftype : optional, str or list of str
+            The field type(s) for which to create the field. If not
+            given, the field is created for all field types that
+            provide every band used in the expression.
+        units : optional, str
+            Units of the new field.
+            Default: "" (dimensionless).
+        display_name : optional, str
+            Name to be used in plots. Default: name.
+        take_log : optional, bool
+            Whether to plot the field in log scale.
+            Default: False.
+        force_override : optional, bool
+            Whether to override an existing derived field.
+            Default: False.
+
+        Returns
+        -------
+        fields : list of tuples
+            The fields that were created.
+
+        Examples
+        --------
+        >>> ds.add_band_math("my_NDVI", "(nir - red) / (nir + red)")
+        >>> rec = ds.rectangle_from_center(ds.domain_center, (1, "km"), (1, "km"))
+        >>> vals = rec["LC08_L2SP_171060_20210227_20210304_02_T1", "my_NDVI"]
+        >>> print (ds.band_math[("LC08_L2SP_171060_20210227_20210304_02_T1", "my_NDVI")].dependencies)
+        """
+
+        if isinstance(expression, BandMathExpression):
+            expr = expression
+        else:
+            expr = BandMathExpression(expression)
+
+        if ftype is None:
+            ftypes = self.index.geo_manager.ftypes
+        elif isinstance(ftype, str):
+            ftypes = [ftype]
+        else:
+            ftypes = list(ftype)
+
+        band_aliases = self.index.geo_manager.band_aliases
+        new_fields = []
+        for my_ftype in ftypes:
+            fnames = resolve_band_names(
+                expr.variables, my_ftype, self.field_info, band_aliases
+            )
+            if fnames is None:
+                if ftype is not None:
+                    raise ValueError(
+                        f"Field type {my_ftype} does not provide all of "
+                        f"{expr.variables} required by {expr.expression!r}."
+                    )
+                continue
+
+            field = (my_ftype, name)
+            function = make_band_math_function(expr, my_ftype, fnames)
+            self.add_field(
+                field,
+                function=function,
+                sampling_type="local",
+                units=units,
+                take_log=take_log,
+                display_name=display_name or name,
+                force_override=force_override,
+            )
+            self.band_math[field] = function
+            new_fields.append(field)
+
+        if new_fields:
+            # kept to make the fields again from a descriptor
+            self._band_math_args.append({
+                "name": name, "expression": expr.expression, "ftype": ftype,
+                "units": units, "display_name": display_name,
+                "take_log": take_log, "force_override": force_override,
+            })
+
+        if not new_fields:
+            mylog.warning(
+                f"No field types provide all of {expr.variables}. "
+                f"No fields created for {expr.expression!r}."
+            )
+        return new_fields
+
+    def _update_metadata_index(self):
+        """
+        Add any new or changed files to the metadata index.
+        """
+
+        mindex = self.metadata_index
+        mindex.update(self.filename_list, save=False)
+        if not mindex._modified:
+            return
+        try:
+            mindex.save()
+        except OSError as e:
+            mylog.warning(f"Could not save metadata index {mindex.filename}: {e}.")
+
+    def _get_file_metadata(self, filename):
+        """
+        Return header metadata for a file, from the index if possible.
+
+        Metadata are kept, so each file is only read once.
+        """
+
+        metadata = self._file_metadata.get(filename)
+        if metadata is not None:
+            return metadata
+        if self.metadata_index is None:
+            metadata = read_file_metadata(filename)
+        else:
+            metadata = self.metadata_index.get(filename)
+        self._file_metadata[filename] = metadata
+        return metadata
 
     @parallel_root_only
     def print_key_parameters(self):
@@ -465,13 +1062,12 @@ class GeoRasterDataset(Dataset):
 
     def _parse_parameter_file(self):
         self.num_particles = {}
-        with rasterio.open(self.parameter_filename, "r") as f:
-            for key in f.meta.keys():
-                v = f.meta[key]
-                self.parameters[key] = v
-            self.parameters["res"] = f.res
-            self.parameters["profile"] = f.profile
-            self.parameters["bounds"] = f.bounds
+        metadata = self._get_file_metadata(self.parameter_filename)
+        for key, v in metadata["meta"].items():
+            self.parameters[key] = v
+        self.parameters["res"] = metadata["res"]
+        self.parameters["profile"] = metadata["profile"]
+        self.parameters["bounds"] = metadata["bounds"]
         self.current_time = 0
 
         # overwrite crs if one is provided by user
@@ -618,13 +1214,13 @@ class GeoRasterDataset(Dataset):
 
     def _setup_classes(self):
         super()._setup_classes()
-        self.polygon = functools.partial(YTPolygon, ds=weakref.proxy(self))
+        self.polygon = functools.partial(_make_polygon, ds=weakref.proxy(self))
 
     def polygons(self, filenames, **kwargs):
         if kwargs:
-            pfunc = functools.partial(YTPolygon, ds=weakref.proxy(self), **kwargs)
+            pfunc = functools.partial(_make_polygon, ds=weakref.proxy(self), **kwargs)
         else:
-            pfunc = functools.partial(YTPolygon, ds=weakref.proxy(self))
+            pfunc = functools.partial(_make_polygon, ds=weakref.proxy(self))
         map_results = map(pfunc, filenames)
         return tuple(map_results)
 
@@ -822,7 +1418,8 @@ class GeoRasterDataset(Dataset):
         right = cc[:2] + size / 2
         return self.rectangle(left, right)
 
-    def plot(self, field, data_source=None, center=None, width=None, height=None):
+    def plot(self, field, data_source=None, center=None, width=None, height=None,
+             buff_size=800, full_resolution=False):
         """
         Create a spatial plot of a given field.
 
@@ -848,6 +1445,15 @@ class GeoRasterDataset(Dataset):
             Height of the plotted region. If no units given,
             "code_length" is assumed. If not given, either
             the height of the domain or data_source will be used.
+        buff_size : optional, int
+            Size in pixels of the plot image.
+            Default: 800.
+        full_resolution : optional, bool
+            If False, data is read at the resolution of the plot image
+            when that is coarser than the data, using overviews if the
+            files have them. If True, data is always read at full
+            resolution.
+            Default: False.
 
         Examples
         --------
@@ -893,8 +1499,18 @@ class GeoRasterDataset(Dataset):
         w = self.data._get_trimmed_rasterio_window(
             my_selector, self.parameters['crs'], self.parameters['transform']
         )
-        with log_level(40):
-            wds = GeoRasterWindowDataset(self, wleft, wright, w)
+
+        # size of a plot image pixel in data pixels
+        pixel_scale = None
+        if not full_resolution:
+            plot_extent = max(
+                width if width is not None else self.quan(wright[0] - wleft[0], "code_length"),
+                height if height is not None else self.quan(wright[1] - wleft[1], "code_length"),
+            )
+            pixel_size = plot_extent / buff_size
+            pixel_scale = float((pixel_size / self.resolution.max()).to(""))
+
+        wds = self._get_window_dataset(wleft, wright, w, pixel_scale=pixel_scale)
 
         w_data_source = wds._get_window_container(data_source)
 
@@ -907,14 +1523,170 @@ class GeoRasterDataset(Dataset):
 
         plot_width = max(width, height)
 
+        from yt.visualization.api import SlicePlot
+
         p = SlicePlot(
-            wds, "z", field, data_source=w_data_source, center=center, width=plot_width
+            wds, "z", field, data_source=w_data_source, center=center,
+            width=plot_width, buff_size=(buff_size, buff_size)
         )
         # make this an actual pointer so wds doesn't go out of scope
         p.ds = wds
 
         return p
 
+    def render_tile(self, field, z, x, y, cmap="viridis", vmin=None, vmax=None,
+                    log=False, tile_size=256, output="png", cache=None):
+        """
+        Render a web-mercator (XYZ) map tile of a field.
+
+        Data is read directly onto the tile grid, at the resolution of
+        the tile, using overviews if available. Pixels with no data are
+        transparent.
+
+        Parameters
+        ----------
+        field : tuple of (field type, field name)
+            The field to be rendered.
+        z, x, y : int
+            Zoom level and tile column and row, counted from the top
+            left.
+        cmap : optional, str or Colormap
+            The matplotlib colormap.
+            Default: "viridis".
+        vmin, vmax : optional, float
+            Values mapped to the ends of the colormap. If not given,
+            the minimum and maximum within the tile are used.
+        log : optional, bool
+            Whether to use a logarithmic color scale.
+            Default: False.
+        tile_size : optional, int
+            Width and height of the tile in pixels.
+            Default: 256.
+        output : optional, str
+            "png" to return PNG bytes or "rgba" to return a uint8
+            array of shape (tile_size, tile_size, 4).
+            Default: "png".
+        cache : optional, str or TileCache
+            A directory or :class:`~yt_georaster.tiles.TileCache` in
+            which to cache rendered PNG tiles.
+
+        Examples
+        --------
+        >>> png = ds.render_tile(("LC08_L2SP_171060_20210227_20210304_02_T1", "NDVI"),
+        ...                      12, 2428, 2040, cmap="RdYlGn", vmin=-1, vmax=1)
+        >>> with open("tile.png", "wb") as f:
+        ...     f.write(png)
+        """
+
+        from yt_georaster.tiles import render_tile
+
+        return render_tile(
+            self, field, z, x, y, cmap=cmap, vmin=vmin, vmax=vmax, log=log,
+            tile_size=tile_size, output=output, cache=cache,
+        )
+
+    def build_aligned_cache(self, fields, filename, compress=None, rebuild=False):
+        """
+        Reproject fields onto the base image grid once and read them
+        from a cache file afterward.
+
+        Fields from images with a different CRS or resolution than the
+        base image are normally reprojected every time they are read.
+        This reprojects them block by block into a tiled GeoTIFF on the
+        base grid. Cached fields are then read without reprojection.
+        The cache is kept on disk and reused if this is called again
+        with the same images, e.g., in a later session. It is rebuilt
+        if any of the images, the base grid, the resampling method, or
+        the nodata value have changed.
+
+        Parameters
+        ----------
+        fields : list of tuples
+            Fields to cache. Derived fields are replaced by the on-disk
+            fields they depend on. If None, all on-disk fields from
+            images not on the base grid are cached.
+        filename : str
+            Path to the cache file. Information needed to check the
+            cache is saved next to it, with ".json" added to the name.
+        compress : optional, str
+            GeoTIFF compression (e.g., "deflate" or "zstd"). By default,
+            the cache is uncompressed, which is the fastest to read.
+        rebuild : optional, bool
+            If True, build the cache even if it is up to date.
+            Default: False.
+
+        Returns
+        -------
+        cache : :class:`~yt_georaster.aligned_cache.AlignedCache`
+
+        Examples
+        --------
+        >>> s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+        >>> ds.build_aligned_cache([(s2_type, "NDVI"), (s2_type, "NDWI")], "aligned.tif")
+        >>> circle = ds.circle(ds.domain_center, (10, "km"))
+        >>> circle[s2_type, "NDVI"]
+        """
+
+        from yt_georaster.aligned_cache import AlignedCache
+
+        cache = AlignedCache(self, filename)
+        cache.update(fields, compress=compress, rebuild=rebuild)
+        return cache
+
+    def label_raster(self, filename, label_cache, id_field=None, all_touched=False,
+                     rebuild=False):
+        """
+        Rasterize the features of a shapefile onto the base image grid
+        once and reuse the labels afterward.
+
+        Each feature is given a label from 1 to the number of features
+        and the labels are written to a compressed GeoTIFF in the cache
+        directory. The file is named by a hash of the contents of the
+        shapefile and the base grid, so it is reused by any dataset on
+        the same grid (e.g., later scenes of the same tile) and made
+        again if the shapefile changes. The labels can be used to
+        select the pixels of single features or to calculate
+        statistics for all features at once with the
+        ``zonal_statistics`` derived quantity.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the shapefile.
+        label_cache : str or LabelCache
+            The cache directory (or cache).
+        id_field : optional, str
+            Property to use as the id of each feature. If not given,
+            features are numbered by their position in the file.
+        all_touched : optional, bool
+            If True, label all pixels touched by a feature, much as
+            polygon data containers select them. If False, label pixels
+            whose centers are inside.
+            Default: False.
+        rebuild : optional, bool
+            If True, rasterize even if cached.
+            Default: False.
+
+        Returns
+        -------
+        labels : :class:`~yt_georaster.label_cache.LabelRaster`
+
+        Examples
+        --------
+        >>> s2_type = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE"
+        >>> labels = ds.label_raster("parcels.shp", "label_cache", id_field="parcel_id")
+        >>> stats = ds.all_data().quantities.zonal_statistics((s2_type, "NDVI"), labels)
+        >>> stats["id"], stats["mean"]
+        >>> values = labels.get_feature_data(ds, "P-1234", [(s2_type, "NDVI")])
+        """
+
+        from yt_georaster.label_cache import get_label_cache
+
+        cache = get_label_cache(label_cache)
+        return cache.get(
+            self, filename, id_field=id_field, all_touched=all_touched, rebuild=rebuild
+        )
+
     @classmethod
     def _is_valid(self, *args, **kwargs):
         for fn in args:
@@ -927,38 +1699,93 @@ class GeoRasterDataset(Dataset):
             if not valid:
                 return False
 
+        mindex = get_metadata_index(kwargs.get("metadata_index"))
+
+        def get_driver(fn):
+            if mindex is not None:
+                metadata = mindex.get(fn, read=False)
+                if metadata is not None:
+                    return metadata["driver"]
             with rasterio.open(fn, "r") as f:
-                driver_type = f.meta["driver"]
-                if driver_type not in self._driver_types:
-                    return False
+                return f.meta["driver"]
+
+        # check file headers in parallel
+        io_threads = kwargs.get("io_threads")
+        if io_threads is None:
+            # share the cores with other processes in parallel runs
+            nprocs = int(ytcfg.get("yt", "internals", "global_parallel_size"))
+            io_threads = min(4, max(1, (os.cpu_count() or 1) // nprocs))
+        nthreads = min(max(1, int(io_threads)), len(args))
+        if nthreads > 1:
+            with ThreadPoolExecutor(max_workers=nthreads) as executor:
+                drivers = list(executor.map(get_driver, args))
+        else:
+            drivers = [get_driver(fn) for fn in args]
 
-        return True
+        return all(driver in self._driver_types for driver in drivers)
 
 
 class GeoRasterWindowDataset(GeoRasterDataset):
     """
     Class used for plotting a window of data from GeoRasterDataset.
+
+    If pixel_scale is greater than 1, the window is covered with pixels
+    that many times larger than those of the parent dataset and data
+    are read with decimated reads.
     """
 
     @classmethod
     def _is_valid(self, *args, **kwargs):
         return False
 
-    def __init__(self, parent_ds, left_edge, right_edge, window):
+    def __init__(self, parent_ds, left_edge, right_edge, window, pixel_scale=None):
+        # Dataset.__new__ has already called __init__ once
+        if self._instantiated:
+            return
+
         self._parent_ds = parent_ds
         self._index_class = parent_ds._index_class
         self._dataset_type = parent_ds._dataset_type
         self.domain_left_edge = parent_ds.arr(left_edge, parent_ds.parameters["units"])
         self.domain_right_edge = parent_ds.arr(right_edge, parent_ds.parameters["units"])
+
+        self._window = window
+        width, height = _get_window_dimensions(window, pixel_scale)
+        if (width, height) != (window.width, window.height):
+            self._window_scale = (window.width / width, window.height / height)
+            self._decimate_reads = True
+        else:
+            self._window_scale = None
         self.domain_dimensions = np.array(
-            [window.width, window.height, parent_ds.domain_dimensions[2]],
+            [width, height, parent_ds.domain_dimensions[2]],
             dtype=np.int32
         )
 
-        super().__init__(parent_ds.parameter_filename, field_map=parent_ds.field_map)
+        super().__init__(
+            parent_ds.parameter_filename,
+            field_map=parent_ds.field_map,
+            crs=parent_ds.crs,
+            nodata=parent_ds.nodata,
+            resample_method=parent_ds.resample_method,
+            io_threads=parent_ds.io_threads,
+            mask_nodata=parent_ds.mask_nodata,
+            metadata_index=parent_ds.metadata_index,
+            block_cache=parent_ds.block_cache,
+            transcode_cache=parent_ds.transcode_cache,
+        )
 
         for field in parent_ds._added_fields:
             self.add_field(*field["args"], **field["kwargs"])
+        self.band_math = parent_ds.band_math
+        self._band_math_args = parent_ds._band_math_args
+
+    def __reduce__(self):
+        # window datasets are made by their parent, not loaded
+        return Dataset.__reduce__(self)
+
+    def _update_metadata_index(self):
+        # the parent has already updated the index
+        pass
 
     def _parse_parameter_file(self):
         inh_attrs = (
@@ -973,6 +1800,35 @@ class GeoRasterWindowDataset(GeoRasterDataset):
             setattr(self, attr, getattr(self._parent_ds, attr, None))
 
         self.parameters = self._parent_ds.parameters.copy()
+        if self._window_scale is not None:
+            self._scale_window_parameters()
+
+    def _scale_window_parameters(self):
+        """
+        Set transform and resolution for a window with larger pixels.
+        """
+
+        parent_params = self._parent_ds.parameters
+        transform = rasterio.windows.transform(self._window, parent_params["transform"])
+        transform = transform * transform.scale(*self._window_scale)
+        width, height = self.domain_dimensions[:2]
+        res = (
+            parent_params["res"][0] * self._window_scale[0],
+            parent_params["res"][1] * self._window_scale[1],
+        )
+        self.parameters.update({
+            "transform": transform,
+            "width": int(width),
+            "height": int(height),
+            "res": res,
+        })
+        self.parameters["profile"] = parent_params["profile"].copy()
+        self.parameters["profile"].update({
+            "transform": transform,
+            "width": int(width),
+            "height": int(height),
+        })
+        self.resolution = self.arr(res, self.parameters["units"])
 
     def _get_window_container(self, dobj):
         """
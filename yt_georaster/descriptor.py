@@ -0,0 +1,138 @@
+"""
+Compact, picklable descriptions of datasets.
+
+A :class:`~yt_georaster.descriptor.DatasetDescriptor` holds everything
+needed to make a dataset again: the files, the keyword arguments used
+to load them, the header metadata already read from them, and any
+fields added since. Loading a descriptor does not open any files, so
+it is a cheap way to send a dataset to worker processes.
+"""
+import os
+
+from yt_georaster.metadata_index import MetadataIndex, _serialize
+
+
+class DatasetDescriptor:
+    """
+    Everything needed to make a GeoRasterDataset again.
+
+    Descriptors are made with
+    :meth:`~yt_georaster.data_structures.GeoRasterDataset.descriptor`
+    and are used when a dataset is pickled, e.g., when it is passed to
+    a ProcessPoolExecutor. The header metadata of each file is kept
+    with the size and modification time of the file, and files that
+    have changed are read again when the dataset is loaded.
+
+    Fields added with add_band_math are made again from their
+    expressions. Functions of fields added with add_field must be
+    picklable, i.e., defined at the top level of a module.
+
+    Attributes
+    ----------
+    filenames : tuple of str
+        Absolute paths of the files.
+    kwargs : dict
+        Keyword arguments for loading the files.
+    metadata : dict
+        Header metadata and size and modification time of each file,
+        as stored in a :class:`~yt_georaster.metadata_index.MetadataIndex`.
+    added_fields : list of dicts
+        Arguments to add_field.
+    band_math : list of dicts
+        Arguments to add_band_math.
+    aligned_caches : list of str
+        Aligned cache files to read fields from.
+
+    Examples
+    --------
+    >>> from concurrent.futures import ProcessPoolExecutor
+    >>> def mean_ndvi(ds):
+    ...     return ds.all_data()[("S2", "NDVI")].mean()
+    >>> with ProcessPoolExecutor() as executor:
+    ...     means = list(executor.map(mean_ndvi, datasets))
+    """
+
+    def __init__(self, filenames, kwargs, metadata, added_fields=None,
+                 band_math=None, aligned_caches=None):
+        self.filenames = tuple(filenames)
+        self.kwargs = kwargs
+        self.metadata = metadata
+        self.added_fields = added_fields or []
+        self.band_math = band_math or []
+        self.aligned_caches = aligned_caches or []
+
+    def __repr__(self):
+        return f"DatasetDescriptor ({len(self.filenames)} files)"
+
+    @classmethod
+    def from_dataset(cls, ds):
+        """
+        Return the descriptor of a dataset.
+        """
+
+        filenames = [os.path.abspath(fn) for fn in ds.filename_list]
+        metadata = {}
+        for fn in filenames:
+            metadata[fn] = {
+                "stat": MetadataIndex._stat(fn),
+                "metadata": _serialize(ds._get_file_metadata(fn)),
+            }
+
+        kwargs = {
+            "field_map": ds.field_map,
+            "crs": ds.crs,
+            "nodata": ds.nodata,
+            "scale_factor": ds.scale_factor,
+            "resample_method": ds.resample_method,
+            "mask_nodata": ds.mask_nodata,
+            "block_cache": ds.block_cache,
+            "transcode_cache": ds.transcode_cache,
+        }
+
+        # band math fields are made again from their expressions
+        added_fields = [
+            field for field in ds._added_fields
+            if field["args"][0] not in ds.band_math
+        ]
+        aligned_caches = sorted({
+            read_info["filename"] for read_info in ds.index.io._aligned_fields.values()
+        })
+        return cls(
+            filenames, kwargs, metadata, added_fields=added_fields,
+            band_math=list(ds._band_math_args), aligned_caches=aligned_caches,
+        )
+
+    def load(self):
+        """
+        Make the dataset.
+
+        Files are identified and their headers taken from the
+        descriptor without opening them.
+
+        Returns
+        -------
+        ds : GeoRasterDataset
+        """
+
+        from yt_georaster.aligned_cache import AlignedCache
+        from yt_georaster.data_structures import GeoRasterDataset
+
+        mindex = MetadataIndex(None)
+        mindex.records = dict(self.metadata)
+        ds = GeoRasterDataset(*self.filenames, metadata_index=mindex, **self.kwargs)
+
+        # a dataset already made from this descriptor may be reused
+        added = [field["args"][0] for field in ds._added_fields]
+        for field in self.added_fields:
+            if field["args"][0] not in added:
+                ds.add_field(*field["args"], **field["kwargs"])
+        for kwargs in self.band_math:
+            if kwargs not in ds._band_math_args:
+                ds.add_band_math(**kwargs)
+        for filename in self.aligned_caches:
+            AlignedCache(ds, filename).register()
+        return ds
+
+
+def _load_dataset(descriptor):
+    return descriptor.load()
@@ -20,6 +20,58 @@ class GeoRasterFieldInfo(FieldInfoContainer):
         self._create_satellite_aliases()
         self._setup_geo_fields()
 
+    def get_disk_dependencies(self, fields):
+        """
+        Return all on-disk fields needed to generate a list of fields.
+
+        This walks the derived field dependency graph without reading
+        any data. On-disk fields are returned in the order they are
+        first encountered.
+        """
+
+        disk_fields = self.ds.index.geo_manager.fields
+        dependencies = self.ds.field_dependencies
+
+        required = []
+        seen = set()
+        to_visit = list(fields)[::-1]
+        while to_visit:
+            field = to_visit.pop()
+            if field in seen:
+                continue
+            seen.add(field)
+
+            if field in disk_fields:
+                required.append(field)
+                continue
+            if field not in self:
+                continue
+
+            function = self[field]._function
+            if hasattr(function, "dependencies"):
+                # band-math fields know their dependencies
+                requested = function.dependencies
+            elif field in dependencies:
+                requested = dependencies[field].requested
+            else:
+                requested = self[field].get_dependencies(ds=self.ds).requested
+            to_visit.extend(sorted(requested, reverse=True))
+
+        return required
+
+    def is_rescaled(self, field):
+        """
+        Return True if any on-disk field needed for a field has a
+        scale or offset applied when it is read.
+        """
+
+        geo_fields = self.ds.index.geo_manager.fields
+        for disk_field in self.get_disk_dependencies([field]):
+            read_info = geo_fields[disk_field]
+            if read_info["scale"] != 1 or read_info["offset"] != 0:
+                return True
+        return False
+
     def _create_highres_aliases(self):
         """
         Create band aliases using the highest resolution version.
@@ -107,6 +159,9 @@ class GeoRasterFieldInfo(FieldInfoContainer):
             def _LS_temperature(field, data):
                 ftype = field.name[0]
                 thermal_infrared_1 = data[ftype, "tirs_1"]
+                # skip rescaling if it was already done on read
+                if data.ds.field_info.is_rescaled((ftype, "tirs_1")):
+                    return data.ds.arr(thermal_infrared_1.d, "K")
                 return data.ds.arr((thermal_infrared_1 * 0.00341802 + 149), "K")
 
             self.add_field(
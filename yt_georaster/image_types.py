@@ -1,7 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 import os
-import rasterio
 import re
-import yaml
 from pathlib import Path
 
 
@@ -135,6 +134,8 @@ class GeoManager:
         elif not isinstance(fns, list):
             fns = [fns]
 
+        import yaml
+
         self.field_map = {}
         for fn in fns:
             with open(fn, mode="r") as f:
@@ -157,11 +158,16 @@ class GeoManager:
                 aliases[fname] = band_aliases
         return aliases
 
-    def create_fields(self, fullpath, ftype, fprefix):
+    def create_fields(self, fullpath, ftype, fprefix, metadata=None):
         units = "m"
-        with rasterio.open(fullpath, mode="r") as f:
-            resolution = f"{int(f.res[0])}{units}"
-            count = f.count
+        if metadata is None:
+            metadata = self.index.ds._get_file_metadata(fullpath)
+        resolution = f"{int(metadata['res'][0])}{units}"
+        count = metadata["count"]
+        dtypes = metadata["dtypes"]
+        scales = metadata["scales"]
+        offsets = metadata["offsets"]
+        nodatavals = metadata["nodatavals"]
 
         if fprefix is None:
             fkey = "band"
@@ -191,29 +197,79 @@ class GeoManager:
                 fname += f"_{i}"
             entry = fmap.get(path_from_yaml, {}).get(fname)
             if entry is not None:
-                field = (entry["field_type"], entry["field_name"])
+                field = (
+                    entry.get("field_type", ftype),
+                    entry.get("field_name", fname)
+                )
                 units = entry.get("units", "")
             else:
+                entry = {}
                 field = (ftype, fname)
                 units = ""
 
-            self.fields[field] = {"filename": fullpath, "band": i}
+            # scale, offset, and nodata from the field map or file tags
+            self.fields[field] = {
+                "filename": fullpath,
+                "band": i,
+                "dtype": dtypes[i - 1],
+                "scale": float(entry.get("scale_factor", scales[i - 1])),
+                "offset": float(entry.get("add_offset", offsets[i - 1])),
+                "nodata": entry.get("nodata", nodatavals[i - 1]),
+            }
             self.index.field_list.append(field)
             self.index.ds.field_units[field] = units
             self.add_field_type(field[0])
 
-    def process_files(self, fullpaths):
-        for fn in fullpaths:
-            self.process_file(fn)
+    def identify_files(self, fullpaths):
+        """
+        Return a list of (ftype, fprefix) for each file, or None.
 
-    def process_file(self, fullpath):
-        _, filename = os.path.split(fullpath)
+        Each image type is tried in turn on all files it has not
+        already been matched to.
+        """
 
+        results = [None] * len(fullpaths)
+        remaining = list(enumerate(fullpaths))
         for imager in self.image_types:
-            res = imager.identify(filename)
+            unmatched = []
+            for i, fullpath in remaining:
+                res = imager.identify(os.path.basename(fullpath))
+                if res is None:
+                    unmatched.append((i, fullpath))
+                else:
+                    results[i] = res
+            remaining = unmatched
+        return results
+
+    def process_files(self, fullpaths):
+        """
+        Identify files and create their fields.
+
+        File headers are read in parallel, but fields are always
+        created in the order the files are given.
+        """
+
+        fullpaths = list(fullpaths)
+        identities = self.identify_files(fullpaths)
+        to_read = [
+            fullpath for fullpath, res in zip(fullpaths, identities)
+            if res is not None
+        ]
+
+        get_metadata = self.index.ds._get_file_metadata
+        nthreads = min(self.index.ds.io_threads, len(to_read))
+        if nthreads > 1:
+            with ThreadPoolExecutor(max_workers=nthreads) as executor:
+                metadata = list(executor.map(get_metadata, to_read))
+        else:
+            metadata = [get_metadata(fullpath) for fullpath in to_read]
+        metadata = dict(zip(to_read, metadata))
+
+        for fullpath, res in zip(fullpaths, identities):
             if res is None:
                 continue
-
             ftype, fprefix = res
-            self.create_fields(fullpath, ftype, fprefix)
-            break
+            self.create_fields(fullpath, ftype, fprefix, metadata=metadata[fullpath])
+
+    def process_file(self, fullpath):
+        self.process_files([fullpath])
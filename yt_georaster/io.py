@@ -1,26 +1,351 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
+import math
 import numpy as np
+import os
 import rasterio
-from rasterio.warp import reproject
+import threading
+import time
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import array_bounds
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import from_bounds, Window
 
 from yt.frontends.ytdata.io import IOHandlerYTGridHDF5
 from yt.funcs import mylog
 from yt.geometry.selection_routines import GridSelector
 
+from yt_georaster.data_structures import _is_polygon_selector
+
+
+def _field_key(field):
+    if isinstance(field, tuple):
+        return "/".join(field)
+    return str(field)
+
+
+class IOStats:
+    """
+    Counters and timers for data reads.
+
+    Statistics are kept in total, per file, and per on-disk field.
+    Times are in seconds and sizes in bytes. Timers cover opening
+    files, reading (including decoding), reprojecting, trimming and
+    flipping, and selecting data for a container.
+
+    Examples
+    --------
+    >>> stats = ds.index.io.stats
+    >>> with stats.measure() as my_stats:
+    ...     ad[("S2", "NDVI")]
+    >>> print (my_stats.to_json(indent=2))
+    """
+
+    timer_names = ("open", "read", "reproject", "trim", "select")
+    _totals = (
+        "bytes_read", "pixels_decoded", "cache_hits", "cache_misses",
+        "block_cache_hits", "block_cache_misses",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._children = []
+        self.reset()
+
+    def __repr__(self):
+        total = sum(self.times.values())
+        return (
+            f"IOStats ({len(self.files)} files, {self.bytes_read} bytes read, "
+            f"{total:.3f} s)"
+        )
+
+    def reset(self):
+        """
+        Set all counters and timers to zero.
+        """
+
+        self.times = dict.fromkeys(self.timer_names, 0.0)
+        self.bytes_read = 0
+        self.pixels_decoded = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.block_cache_hits = 0
+        self.block_cache_misses = 0
+        self.peak_buffer_bytes = 0
+        self.files = {}
+        self.fields = {}
+
+    @contextmanager
+    def measure(self):
+        """
+        Context manager recording statistics for a block of code.
+
+        Yields a new IOStats receiving everything recorded here while
+        the block runs.
+        """
+
+        stats = IOStats()
+        with self._lock:
+            self._children.append(stats)
+        try:
+            yield stats
+        finally:
+            with self._lock:
+                self._children.remove(stats)
+
+    @contextmanager
+    def timer(self, name, filename=None, field=None):
+        """
+        Context manager adding the time spent in a block to a timer.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(
+                filename=filename, field=field,
+                **{f"{name}_time": time.perf_counter() - start}
+            )
+
+    def record(self, filename=None, field=None, peak_buffer_bytes=None,
+               largest_window=None, totals=True, **counts):
+        """
+        Add to counters.
+
+        Counters named <timer>_time are added to the total for that
+        timer. Other totals are kept for bytes_read, pixels_decoded,
+        cache_hits, cache_misses, block_cache_hits, and
+        block_cache_misses. All counters are also added to
+        the entries of the given file and field. Peak values are kept
+        for peak_buffer_bytes and largest_window (width, height). If
+        totals is False, only the file and field entries are updated.
+        """
+
+        with self._lock:
+            targets = [self] + self._children
+            for stats in targets:
+                stats._record(
+                    filename, field, peak_buffer_bytes, largest_window,
+                    totals, counts
+                )
+
+    def _record(self, filename, field, peak_buffer_bytes, largest_window,
+                totals, counts):
+        if totals:
+            for name, value in counts.items():
+                timer = name[:-len("_time")]
+                if name.endswith("_time") and timer in self.times:
+                    self.times[timer] += value
+                elif name in self._totals:
+                    setattr(self, name, getattr(self, name) + value)
+            if peak_buffer_bytes is not None:
+                self.peak_buffer_bytes = max(self.peak_buffer_bytes, peak_buffer_bytes)
+
+        entries = []
+        if filename is not None:
+            entries.append(self.files.setdefault(filename, {}))
+        if field is not None:
+            entries.append(self.fields.setdefault(_field_key(field), {}))
+        for entry in entries:
+            for name, value in counts.items():
+                entry[name] = entry.get(name, 0) + value
+            if peak_buffer_bytes is not None:
+                entry["peak_buffer_bytes"] = max(
+                    entry.get("peak_buffer_bytes", 0), peak_buffer_bytes
+                )
+            if largest_window is not None:
+                old = entry.get("largest_window", [0, 0])
+                if largest_window[0] * largest_window[1] > old[0] * old[1]:
+                    entry["largest_window"] = [int(val) for val in largest_window]
+
+    def to_dict(self):
+        """
+        Return all statistics as a dictionary.
+
+        Fields are keyed by "<field type>/<field name>".
+        """
+
+        with self._lock:
+            return {
+                "times": dict(self.times),
+                "bytes_read": self.bytes_read,
+                "pixels_decoded": self.pixels_decoded,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "block_cache_hits": self.block_cache_hits,
+                "block_cache_misses": self.block_cache_misses,
+                "peak_buffer_bytes": self.peak_buffer_bytes,
+                "files": {fn: dict(entry) for fn, entry in self.files.items()},
+                "fields": {key: dict(entry) for key, entry in self.fields.items()},
+            }
+
+    def to_json(self, filename=None, **kwargs):
+        """
+        Return all statistics as a json string, optionally writing
+        it to a file.
+
+        Keyword arguments are passed to json.dumps.
+        """
+
+        text = json.dumps(self.to_dict(), **kwargs)
+        if filename is not None:
+            with open(filename, mode="w") as f:
+                f.write(text)
+        return text
+
+
+class RasterHandlePool:
+    """
+    A pool of open rasterio datasets.
+
+    Opening a file is often slower than reading a small window from it,
+    so files are kept open for reuse. Each open file is only used by
+    one thread at a time. Files opened by another process (e.g., before
+    a fork) are never reused.
+    """
+
+    def __init__(self, stats=None):
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._pid = os.getpid()
+        self.stats = stats
+
+    def __len__(self):
+        return sum(len(handles) for handles in self._handles.values())
+
+    @contextmanager
+    def open(self, filename):
+        """
+        Context manager returning an open rasterio dataset.
+        """
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._handles = {}
+                self._pid = os.getpid()
+            handles = self._handles.get(filename)
+            src = handles.pop() if handles else None
+
+        if src is None or src.closed:
+            if self.stats is None:
+                src = rasterio.open(filename, "r")
+            else:
+                with self.stats.timer("open", filename=filename):
+                    src = rasterio.open(filename, "r")
+                self.stats.record(filename=filename, opens=1)
+        try:
+            yield src
+        finally:
+            with self._lock:
+                if self._pid == os.getpid():
+                    self._handles.setdefault(filename, []).append(src)
+
+    def close(self):
+        """
+        Close all open files.
+        """
+
+        with self._lock:
+            handles = self._handles
+            self._handles = {}
+        for srcs in handles.values():
+            for src in srcs:
+                src.close()
+
 
 class IOHandlerGeoRaster(IOHandlerYTGridHDF5):
     """
     IOHandler for GeoRasterDataset.
 
     This is responsible for reading data from files.
+
+    Reads are planned before any I/O is done. All requested on-disk
+    fields are grouped by file so that each file is opened once and
+    all of its bands are read, reprojected, and trimmed in a single
+    pass. Files are read in parallel when more than one thread is
+    allowed. The results of recent window reads are kept in memory
+    (up to _selection_cache_max_bytes) so that subsequent requests for
+    the same window do not read the same bands again.
+
+    Window datasets made for plotting share the file handles, window
+    read cache, and aligned cache fields of their parent dataset.
+
+    One handler can be used by many threads at once. Open files are
+    only used by one thread at a time and the window read cache is
+    guarded by a lock. Data are read outside the lock, so threads
+    reading different windows do not wait for each other.
+
+    JPEG 2000 files are read from tiled GeoTIFF copies, once made, if
+    the dataset has a transcode cache.
+
+    Fields in an aligned cache (see
+    :func:`~yt_georaster.data_structures.GeoRasterDataset.build_aligned_cache`)
+    are read from the cache file instead of their original images.
+
+    Statistics on reads are kept in an IOStats object, available as
+    ds.index.io.stats.
     """
 
     _dataset_type = "GeoRaster"
     _base = slice(None)
     _field_dtype = "float64"
     _cache_on = False
+    _selection_cache_max_bytes = 512 * 1024 ** 2
+    # approximate size in pixels of source blocks in the block cache
+    _source_block_size = 512
+    # size in base image pixels of the blocks read for sparse polygons
+    _sparse_block_size = 256
+    # source pixels added around blocks that must be resampled
+    _sparse_block_padding = 4
+    # resampling methods usable for decimated reads
+    _decimation_methods = (
+        Resampling.nearest,
+        Resampling.bilinear,
+        Resampling.cubic,
+        Resampling.cubic_spline,
+        Resampling.lanczos,
+        Resampling.average,
+        Resampling.mode,
+        Resampling.gauss,
+    )
+    _compact_dtypes = tuple(
+        np.dtype(dtype) for dtype in
+        ("bool", "int8", "uint8", "int16", "uint16", "float16", "float32")
+    )
 
     def __init__(self, ds, *args, **kwargs):
         super(IOHandlerGeoRaster, self).__init__(ds)
+        parent_ds = getattr(ds, "_parent_ds", None)
+        if parent_ds is None:
+            self.stats = IOStats()
+            self._handle_pool = RasterHandlePool(stats=self.stats)
+            self._selection_cache = OrderedDict()
+            self._cache_lock = threading.RLock()
+            self._aligned_fields = {}
+            self.block_cache = ds.block_cache
+            self.transcode_cache = ds.transcode_cache
+        else:
+            parent_io = parent_ds.index.io
+            self.stats = parent_io.stats
+            self._handle_pool = parent_io._handle_pool
+            self._selection_cache = parent_io._selection_cache
+            self._cache_lock = parent_io._cache_lock
+            self._aligned_fields = parent_io._aligned_fields
+            self.block_cache = parent_io.block_cache
+            self.transcode_cache = parent_io.transcode_cache
+
+    def close(self):
+        """
+        Close all open files and clear the window read cache.
+        """
+
+        self._handle_pool.close()
+        with self._cache_lock:
+            self._selection_cache.clear()
 
     def _read_fluid_selection(self, chunks, selector, fields, size):
         rv = {}
@@ -30,25 +355,9 @@ class IOHandlerGeoRaster(IOHandlerYTGridHDF5):
             if not (len(chunks) == len(chunks[0].objs) == 1):
                 raise RuntimeError
 
-            g = chunks[0].objs[0]
-            if g.id in self._cached_fields:
-                gf = self._cached_fields[g.id]
-                rv.update(gf)
-            if len(rv) == len(fields):
-                return rv
-
-            for field in fields:
-                if field in rv:
-                    self._hits += 1
-                    continue
-                self._misses += 1
-
-                rv[field] = self._read_rasterio_data(selector, g, field)
-
         if size is None:
             size = sum((g.count(selector) for chunk in chunks for g in chunk.objs))
         for field in fields:
-            ftype, fname = field
             rv[field] = np.empty(int(size), dtype=self._field_dtype)
 
         ind = 0
@@ -57,111 +366,1047 @@ class IOHandlerGeoRaster(IOHandlerYTGridHDF5):
                 if g.filename is None:
                     continue
 
-                gf = self._cached_fields.get(g.id, {})
+                gf = self._read_grid_fields(selector, g, fields)
                 nd = 0
 
                 for field in fields:
-                    if field in gf:
-                        for dim in range(len(gf[field].shape), 3):
-                            gf[field] = np.expand_dims(gf[field], dim)
-
-                        nd = g.select(selector, gf[field], rv[field], ind)
-                        self._hits += 1
-                        continue
-                    self._misses += 1
-
-                    data = self._read_rasterio_data(selector, g, field)
+                    data = gf[field]
                     for dim in range(len(data.shape), 3):
                         data = np.expand_dims(data, dim)
-                    nd = g.select(selector, data, rv[field], ind)
+                    with self.stats.timer("select", field=field):
+                        nd = g.select(selector, data, rv[field], ind)
                 ind += nd
 
         return rv
 
+    def prefetch(self, selector, grid, fields):
+        """
+        Read all on-disk fields required for a list of fields in one pass.
 
-    def _read_rasterio_data(self, selector, grid, field):
+        Derived fields are expanded into their on-disk dependencies
+        before any data is read. Subsequent reads of these fields for
+        the same selection will come from memory.
         """
-        Perform rasterio read and do all transformations and resamples.
+
+        disk_fields = self.ds.field_info.get_disk_dependencies(fields)
+        self._read_grid_fields(selector, grid, disk_fields)
+        return disk_fields
+
+    def _read_grid_fields(self, selector, grid, fields):
         """
+        Return a dictionary of data for on-disk fields for a grid.
+
+        Fields are served from memory if possible. All others are
+        read in a single grouped pass.
+        """
+
+        rv = {}
+        windows = self._get_base_windows(selector, grid)
+        key = (grid.id, windows["key"])
+        with self._cache_lock:
+            if self._cache_on:
+                rv.update(
+                    {field: data
+                     for field, data in self._cached_fields.get(grid.id, {}).items()
+                     if field in fields}
+                )
+
+            cached = self._selection_cache.get(key, {})
+            if cached:
+                self._selection_cache.move_to_end(key)
+            for field in fields:
+                if field in rv:
+                    continue
+                if field in cached:
+                    rv[field] = cached[field]
+
+            to_read = [field for field in fields if field not in rv]
+            self._hits += len(fields) - len(to_read)
+            self._misses += len(to_read)
+        for field in fields:
+            if field in to_read:
+                self.stats.record(field=field, cache_misses=1)
+            else:
+                self.stats.record(field=field, cache_hits=1)
+        if not to_read:
+            return rv
+
+        new_data = self._read_planned_fields(selector, grid, to_read, windows)
+        rv.update(new_data)
+
+        with self._cache_lock:
+            self._cache_selection(key, new_data)
+
+            if self._cache_on:
+                self._cached_fields.setdefault(grid.id, {})
+                self._cached_fields[grid.id].update(new_data)
+
+        return rv
 
-        read_info = self.ds.index.geo_manager.fields[field]
-        filename = read_info["filename"]
-        band = read_info["band"]
+    def _cache_selection(self, key, new_data):
+        """
+        Keep newly read data for a window, dropping the least recently
+        used windows to stay within the byte budget.
+
+        This must be called with the cache lock held.
+        """
+
+        cache = self._selection_cache
+        max_bytes = self._selection_cache_max_bytes
+        cached = cache.setdefault(key, {})
+        cache.move_to_end(key)
+
+        def nbytes(entry):
+            return sum(data.nbytes for data in entry.values())
+
+        cache_size = sum(nbytes(entry) for entry in cache.values())
+        for field, data in new_data.items():
+            while cache_size + data.nbytes > max_bytes and len(cache) > 1:
+                _, old = cache.popitem(last=False)
+                cache_size -= nbytes(old)
+            if cache_size + data.nbytes > max_bytes:
+                break
+            cached[field] = data
+            cache_size += data.nbytes
+
+        if not cached:
+            del cache[key]
+
+    def _plan_reads(self, fields, bounds=None):
+        """
+        Group on-disk fields by the file they live in.
+
+        Returns a dictionary of filename to a list of (field, band)
+        tuples, preserving the order in which files are first needed.
+        Aligned cache files are used if they cover the bounds (in the
+        dataset CRS) of the area to be read.
+        """
+
+        plan = {}
+        for field in fields:
+            read_info = self._get_read_info(field, bounds=bounds)
+            plan.setdefault(read_info["filename"], []).append(
+                (field, read_info["band"])
+            )
+        return plan
+
+    def _open(self, filename):
+        """
+        Context manager returning an open file, or its transcoded copy
+        if available.
+        """
+
+        if self.transcode_cache is not None:
+            filename = self.transcode_cache.get(filename)
+        return self._handle_pool.open(filename)
+
+    def _get_read_info(self, field, bounds=None):
+        """
+        Return the file, band, and metadata to read an on-disk field.
+
+        Fields in an aligned cache are read from the cache file if it
+        covers the bounds to be read.
+        """
+
+        read_info = self._aligned_fields.get(field)
+        if read_info is not None and bounds is not None:
+            left, bottom, right, top = read_info["bounds"]
+            # allow for rounding in the window transforms
+            tol = 1e-6 * max(right - left, top - bottom)
+            if bounds[0] < left - tol or bounds[1] < bottom - tol or \
+              bounds[2] > right + tol or bounds[3] > top + tol:
+                read_info = None
+        if read_info is None:
+            read_info = self.ds.index.geo_manager.fields[field]
+        return read_info
+
+    def _get_band_info(self, filename, field_bands):
+        """
+        Return the read info of each band to be read from a file.
+        """
+
+        band_info = {}
+        for field, band in field_bands:
+            read_info = self._aligned_fields.get(field)
+            if read_info is None or read_info["filename"] != filename:
+                read_info = self.ds.index.geo_manager.fields[field]
+            band_info[band] = read_info
+        return band_info
+
+    def _read_planned_fields(self, selector, grid, fields, windows=None):
+        """
+        Read a list of on-disk fields, one pass per file.
+        """
+
+        if windows is None:
+            windows = self._get_base_windows(selector, grid)
+        bounds = array_bounds(windows["height"], windows["width"], windows["transform"])
+        plan = self._plan_reads(fields, bounds=bounds)
+
+        def read_group(item):
+            filename, field_bands = item
+            return self._read_rasterio_group(
+                selector, grid, filename, field_bands, windows
+            )
+
+        return self._read_groups(read_group, plan)
+
+    def _read_groups(self, read_group, plan):
+        """
+        Call read_group for each file in a read plan, in parallel if
+        allowed, and combine the results.
+        """
+
+        nthreads = min(self.ds.io_threads, len(plan))
+        if nthreads > 1:
+            with ThreadPoolExecutor(max_workers=nthreads) as executor:
+                results = list(executor.map(read_group, plan.items()))
+        else:
+            results = [read_group(item) for item in plan.items()]
+
+        rv = {}
+        for result in results:
+            rv.update(result)
+        return rv
+
+    def read_warped(self, fields, dst_crs, dst_transform, width, height,
+                    decimate=True):
+        """
+        Read on-disk fields onto an arbitrary target grid.
+
+        Only the part of each file overlapping the target is read, with
+        decimated reads if the target is lower resolution. Nodata and
+        pixels outside the files are set to NaN.
+
+        Parameters
+        ----------
+        fields : list of tuples
+            On-disk fields to read.
+        dst_crs : CRS or str
+            CRS of the target grid.
+        dst_transform : Affine
+            Transform of the target grid.
+        width, height : int
+            Dimensions of the target grid.
+        decimate : optional, bool
+            If True, read fewer pixels when the target is at least two
+            times lower resolution than a file.
+            Default: True.
+
+        Returns
+        -------
+        data : dict
+            Dictionary of field to 2D array of shape (height, width),
+            in row-major image order.
+        """
+
+        dst_crs = CRS.from_user_input(dst_crs)
+        bounds = array_bounds(height, width, dst_transform)
+        base_crs = self.ds.parameters["crs"]
+        if dst_crs != base_crs:
+            bounds = transform_bounds(dst_crs, base_crs, *bounds)
+        plan = self._plan_reads(fields, bounds=bounds)
+
+        def read_group(item):
+            filename, field_bands = item
+            return self._read_warped_group(
+                filename, field_bands, dst_crs, dst_transform, width, height,
+                decimate=decimate
+            )
+
+        return self._read_groups(read_group, plan)
+
+    def _read_warped_group(self, filename, field_bands, dst_crs, dst_transform,
+                           width, height, decimate=True):
+        """
+        Read a set of bands from one file onto a target grid.
+        """
+
+        bands = sorted(set(band for _, band in field_bands))
+        band_info = self._get_band_info(filename, field_bands)
+        read_dtype = self._get_read_dtype([band_info[band] for band in bands])
         resample_method = self.ds.resample_method
+        dst_data = np.full((len(bands), height, width), np.nan, dtype=read_dtype)
 
-        with rasterio.open(filename, "r") as src:
+        with self._open(filename) as src:
             src_crs = src.crs
-            src_transform = src.transform
-            # Round up rasterio window width and height.
-            rasterio_window = grid._get_full_rasterio_window(selector, src_crs, src_transform)
-            src_window_transform = src.window_transform(rasterio_window)
-            # Read in the band/field.
-            data = src.read(
-                band,
-                window=rasterio_window,
-                out_dtype=self._field_dtype,
-                boundless=True,
-                fill_value=self.ds.nodata
-            )
+            bounds = array_bounds(height, width, dst_transform)
+            bounds = (bounds[0], bounds[1], bounds[2], bounds[3])
+            if src_crs != dst_crs:
+                bounds = transform_bounds(dst_crs, src_crs, *bounds)
+            window = from_bounds(*bounds, src.transform)
+            scale = min(window.width / width, window.height / height)
 
-        # get target window
+            # round out to whole pixels and clip to the file
+            col_off = max(0, math.floor(window.col_off))
+            row_off = max(0, math.floor(window.row_off))
+            col_end = min(src.width, math.ceil(window.col_off + window.width))
+            row_end = min(src.height, math.ceil(window.row_off + window.height))
+            if col_end <= col_off or row_end <= row_off:
+                return {field: dst_data[bands.index(band)] for field, band in field_bands}
+
+            window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+            decimated = decimate and scale >= 2
+            # full resolution reads go through the source block cache
+            use_source_blocks = self.block_cache is not None and not decimated
+            block_keys = None
+            if not use_source_blocks:
+                block_keys = self._get_block_keys(
+                    src.name, bands, band_info, read_dtype, window.flatten(),
+                    decimate, dst_crs.to_wkt(), tuple(dst_transform)[:6],
+                    width, height
+                )
+            blocks = self._get_cached_blocks(filename, block_keys)
+            read_bands = [band for band in bands if band not in blocks]
+            if read_bands:
+                src_transform = src.window_transform(window)
+                read_kwargs = {}
+                if decimated:
+                    out_shape = (
+                        max(1, math.ceil(window.height / scale)),
+                        max(1, math.ceil(window.width / scale)),
+                    )
+                    read_kwargs["out_shape"] = (len(read_bands),) + out_shape
+                    if resample_method in self._decimation_methods:
+                        read_kwargs["resampling"] = resample_method
+                    src_transform = src_transform * src_transform.scale(
+                        window.width / out_shape[1], window.height / out_shape[0]
+                    )
+                read_field_bands = [(field, band) for field, band in field_bands
+                                    if band in read_bands]
+                with self.stats.timer("read", filename=filename):
+                    if use_source_blocks:
+                        data = self._read_source_blocks(
+                            src, filename, read_field_bands, read_dtype, False,
+                            read_bands, window
+                        )
+                    else:
+                        data = src.read(
+                            read_bands, window=window, out_dtype=read_dtype,
+                            **read_kwargs
+                        )
+                if not use_source_blocks:
+                    self._record_read(src, filename, read_field_bands, data, window)
+
+        for band, bdata in blocks.items():
+            dst_data[bands.index(band)] = bdata
+        if read_bands:
+            for i, band in enumerate(read_bands):
+                self._apply_band_metadata(data[i], band_info[band], mask_nodata=True)
+            indices = [bands.index(band) for band in read_bands]
+            new_data = dst_data[indices]
+            with self.stats.timer("reproject", filename=filename):
+                reproject(
+                    data,
+                    new_data,
+                    src_transform=src_transform,
+                    src_crs=src_crs,
+                    dst_transform=dst_transform,
+                    dst_crs=dst_crs,
+                    resampling=resample_method,
+                    src_nodata=np.nan,
+                    dst_nodata=np.nan,
+                )
+            dst_data[indices] = new_data
+            self._put_cached_blocks(block_keys, dict(zip(read_bands, new_data)))
+
+        return {field: dst_data[bands.index(band)] for field, band in field_bands}
+
+    def _get_base_windows(self, selector, grid):
+        """
+        Calculate base image windows for a selection.
+
+        These are the same for all fields and so are computed once
+        per read.
+        """
+
+        base_transform = self.ds.parameters["transform"]
+        dst_crs = self.ds.parameters["crs"]
         base_window_transform, width, height = grid._get_rasterio_window_transform(
             selector, None, full=True
         )
-        image_units = src_crs.linear_units
-        base_units = self.ds.parameters["units"]
+        full_window = grid._get_full_rasterio_window(
+            selector, dst_crs, base_transform
+        ).flatten()
+        trimmed_window = grid._get_trimmed_rasterio_window(
+            selector, dst_crs, base_transform
+        ).flatten()
+        windows = {
+            "transform": base_window_transform,
+            "width": width,
+            "height": height,
+            "full": full_window,
+            "trimmed": trimmed_window,
+        }
+        windows["blocks"] = self._get_sparse_blocks(selector, windows)
+        blocks = windows["blocks"]
+        if blocks is not None:
+            blocks = tuple(block.flatten() for block in blocks)
+        windows["key"] = (
+            tuple(base_window_transform), full_window, trimmed_window, blocks
+        )
+        return windows
+
+    def _read_rasterio_data(self, selector, grid, field):
+        """
+        Perform rasterio read and do all transformations and resamples.
+        """
+
+        return self._read_grid_fields(selector, grid, [field])[field]
+
+    def _get_read_dtype(self, read_infos):
+        """
+        Return the dtype of the buffer used for reading.
+
+        Data that can be represented exactly in single precision is
+        read into a float32 buffer to save memory and bandwidth.
+        """
+
+        for read_info in read_infos:
+            if np.dtype(read_info["dtype"]) not in self._compact_dtypes:
+                return self._field_dtype
+        return "float32"
+
+    def _apply_band_metadata(self, data, read_info, mask_nodata=None):
+        """
+        Apply scale, offset, and nodata masking in place.
+
+        If nodata masking is off, nodata pixels are left unscaled so
+        they keep their nodata value. By default, the dataset's
+        mask_nodata setting is used.
+        """
+
+        if mask_nodata is None:
+            mask_nodata = self.ds.mask_nodata
+
+        scale = read_info["scale"]
+        offset = read_info["offset"]
+        if read_info.get("aligned", False):
+            # aligned cache files store nodata as NaN
+            nodata = np.nan
+            fill_value = read_info["fill_value"]
+        else:
+            nodata = self.ds.nodata
+            if nodata is None:
+                nodata = read_info["nodata"]
+            fill_value = nodata
+        rescale = scale != 1 or offset != 0
+        refill = fill_value is not None and fill_value is not nodata
+
+        mask = None
+        if nodata is not None and (rescale or mask_nodata or refill):
+            nodata = float(nodata)
+            if np.isnan(nodata):
+                mask = np.isnan(data)
+            else:
+                mask = data == nodata
+
+        if scale != 1:
+            data *= scale
+        if offset != 0:
+            data += offset
+
+        if mask is not None:
+            data[mask] = np.nan if mask_nodata else fill_value
+
+    def _get_decimated_shape(self, rasterio_window, windows):
+        """
+        Return the shape to read a window at about the target resolution.
+
+        Returns None if the source is not at least twice the
+        resolution of the target.
+        """
+
+        scale = min(
+            rasterio_window.width / windows["width"],
+            rasterio_window.height / windows["height"],
+        )
+        if scale < 2:
+            return None
+        return (
+            max(1, math.ceil(rasterio_window.height / scale)),
+            max(1, math.ceil(rasterio_window.width / scale)),
+        )
+
+    def _read_rasterio_group(self, selector, grid, filename, field_bands, windows):
+        """
+        Read a set of bands from one file and do all transformations
+        and resamples.
+
+        For sparse polygon selections, only blocks of the window
+        touching the polygon are read.
+        """
+
+        bands = sorted(set(band for _, band in field_bands))
+        band_info = self._get_band_info(filename, field_bands)
+        read_dtype = self._get_read_dtype([band_info[band] for band in bands])
+
+        # get target window
+        base_window_transform = windows["transform"]
+        width = windows["width"]
+        height = windows["height"]
+
+        with self._open(filename) as src:
+            # Round up rasterio window width and height.
+            rasterio_window = grid._get_full_rasterio_window(
+                selector, src.crs, src.transform
+            )
+            out_shape = None
+            if self.ds._decimate_reads:
+                # Read fewer pixels if the target is lower resolution.
+                # GDAL will use overviews if available.
+                out_shape = self._get_decimated_shape(rasterio_window, windows)
+
+            blocks = windows["blocks"]
+            if blocks is None or out_shape is not None:
+                data = self._read_window_bands(
+                    src, filename, field_bands, band_info, read_dtype,
+                    rasterio_window, base_window_transform, width, height,
+                    out_shape=out_shape
+                )
+            else:
+                # pixels outside the blocks are never selected
+                data = np.full((len(bands), height, width), np.nan, dtype=read_dtype)
+                log = True
+                for block in blocks:
+                    block_transform = rasterio.windows.transform(
+                        block, base_window_transform
+                    )
+                    src_window = self._get_block_source_window(
+                        src, block_transform, block.width, block.height,
+                        rasterio_window
+                    )
+                    if src_window is None:
+                        continue
+                    row_slice, col_slice = block.toslices()
+                    data[:, row_slice, col_slice] = self._read_window_bands(
+                        src, filename, field_bands, band_info, read_dtype,
+                        src_window, block_transform, block.width, block.height,
+                        log=log
+                    )
+                    log = False
+
+        with self.stats.timer("trim", filename=filename):
+            # trim data to encompase pixels only overlapped by selector
+            full_window = windows["full"]
+            trimmed_window = windows["trimmed"]
+            col_off = trimmed_window[0] - full_window[0]
+            row_off = trimmed_window[1] - full_window[1]
+            data = data[
+                :,
+                row_off: row_off + trimmed_window[3],
+                col_off: col_off + trimmed_window[2]
+            ]
+
+            rv = {}
+            for field, band in field_bands:
+                # Transform data to correct shape.
+                fdata = data[bands.index(band)].T
+                if self.ds._flip_axes:
+                    fdata = np.flip(fdata, axis=self.ds._flip_axes)
+                rv[field] = fdata
+
+        return rv
+
+    def _read_window_bands(self, src, filename, field_bands, band_info, read_dtype,
+                           rasterio_window, dst_transform, width, height,
+                           out_shape=None, log=True):
+        """
+        Read a window of a set of bands from one file and reproject it
+        onto a target window of the base image.
+
+        Returns an array of shape (bands, height, width), with bands
+        in ascending order.
+        """
+
+        fields = [field for field, _ in field_bands]
+        bands = sorted(set(band for _, band in field_bands))
+        resample_method = self.ds.resample_method
+        mask_nodata = self.ds.mask_nodata
         dst_crs = self.ds.parameters["crs"]
 
-        # reproject to base
-        if (base_window_transform != src_window_transform) or (dst_crs != src_crs):
-            if dst_crs != src_crs:
-                mylog.info(
-                    f"Reprojecting {field}: {src_crs} "
-                    f"to {dst_crs}."
+        src_crs = src.crs
+        src_window_transform = src.window_transform(rasterio_window)
+
+        # full resolution reads go through the source block cache and
+        # only reads at reduced resolution are stored for the window
+        use_source_blocks = self.block_cache is not None and out_shape is None
+        block_keys = None
+        if not use_source_blocks:
+            block_keys = self._get_block_keys(
+                src.name, bands, band_info, read_dtype, rasterio_window.flatten(),
+                out_shape, dst_crs.to_wkt(), tuple(dst_transform)[:6],
+                width, height
+            )
+        blocks = self._get_cached_blocks(filename, block_keys)
+        read_bands = [band for band in bands if band not in blocks]
+        if read_bands:
+            read_kwargs = {}
+            if out_shape is not None:
+                read_kwargs["out_shape"] = (len(read_bands),) + out_shape
+                if resample_method in self._decimation_methods:
+                    read_kwargs["resampling"] = resample_method
+                src_window_transform = src_window_transform * src_window_transform.scale(
+                    rasterio_window.width / out_shape[1],
+                    rasterio_window.height / out_shape[0],
+                )
+            read_field_bands = [(field, band) for field, band in field_bands
+                                if band in read_bands]
+            if use_source_blocks:
+                def reader(bands, window):
+                    return self._read_source_blocks(
+                        src, filename, read_field_bands, read_dtype, mask_nodata,
+                        bands, window
+                    )
+                read_kwargs["reader"] = reader
+            # Read in all bands/fields in one go.
+            with self.stats.timer("read", filename=filename):
+                data, read_window = self._read_window(
+                    src,
+                    read_bands,
+                    rasterio_window,
+                    read_dtype,
+                    fill_value=self.ds.nodata,
+                    masked=mask_nodata,
+                    **read_kwargs
                 )
-            if src_window_transform[0] != base_window_transform[0]:
-                mylog.info(
-                    f"Resampling {field}: {src_window_transform[0]} {image_units} "
-                    f"to {base_window_transform[0]} {base_units}."
+            if read_window is not None and not use_source_blocks:
+                self._record_read(
+                    src, filename, read_field_bands, data, read_window,
+                    window=rasterio_window
                 )
 
-            reproj_data = np.zeros((height, width), dtype=data.dtype)
-            reproject(
-                data,
-                reproj_data,
-                src_transform=src_window_transform,
-                src_crs=src_crs,
-                dst_transform=base_window_transform,
-                dst_crs=dst_crs,
-                resampling=resample_method
+            if mask_nodata:
+                data = data.filled(np.nan)
+            for i, band in enumerate(read_bands):
+                self._apply_band_metadata(data[i], band_info[band])
+
+            # reproject to base
+            if (dst_transform != src_window_transform) or (dst_crs != src_crs):
+                if log:
+                    self._log_reprojection(
+                        filename, fields, src_crs, src_window_transform, dst_transform
+                    )
+                if mask_nodata:
+                    reproj_data = np.full(
+                        (len(read_bands), height, width), np.nan, dtype=data.dtype
+                    )
+                    nodata_kwargs = {"src_nodata": np.nan, "dst_nodata": np.nan}
+                else:
+                    reproj_data = np.zeros(
+                        (len(read_bands), height, width), dtype=data.dtype
+                    )
+                    nodata_kwargs = {}
+                self.stats.record(filename=filename, peak_buffer_bytes=reproj_data.nbytes)
+                with self.stats.timer("reproject", filename=filename):
+                    reproject(
+                        data,
+                        reproj_data,
+                        src_transform=src_window_transform,
+                        src_crs=src_crs,
+                        dst_transform=dst_transform,
+                        dst_crs=dst_crs,
+                        resampling=resample_method,
+                        **nodata_kwargs
+                    )
+
+                data = reproj_data
+
+            new_blocks = dict(zip(read_bands, data))
+            self._put_cached_blocks(block_keys, new_blocks)
+            blocks.update(new_blocks)
+        return np.stack([blocks[band] for band in bands])
+
+    def _get_sparse_blocks(self, selector, windows):
+        """
+        Return the blocks of a window touching a polygon selector.
+
+        The window is divided into blocks lined up with the base image
+        (and so with the internal blocks of most files), leaving out
+        those not touching the polygon. Returns None if the selector is
+        not a polygon or all blocks are needed.
+
+        Returns
+        -------
+        blocks : tuple of Windows
+            Blocks in pixels relative to the window.
+        """
+
+        if not _is_polygon_selector(selector):
+            return None
+        from shapely.geometry import box
+
+        block_size = self._sparse_block_size
+        width = windows["width"]
+        height = windows["height"]
+        if width <= block_size and height <= block_size:
+            return None
+
+        col_off, row_off = windows["full"][:2]
+        transform = windows["transform"]
+        polygon = selector.dobj.prepared_polygon
+
+        def edges(offset, size):
+            # block edges at multiples of the block size in the base image
+            start = (offset // block_size + 1) * block_size - offset
+            return [0] + list(range(start, size, block_size)) + [size]
+
+        blocks = []
+        row_edges = edges(row_off, height)
+        col_edges = edges(col_off, width)
+        for row_start, row_end in zip(row_edges[:-1], row_edges[1:]):
+            for col_start, col_end in zip(col_edges[:-1], col_edges[1:]):
+                block = Window(
+                    col_start, row_start, col_end - col_start, row_end - row_start
+                )
+                x0, y0, x1, y1 = rasterio.windows.bounds(block, transform)
+                if polygon.intersects(box(x0, y0, x1, y1)):
+                    blocks.append(block)
+
+        if len(blocks) == (len(row_edges) - 1) * (len(col_edges) - 1):
+            return None
+        return tuple(blocks)
+
+    def _get_block_source_window(self, src, transform, width, height, full_window):
+        """
+        Return the window of a file to read for a block of the base image.
+
+        If the block must be resampled, the window is padded so edge
+        pixels are resampled from the same source pixels as when the
+        whole selection is read at once. The window is clipped to the
+        window for the whole selection. Returns None if they do not
+        overlap.
+        """
+
+        dst_crs = self.ds.parameters["crs"]
+        bounds = array_bounds(height, width, transform)
+        if src.crs != dst_crs:
+            bounds = transform_bounds(dst_crs, src.crs, *bounds)
+        window = from_bounds(*bounds, src.transform)
+
+        # round out to whole pixels, allowing for rounding errors
+        tol = 1e-6
+        col_off = math.floor(window.col_off + tol)
+        row_off = math.floor(window.row_off + tol)
+        col_end = math.ceil(window.col_off + window.width - tol)
+        row_end = math.ceil(window.row_off + window.height - tol)
+        window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+        if src.crs != dst_crs or src.window_transform(window) != transform:
+            pad = self._sparse_block_padding
+            col_off -= pad
+            row_off -= pad
+            col_end += pad
+            row_end += pad
+
+        fcol_off, frow_off, fwidth, fheight = full_window.flatten()
+        col_off = max(col_off, fcol_off)
+        row_off = max(row_off, frow_off)
+        col_end = min(col_end, fcol_off + fwidth)
+        row_end = min(row_end, frow_off + fheight)
+        if col_end <= col_off or row_end <= row_off:
+            return None
+        return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+    def _read_window(self, src, bands, window, out_dtype, fill_value=None,
+                     masked=False, out_shape=None, reader=None, **kwargs):
+        """
+        Read a window that may extend beyond the edges of an image.
+
+        This gives the same result as a boundless read, but only the
+        part of the window overlapping the image is read, into a buffer
+        filled with fill_value (or the image's nodata value). Pixels
+        outside the image are masked. Boundless reads in rasterio go
+        through a VRT and are much slower, even for windows entirely
+        inside the image.
+
+        Returns
+        -------
+        data : array or masked array
+            The data for the full window.
+        read_window : Window or None
+            The part of the window inside the image, which is all that
+            is read, or None if the window does not overlap the image.
+
+        If given, reader(bands, window) is used to read windows inside
+        the image instead of src.read, e.g., to read through the block
+        cache. It is not used for resampled reads.
+        """
+
+        if out_shape is not None:
+            kwargs["out_shape"] = out_shape
+        if reader is None:
+            def reader(bands, window):
+                return src.read(
+                    bands, window=window, out_dtype=out_dtype, masked=masked,
+                    **kwargs
+                )
+        col_off, row_off, wwidth, wheight = window.flatten()
+        col_start = max(col_off, 0)
+        row_start = max(row_off, 0)
+        col_end = min(col_off + wwidth, src.width)
+        row_end = min(row_off + wheight, src.height)
+
+        # entirely inside: a plain read
+        if (col_start, row_start, col_end, row_end) == \
+           (col_off, row_off, col_off + wwidth, row_off + wheight):
+            return reader(bands, window), window
+
+        # partly inside and resampled: output pixels do not line up
+        # with the image edges, so leave it to rasterio
+        overlap = col_start < col_end and row_start < row_end
+        if overlap:
+            read_window = Window(
+                col_start, row_start, col_end - col_start, row_end - row_start
             )
+        if overlap and out_shape is not None:
+            data = src.read(
+                bands, window=window, out_dtype=out_dtype, masked=masked,
+                boundless=True, fill_value=fill_value, **kwargs
+            )
+            return data, read_window
 
-            data = reproj_data
+        if fill_value is None:
+            fill_value = src.nodata
+            if fill_value is None:
+                fill_value = 0
+        if out_shape is None:
+            out_shape = (len(bands), wheight, wwidth)
+        data = np.full(out_shape, fill_value, dtype=out_dtype)
+        if masked:
+            data = np.ma.masked_array(data, mask=True)
+        if not overlap:
+            return data, None
 
-        # trim data to encompase pixels only overlapped by selector
-        full_window = grid._get_full_rasterio_window(
-            selector,
-            dst_crs,
-            self.ds.parameters['transform']
-        ).flatten()
-        trimmed_window = grid._get_trimmed_rasterio_window(
-            selector,
-            dst_crs,
-            self.ds.parameters['transform']
-        ).flatten()
-        col_off = trimmed_window[0] - full_window[0]
-        row_off = trimmed_window[1] - full_window[1]
-        data = data[
-            row_off: row_off + trimmed_window[3],
-            col_off: col_off + trimmed_window[2]
-        ]
-        # Transform data to correct shape.
-        data = data.T
-        if self.ds._flip_axes:
-            data = np.flip(data, axis=self.ds._flip_axes)
-
-        if self._cache_on:
-            self._cached_fields.setdefault(grid.id, {})
-            self._cached_fields[grid.id][field] = data
-
-        return data
+        data[
+            :,
+            row_start - row_off: row_end - row_off,
+            col_start - col_off: col_end - col_off
+        ] = reader(bands, read_window)
+        return data, read_window
+
+    def _log_reprojection(self, filename, fields, src_crs, src_transform,
+                          dst_transform):
+        dst_crs = self.ds.parameters["crs"]
+        flabel = os.path.basename(filename) if len(fields) > 1 else fields[0]
+        if dst_crs != src_crs:
+            mylog.info(
+                f"Reprojecting {flabel}: {src_crs} "
+                f"to {dst_crs}."
+            )
+        if src_transform[0] != dst_transform[0]:
+            image_units = src_crs.linear_units
+            base_units = self.ds.parameters["units"]
+            mylog.info(
+                f"Resampling {flabel}: {src_transform[0]} {image_units} "
+                f"to {dst_transform[0]} {base_units}."
+            )
+
+    def _get_block_keys(self, filename, bands, band_info, *args):
+        """
+        Return block cache keys for bands read from a file, or None if
+        there is no block cache.
+
+        Keys depend on the file, the band and its metadata, dataset
+        settings affecting values read, and any other arguments
+        describing the read window and target grid.
+        """
+
+        if self.block_cache is None:
+            return None
+
+        cache = self.block_cache
+        common = (
+            cache.get_file_id(filename),
+            self.ds.nodata, self.ds.mask_nodata, self.ds.resample_method.name,
+        ) + args
+        keys = {}
+        for band in bands:
+            read_info = band_info[band]
+            metadata = [read_info.get(key) for key in
+                        ("scale", "offset", "nodata", "fill_value")]
+            keys[band] = cache.get_key(common, band, metadata)
+        return keys
+
+    def _get_cached_blocks(self, filename, block_keys):
+        """
+        Return a dictionary of band to data for bands in the block cache.
+        """
+
+        if block_keys is None:
+            return {}
+
+        blocks = {}
+        for band, key in block_keys.items():
+            data = self.block_cache.get(key)
+            if data is not None:
+                blocks[band] = data
+        self.stats.record(
+            filename=filename, block_cache_hits=len(blocks),
+            block_cache_misses=len(block_keys) - len(blocks),
+        )
+        return blocks
+
+    def _put_cached_blocks(self, block_keys, blocks):
+        """
+        Store newly read bands in the block cache.
+        """
+
+        if block_keys is None:
+            return
+        for band, data in blocks.items():
+            self.block_cache.put(block_keys[band], data)
+
+    def _get_source_block_shape(self, src):
+        """
+        Return the shape of the blocks of a file stored in the block cache.
+
+        Blocks line up with the internal blocks (tiles or strips) of the
+        file. Small internal blocks are grouped and very large ones
+        (e.g., untiled images) are divided, so that stored blocks are
+        about _source_block_size pixels on a side.
+        """
+
+        size = self._source_block_size
+        shape = []
+        for block, full in zip(src.block_shapes[0], (src.height, src.width)):
+            if block < size:
+                block *= math.ceil(size / block)
+            elif block > 4 * size:
+                block = size
+            shape.append(min(block, full))
+        return tuple(shape)
+
+    def _get_source_block(self, key, masked):
+        """
+        Return a block of source data from the block cache, or None.
+        """
+
+        data = self.block_cache.get(key)
+        if data is None or not masked:
+            return data
+        mask = self.block_cache.get(f"{key}-mask")
+        if mask is None:
+            return None
+        return np.ma.masked_array(data, mask=mask)
+
+    def _put_source_block(self, key, data):
+        """
+        Store a block of source data in the block cache.
+        """
+
+        if np.ma.isMaskedArray(data):
+            self.block_cache.put(f"{key}-mask", np.ma.getmaskarray(data))
+            data = data.data
+        self.block_cache.put(key, data)
+
+    def _read_source_blocks(self, src, filename, field_bands, read_dtype, masked,
+                            bands, window):
+        """
+        Read a window inside an image through the block cache.
+
+        Decoded source data (before scaling, masking, and reprojection)
+        is stored in blocks lined up with the internal blocks of the
+        file, keyed by the file, band, and block. Any query overlapping
+        a block can use it, whatever its window or target grid. Blocks
+        not in the cache are read together in a single window.
+        """
+
+        cache = self.block_cache
+        bh, bw = self._get_source_block_shape(src)
+        col_off, row_off, width, height = [int(v) for v in window.flatten()]
+        row_end = row_off + height
+        col_end = col_off + width
+        file_id = cache.get_file_id(src.name)
+
+        keys = {}
+        for i in range(row_off // bh, (row_end - 1) // bh + 1):
+            for j in range(col_off // bw, (col_end - 1) // bw + 1):
+                block = Window(j * bw, i * bh, min(bw, src.width - j * bw),
+                               min(bh, src.height - i * bh))
+                for band in bands:
+                    keys[band, i, j] = cache.get_key(
+                        file_id, band, block.flatten(), np.dtype(read_dtype).str,
+                        bool(masked)
+                    )
+
+        blocks = {}
+        for item, key in keys.items():
+            data = self._get_source_block(key, masked)
+            if data is not None:
+                blocks[item] = data
+        missing = [item for item in keys if item not in blocks]
+        self.stats.record(
+            filename=filename, block_cache_hits=len(blocks),
+            block_cache_misses=len(missing),
+        )
+
+        if missing:
+            read_bands = sorted(set(band for band, _, _ in missing))
+            i0 = min(i for _, i, _ in missing)
+            i1 = max(i for _, i, _ in missing)
+            j0 = min(j for _, _, j in missing)
+            j1 = max(j for _, _, j in missing)
+            read_window = Window(
+                j0 * bw, i0 * bh,
+                min(src.width, (j1 + 1) * bw) - j0 * bw,
+                min(src.height, (i1 + 1) * bh) - i0 * bh,
+            )
+            data = src.read(
+                read_bands, window=read_window, out_dtype=read_dtype, masked=masked
+            )
+            self._record_read(
+                src, filename,
+                [(field, band) for field, band in field_bands if band in read_bands],
+                data, read_window
+            )
+            for band, i, j in missing:
+                rows = slice(i * bh - i0 * bh, min(src.height, (i + 1) * bh) - i0 * bh)
+                cols = slice(j * bw - j0 * bw, min(src.width, (j + 1) * bw) - j0 * bw)
+                bdata = data[read_bands.index(band), rows, cols]
+                self._put_source_block(keys[band, i, j], bdata)
+                blocks[band, i, j] = bdata
+
+        out = np.empty((len(bands), height, width), dtype=read_dtype)
+        if masked:
+            out = np.ma.masked_array(out, mask=np.zeros(out.shape, dtype=bool))
+        for (band, i, j), bdata in blocks.items():
+            # the part of the block inside the window
+            r0 = max(row_off, i * bh)
+            r1 = min(row_end, i * bh + bdata.shape[0])
+            c0 = max(col_off, j * bw)
+            c1 = min(col_end, j * bw + bdata.shape[1])
+            out[bands.index(band), r0 - row_off: r1 - row_off, c0 - col_off: c1 - col_off] = \
+                bdata[r0 - i * bh: r1 - i * bh, c0 - j * bw: c1 - j * bw]
+        return out
+
+    def _record_read(self, src, filename, field_bands, data, read_window,
+                     window=None):
+        """
+        Add a read of some bands from a file to the statistics.
+
+        Only the pixels of read_window are counted as read. If data
+        covers a larger window (e.g., one extending past the edges of
+        the image), this is given as window.
+        """
+
+        bands = sorted(set(band for _, band in field_bands))
+        npixels = data.shape[-2] * data.shape[-1]
+        if window is not None:
+            # count the pixels of data corresponding to the part read
+            fraction = (read_window.width * read_window.height) / \
+                (window.width * window.height)
+            npixels = int(round(npixels * fraction))
+        window_size = (read_window.width, read_window.height)
+        nbytes = 0
+        for field, band in field_bands:
+            fbytes = npixels * np.dtype(src.dtypes[band - 1]).itemsize
+            nbytes += fbytes
+            self.stats.record(
+                field=field, totals=False, reads=1, bytes_read=fbytes,
+                pixels_decoded=npixels, largest_window=window_size,
+            )
+        self.stats.record(
+            filename=filename, reads=1, bytes_read=nbytes,
+            pixels_decoded=npixels * len(bands),
+            peak_buffer_bytes=data.nbytes, largest_window=window_size,
+        )
@@ -0,0 +1,397 @@
+"""
+Rasterized feature labels for repeated zonal workflows.
+
+Rasterizing many polygons (e.g., field parcels) onto an image grid is
+slow. A :class:`~yt_georaster.label_cache.LabelCache` does this once
+for each shapefile and grid and keeps the result in a directory. Any
+dataset on the same grid (e.g., later scenes of the same tile) reuses
+it for per-feature selection and zonal statistics.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import rasterio
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from rasterio.windows import bounds as window_bounds
+from rasterio.windows import transform as window_transform
+
+from yt.funcs import mylog
+
+from yt_georaster.utilities import _get_grid_record, _write_json
+
+
+def _get_shapefile_paths(filename):
+    """
+    Return a file and, for Shapefiles, the sidecar files read with it.
+    """
+
+    stem, ext = os.path.splitext(filename)
+    if ext.lower() != ".shp":
+        return [filename]
+    paths = [filename]
+    for sext in (".shx", ".dbf", ".prj", ".cpg"):
+        for path in (stem + sext, stem + sext.upper()):
+            if os.path.exists(path):
+                paths.append(path)
+                break
+    return paths
+
+
+class LabelRaster:
+    """
+    Feature ids rasterized onto the grid of a dataset.
+
+    Pixels are labeled 1 to the number of features, in the order of
+    the features in the file, and 0 where there are none. Where
+    features overlap, pixels take the label of the later feature. A
+    json sidecar file (the label filename plus ".json") records the
+    grid, the id of each label, and the pixel window and pixel count
+    of each feature.
+
+    Label rasters are made with
+    :meth:`~yt_georaster.label_cache.LabelCache.get` or
+    :meth:`~yt_georaster.data_structures.GeoRasterDataset.label_raster`.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the label file.
+
+    Examples
+    --------
+    >>> labels = ds.label_raster("parcels.shp", "label_cache", id_field="parcel_id")
+    >>> stats = ds.all_data().quantities.zonal_statistics(("S2", "NDVI"), labels)
+    >>> values = labels.get_feature_data(ds, "P-1234", [("S2", "NDVI")])
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sidecar = f"{filename}.json"
+        with open(self.sidecar, mode="r") as f:
+            data = json.load(f)
+        self.grid = data["grid"]
+        self.ids = data["ids"]
+        self.windows = np.array(data["windows"], dtype="int64").reshape(-1, 4)
+        self.counts = np.array(data["counts"], dtype="int64")
+        self.transform = Affine(*self.grid["transform"])
+        self._labels = None
+
+    def __repr__(self):
+        return f"LabelRaster ({self.filename}: {self.nlabels} features)"
+
+    @property
+    def nlabels(self):
+        """
+        The number of features.
+        """
+
+        return len(self.ids)
+
+    def check_grid(self, ds):
+        """
+        Raise a ValueError if a dataset is not on the grid of the labels.
+        """
+
+        if _get_grid_record(ds) != self.grid:
+            raise ValueError(
+                f"{ds} is not on the grid of label raster {self.filename}."
+            )
+
+    def get_label(self, feature_id):
+        """
+        Return the label of a feature id.
+        """
+
+        if self._labels is None:
+            self._labels = {fid: i + 1 for i, fid in enumerate(self.ids)}
+        try:
+            return self._labels[feature_id]
+        except KeyError:
+            raise KeyError(f"No feature with id {feature_id!r} in {self.filename}.")
+
+    def read(self, window=None):
+        """
+        Read labels for a window of the grid, or the whole grid.
+        """
+
+        with rasterio.open(self.filename) as src:
+            return src.read(1, window=window)
+
+    def get_pixels(self, x, y):
+        """
+        Return the rows and columns of the pixels with centers at x, y.
+        """
+
+        t = self.transform
+        cols = np.rint((np.asarray(x) - t.c) / t.a - 0.5).astype("int64")
+        rows = np.rint((np.asarray(y) - t.f) / t.e - 0.5).astype("int64")
+        return rows, cols
+
+    def labels_at(self, x, y):
+        """
+        Return the labels of the pixels with centers at x, y.
+
+        Only the window of the label file around the pixels is read.
+        """
+
+        rows, cols = self.get_pixels(x, y)
+        if rows.size == 0:
+            return np.zeros(0, dtype="int32")
+        row_off = rows.min()
+        col_off = cols.min()
+        window = Window(
+            col_off, row_off, cols.max() - col_off + 1, rows.max() - row_off + 1
+        )
+        return self.read(window)[rows - row_off, cols - col_off]
+
+    def get_feature_data(self, ds, feature_id, fields):
+        """
+        Return field values for the pixels of one feature.
+
+        Only the pixel window of the feature is read.
+
+        Parameters
+        ----------
+        ds : GeoRasterDataset
+            A dataset on the grid of the labels.
+        feature_id : int or str
+            The id of the feature.
+        fields : list of tuples
+            The fields to return.
+
+        Returns
+        -------
+        data : dict
+            The values of each field, as unyt arrays.
+        """
+
+        self.check_grid(ds)
+        label = self.get_label(feature_id)
+        col_off, row_off, width, height = self.windows[label - 1]
+        if self.counts[label - 1] == 0:
+            return {field: ds.arr(np.empty(0), ds.field_info[field].units)
+                    for field in fields}
+
+        window = Window(col_off, row_off, width, height)
+        left, bottom, right, top = window_bounds(window, self.transform)
+        rect = ds.rectangle(
+            ds.arr([left, bottom], "code_length"), ds.arr([right, top], "code_length")
+        )
+        mask = self.labels_at(rect["index", "x"].d, rect["index", "y"].d) == label
+        return {field: rect[field][mask] for field in fields}
+
+
+class LabelCache:
+    """
+    A directory of feature labels rasterized onto image grids.
+
+    Label files are named by a hash of the contents of the shapefile
+    (with its sidecar files), the grid (CRS, transform, and size), and
+    the options used, so a changed shapefile is rasterized again and
+    one shapefile can be cached for several grids. Files are written
+    as compressed, tiled GeoTIFFs.
+
+    Parameters
+    ----------
+    directory : str
+        Directory for label files. It will be created if needed.
+
+    Examples
+    --------
+    >>> from yt_georaster.label_cache import LabelCache
+    >>> cache = LabelCache("label_cache")
+    >>> labels = cache.get(ds, "parcels.shp", id_field="parcel_id")
+    """
+
+    _version = 1
+    # pixels per side of the blocks rasterized at once
+    _block_size = 2048
+    # pixels per side of the tiles in label files
+    _tile_size = 256
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return f"LabelCache ({self.directory})"
+
+    def get_path(self, ds, filename, id_field=None, all_touched=False):
+        """
+        Return the path of the label file for a shapefile and dataset.
+        """
+
+        digest = hashlib.sha1()
+        for path in _get_shapefile_paths(filename):
+            digest.update(os.path.splitext(path)[1].lower().encode())
+            with open(path, mode="rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        options = {
+            "version": self._version,
+            "grid": _get_grid_record(ds),
+            "id_field": id_field,
+            "all_touched": all_touched,
+        }
+        digest.update(json.dumps(options, sort_keys=True).encode())
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return os.path.join(self.directory, f"{name}.{digest.hexdigest()[:16]}.tif")
+
+    def get(self, ds, filename, id_field=None, all_touched=False, rebuild=False):
+        """
+        Return the labels of a shapefile on the grid of a dataset,
+        rasterizing them if not already cached.
+
+        Parameters
+        ----------
+        ds : GeoRasterDataset
+            The dataset.
+        filename : str
+            Path to the shapefile.
+        id_field : optional, str
+            Property to use as the id of each feature. If not given,
+            features are numbered by their position in the file.
+        all_touched : optional, bool
+            If True, label all pixels touched by a feature. If False,
+            label pixels whose centers are inside.
+            Default: False.
+        rebuild : optional, bool
+            If True, rasterize even if cached.
+            Default: False.
+
+        Returns
+        -------
+        labels : :class:`~yt_georaster.label_cache.LabelRaster`
+        """
+
+        path = self.get_path(ds, filename, id_field=id_field, all_touched=all_touched)
+        if rebuild or not (os.path.exists(path) and os.path.exists(f"{path}.json")):
+            self.build(ds, filename, path, id_field=id_field, all_touched=all_touched)
+        else:
+            mylog.info(f"Using labels for {filename} from {path}.")
+        return LabelRaster(path)
+
+    def build(self, ds, filename, path, id_field=None, all_touched=False):
+        """
+        Rasterize the features of a shapefile onto the grid of a dataset.
+
+        The grid is rasterized block by block, each with only the
+        features overlapping it, so little memory is needed.
+        """
+
+        from rasterio.features import rasterize
+
+        from yt_georaster.polygon import _read_shapefile, _transform_polygons
+
+        start = time.perf_counter()
+        params = ds.parameters
+        width = int(params["width"])
+        height = int(params["height"])
+        transform = params["transform"]
+
+        polygons, crs, ids = _read_shapefile(filename, id_field=id_field)
+        if crs is not None:
+            polygons = _transform_polygons(polygons, crs, params["crs"])
+        nlabels = len(polygons)
+        bboxes = np.array([geom.bounds for geom in polygons]).reshape(-1, 4)
+
+        row_min = np.full(nlabels + 1, height, dtype="int64")
+        col_min = np.full(nlabels + 1, width, dtype="int64")
+        row_max = np.full(nlabels + 1, -1, dtype="int64")
+        col_max = np.full(nlabels + 1, -1, dtype="int64")
+        counts = np.zeros(nlabels + 1, dtype="int64")
+
+        profile = {
+            "driver": "GTiff",
+            "width": width,
+            "height": height,
+            "count": 1,
+            "dtype": "int32",
+            "crs": params["crs"],
+            "transform": transform,
+            "nodata": None,
+            "tiled": True,
+            "blockxsize": self._tile_size,
+            "blockysize": self._tile_size,
+            "compress": "deflate",
+            "predictor": 2,
+            "BIGTIFF": "IF_SAFER",
+        }
+
+        bs = self._block_size
+        tmpfn = f"{path}.{os.getpid()}.tmp"
+        try:
+            with rasterio.open(tmpfn, "w", **profile) as dst:
+                for row_off in range(0, height, bs):
+                    for col_off in range(0, width, bs):
+                        window = Window(
+                            col_off, row_off,
+                            min(bs, width - col_off), min(bs, height - row_off)
+                        )
+                        left, bottom, right, top = window_bounds(window, transform)
+                        inside = np.nonzero(
+                            (bboxes[:, 0] <= right) & (bboxes[:, 2] >= left) &
+                            (bboxes[:, 1] <= top) & (bboxes[:, 3] >= bottom)
+                        )[0]
+                        shape = (window.height, window.width)
+                        if inside.size == 0:
+                            data = np.zeros(shape, dtype="int32")
+                        else:
+                            # later features are burned over earlier ones
+                            data = rasterize(
+                                ((polygons[i], int(i) + 1) for i in inside),
+                                out_shape=shape,
+                                transform=window_transform(window, transform),
+                                fill=0, all_touched=all_touched, dtype="int32",
+                            )
+                        dst.write(data, 1, window=window)
+
+                        rows, cols = np.nonzero(data)
+                        labels = data[rows, cols]
+                        counts += np.bincount(labels, minlength=nlabels + 1)
+                        np.minimum.at(row_min, labels, rows + row_off)
+                        np.maximum.at(row_max, labels, rows + row_off)
+                        np.minimum.at(col_min, labels, cols + col_off)
+                        np.maximum.at(col_max, labels, cols + col_off)
+            os.replace(tmpfn, path)
+        finally:
+            if os.path.exists(tmpfn):
+                os.remove(tmpfn)
+
+        found = counts[1:] > 0
+        windows = np.zeros((nlabels, 4), dtype="int64")
+        windows[found, 0] = col_min[1:][found]
+        windows[found, 1] = row_min[1:][found]
+        windows[found, 2] = (col_max - col_min + 1)[1:][found]
+        windows[found, 3] = (row_max - row_min + 1)[1:][found]
+
+        data = {
+            "version": self._version,
+            "shapefile": os.path.abspath(filename),
+            "grid": _get_grid_record(ds),
+            "id_field": id_field,
+            "all_touched": all_touched,
+            "ids": ids,
+            "windows": windows.tolist(),
+            "counts": counts[1:].tolist(),
+        }
+        _write_json(f"{path}.json", data, default=str)
+
+        mylog.info(
+            f"Rasterized {nlabels} features of {filename} in "
+            f"{time.perf_counter() - start:.1f} s."
+        )
+
+
+def get_label_cache(label_cache):
+    """
+    Return a LabelCache from a directory or cache.
+    """
+
+    if isinstance(label_cache, LabelCache):
+        return label_cache
+    return LabelCache(label_cache)
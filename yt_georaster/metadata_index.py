@@ -0,0 +1,315 @@
+import json
+import os
+
+import rasterio
+from rasterio.coords import BoundingBox
+from rasterio.crs import CRS
+from rasterio.profiles import Profile
+
+from yt.funcs import mylog
+
+from yt_georaster.utilities import _write_json
+
+
+def read_file_metadata(filename):
+    """
+    Read the header of an image file.
+
+    Returns a dictionary of everything needed to load the file
+    without opening it again.
+    """
+
+    with rasterio.open(filename, "r") as f:
+        return {
+            "driver": f.driver,
+            "crs": f.crs,
+            "transform": f.transform,
+            "width": f.width,
+            "height": f.height,
+            "count": f.count,
+            "dtypes": list(f.dtypes),
+            "nodatavals": list(f.nodatavals),
+            "scales": list(f.scales),
+            "offsets": list(f.offsets),
+            "block_shapes": [list(shape) for shape in f.block_shapes],
+            "res": tuple(f.res),
+            "bounds": f.bounds,
+            "meta": dict(f.meta),
+            "profile": f.profile,
+        }
+
+
+def _to_json(value):
+    if isinstance(value, CRS):
+        return {"crs": value.to_wkt()}
+    if isinstance(value, rasterio.Affine):
+        return {"transform": list(value)[:6]}
+    if isinstance(value, dict):
+        return {"dict": {key: _to_json(val) for key, val in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(val) for val in value]
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, list):
+        return [_from_json(val) for val in value]
+    if not isinstance(value, dict):
+        return value
+    if "crs" in value:
+        return CRS.from_wkt(value["crs"])
+    if "transform" in value:
+        return rasterio.Affine(*value["transform"])
+    return {key: _from_json(val) for key, val in value["dict"].items()}
+
+
+def _serialize(metadata):
+    record = {key: _to_json(val) for key, val in metadata.items()}
+    record["profile"] = _to_json(dict(metadata["profile"]))
+    return record
+
+
+def _deserialize(record):
+    metadata = {key: _from_json(val) for key, val in record.items()}
+    metadata["res"] = tuple(metadata["res"])
+    metadata["bounds"] = BoundingBox(*metadata["bounds"])
+    metadata["profile"] = Profile(**metadata["profile"])
+    return metadata
+
+
+class MetadataIndex:
+    """
+    An on-disk index of image file metadata.
+
+    The index stores the header information (driver, CRS, transform,
+    shape, band count, dtypes, nodata, scales, offsets, and block
+    sizes) of image files in a json file. Entries are keyed by the
+    absolute path of each file and are only used while the size and
+    modification time of the file are unchanged, so datasets can be
+    loaded without opening every file.
+
+    Parameters
+    ----------
+    filename : str or None
+        Path to the index file. It will be created when first saved.
+        If None, the index is only kept in memory.
+
+    Examples
+    --------
+    >>> import glob
+    >>> from yt_georaster import MetadataIndex
+    >>> fns = glob.glob("Landsat-8_sample_L2/*.TIF")
+    >>> mindex = MetadataIndex("metadata_index.json")
+    >>> mindex.update(fns)
+    >>> ds = yt.load(*fns, metadata_index=mindex)
+    """
+
+    _version = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.records = {}
+        self._modified = False
+        self.load()
+
+    def __repr__(self):
+        return f"MetadataIndex ({self.filename}: {len(self)} files)"
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, filename):
+        return self._get_record(filename) is not None
+
+    @staticmethod
+    def _key(filename):
+        return os.path.abspath(filename)
+
+    @staticmethod
+    def _stat(filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def load(self):
+        """
+        Load the index from disk, if it exists.
+        """
+
+        self.records = {}
+        self._modified = False
+        if self.filename is None or not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename, mode="r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            mylog.warning(f"Could not read metadata index {self.filename}: {e}.")
+            return
+
+        if data.get("version") != self._version:
+            mylog.info(f"Ignoring outdated metadata index {self.filename}.")
+            return
+        self.records = data.get("files", {})
+
+    def save(self):
+        """
+        Write the index to disk.
+        """
+
+        if self.filename is None:
+            self._modified = False
+            return
+        data = {"version": self._version, "files": self.records}
+        _write_json(self.filename, data)
+        self._modified = False
+
+    def _get_record(self, filename):
+        record = self.records.get(self._key(filename))
+        if record is None or record["stat"] != self._stat(filename):
+            return None
+        return record
+
+    def get(self, filename, read=True):
+        """
+        Return the metadata for a file.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the image file.
+        read : optional, bool
+            If True, read the file header if the file is not in the
+            index or has changed and add it to the index. If False,
+            return None in that case.
+            Default: True.
+        """
+
+        record = self._get_record(filename)
+        if record is not None:
+            return _deserialize(record["metadata"])
+        if not read:
+            return None
+
+        metadata = read_file_metadata(filename)
+        self._add(filename, metadata)
+        return metadata
+
+    def _add(self, filename, metadata):
+        self.records[self._key(filename)] = {
+            "stat": self._stat(filename),
+            "metadata": _serialize(metadata),
+        }
+        self._modified = True
+
+    def update(self, filenames, save=True):
+        """
+        Add new or changed files to the index.
+
+        Files whose size and modification time match the index are
+        not opened.
+
+        Parameters
+        ----------
+        filenames : list of str
+            Paths to image files.
+        save : optional, bool
+            If True, write the index to disk if anything changed.
+            Default: True.
+
+        Returns
+        -------
+        updated : list of str
+            The files that were (re-)read.
+        """
+
+        updated = []
+        for filename in filenames:
+            if self._get_record(filename) is not None:
+                continue
+            self._add(filename, read_file_metadata(filename))
+            updated.append(filename)
+
+        if updated:
+            mylog.info(f"Added {len(updated)} files to metadata index {self.filename}.")
+        if save and self._modified:
+            self.save()
+        return updated
+
+    def refresh(self, save=True):
+        """
+        Re-read changed files and remove missing files from the index.
+
+        Returns
+        -------
+        updated : list of str
+            The files that were re-read.
+        """
+
+        removed = [
+            key for key, record in self.records.items()
+            if self._stat(key) is None
+        ]
+        for key in removed:
+            del self.records[key]
+            self._modified = True
+
+        updated = []
+        for key, record in list(self.records.items()):
+            if record["stat"] != self._stat(key):
+                self._add(key, read_file_metadata(key))
+                updated.append(key)
+
+        if save and self._modified:
+            self.save()
+        return updated
+
+
+def build_metadata_index(filenames, index_filename, refresh=False):
+    """
+    Create or update a metadata index for a list of files.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Paths to image files.
+    index_filename : str
+        Path to the index file.
+    refresh : optional, bool
+        If True, also re-read changed files and drop missing files
+        already in the index.
+        Default: False.
+
+    Returns
+    -------
+    index : MetadataIndex
+
+    Examples
+    --------
+    >>> import glob
+    >>> from yt_georaster import build_metadata_index
+    >>> fns = glob.glob("Landsat-8_sample_L2/*.TIF")
+    >>> build_metadata_index(fns, "metadata_index.json")
+    >>> ds = yt.load(*fns, metadata_index="metadata_index.json")
+    """
+
+    index = MetadataIndex(index_filename)
+    if refresh:
+        index.refresh(save=False)
+    index.update(filenames, save=False)
+    if index._modified or not os.path.exists(index_filename):
+        index.save()
+    return index
+
+
+def get_metadata_index(metadata_index):
+    """
+    Return a MetadataIndex from a filename or index, or None.
+    """
+
+    if metadata_index is None or isinstance(metadata_index, MetadataIndex):
+        return metadata_index
+    return MetadataIndex(metadata_index)
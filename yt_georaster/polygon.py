@@ -4,12 +4,13 @@ from yt.data_objects.selection_objects.data_selection_objects import (
 from yt.data_objects.static_output import Dataset
 from yt.funcs import validate_object, mylog
 
-import fiona
 import numpy as np
-from shapely.geometry import Polygon, MultiPolygon
+import shapely
+from shapely.geometry import box, Polygon, MultiPolygon, shape
 from shapely.ops import unary_union
+from shapely.prepared import prep
 from rasterio.crs import CRS
-from rasterio.warp import transform_geom
+from rasterio import warp
 
 from yt_georaster.polygon_selector import PolygonSelector
 
@@ -20,8 +21,23 @@ class YTPolygon(YTSelectionContainer3D):
 
     Parameters
     ----------
-    filename : string
-        Path to a Shapefile
+    filename : string, Polygon, MultiPolygon, or list of Polygons
+        Path to a Shapefile or shapely polygons. All features are
+        joined into a single (Multi)Polygon, keeping holes.
+    crs : optional, CRS, str, int, or dict
+        CRS of shapely polygons, if not the CRS of the dataset. The
+        CRS of a Shapefile is read from the file.
+    simplify : optional, bool or float
+        If True, simplify the polygon to the pixel size of the dataset.
+        If a float, simplify to this tolerance (in dataset units).
+        Default: False.
+    selection_tolerance : optional, float
+        Tolerance, in pixels of the base image, to which a copy of the
+        polygon used only for selecting pixels is simplified. Detailed
+        shapes (e.g., coastlines) are selected faster, but a few pixels
+        along the edge may change. The polygon itself is kept for
+        export. If 0, pixels are selected with the exact polygon.
+        Default: 0.
 
     Examples
     --------
@@ -42,37 +58,25 @@ class YTPolygon(YTSelectionContainer3D):
     _con_args = ("polygon",)
 
     # add more arguments, like path to a shape file or a shapely Polygon object
-    def __init__(self, filename, ds=None, field_parameters=None, crs=None):
+    def __init__(self, filename, ds=None, field_parameters=None, crs=None,
+                 simplify=False, selection_tolerance=0):
         validate_object(ds, Dataset)
         validate_object(field_parameters, dict)
         self.src_crs = crs
+        self.selection_tolerance = selection_tolerance
         if isinstance(filename, str):
             self.filename = filename
-
-            # read shapefile with fiona
-            with fiona.open(filename, "r") as shapefile:
-                shapes_from_file = [feature["geometry"] for feature in shapefile]
-                self.src_crs = CRS.from_dict(**shapefile.crs)  # shapefile crs
-
+            polygons, file_crs, _ = _read_shapefile(filename)
+            if file_crs is not None:
+                self.src_crs = file_crs
             # save number of polygons
-            self._number_features = len(shapes_from_file)
-
-            # reproject to datasets crs
-            for i in range(self._number_features):
-                shapes_from_file[i] = transform_geom(
-                    f'EPSG:{self.src_crs.to_epsg()}',
-                    f'EPSG:{ds.parameters["crs"].to_epsg()}',
-                    shapes_from_file[i]
+            self._number_features = len(polygons)
+            if self.src_crs is not None:
+                polygons = _transform_polygons(
+                    polygons, self.src_crs, ds.parameters["crs"]
                 )
-            # convert all polygon features in shapefile to list of shapely polygons
-            polygons = [
-                Polygon(shapes_from_file[i]["coordinates"][0])
-                for i in range(self._number_features)
-            ]
-            # fix invalid MultiPolygons
-            m = MultiPolygon(polygons)
-            # join all shapely polygons to a single layer
-            self.polygon = unary_union(m)
+            # join all polygons to a single layer
+            self.polygon = unary_union(polygons)
 
         elif isinstance(filename, Polygon):
             # only one polygon
@@ -91,12 +95,18 @@ class YTPolygon(YTSelectionContainer3D):
         elif isinstance(filename, list):
             # assume list of shapely polygons
             self._number_features = len(filename)
-            # fix invalid MultiPolygons
-            m = MultiPolygon(filename)
-            # join all shapely polygons to a single layer
-            self.polygon = unary_union(m)
+            polygons = filename
             if self.src_crs is not None:
-                self._reproject_polygon(ds.parameters['crs'])
+                polygons = _transform_polygons(
+                    polygons, self.src_crs, ds.parameters["crs"]
+                )
+            # join all shapely polygons to a single layer
+            self.polygon = unary_union(polygons)
+
+        if simplify:
+            if simplify is True:
+                simplify = min(ds.parameters["res"])
+            self.polygon = self.polygon.simplify(simplify, preserve_topology=True)
 
         mylog.info(
             f"Number of features in poly object: {self._number_features}"
@@ -114,56 +124,9 @@ class YTPolygon(YTSelectionContainer3D):
     def _reproject_polygon(self, dst_crs):
         """
         Reproject polygon objects to destination projection.
-
-        fiona transform geom object does not handle shapely objects but
-        "GeoJSON-like" dictionaries instead.
         """
-        # get epsg
-        src_crs = self.src_crs
-        if isinstance(src_crs, int):
-            # assume epsg number
-            epsg = src_crs
-            src_crs = CRS.from_epsg(epsg)
-        elif isinstance(src_crs, dict):
-            src_crs = CRS.from_dict(**src_crs)
-            epsg = src_crs.to_epsg()
-        elif isinstance(src_crs, CRS):
-            epsg = src_crs.to_epsg()
-        else:
-            src_crs = CRS.from_string(src_crs)
-            epsg = src_crs.to_epsg()
-
-        if dst_crs.to_epsg() != epsg:
-            if isinstance(self.polygon, MultiPolygon):
-                coords = [list(geom.exterior.coords) for geom in self.polygon.geoms]
-                type_str = 'MultiPolygon'
-                transformed_poly = transform_geom(
-                    src_crs,
-                    dst_crs,
-                    {
-                        'type': type_str,
-                        'coordinates': coords
-                    }
-                )
-                # convert all polygon features back to shapely polygons
-                polygons = [
-                    Polygon(transformed_poly[i]["coordinates"][0])
-                    for i in range(len(transformed_poly))
-                ]
-                # join all shapely polygons to a single layer
-                self.polygon = unary_union(MultiPolygon(polygons))
-            else:
-                coords = [list(self.polygon.exterior.coords)]
-                type_str = 'Polygon'
-                transformed_poly = transform_geom(
-                    src_crs,
-                    dst_crs,
-                    {
-                        'type': type_str,
-                        'coordinates': coords
-                    }
-                )
-                self.polygon = Polygon(transformed_poly['coordinates'][0])
+
+        self.polygon = _transform_polygons([self.polygon], self.src_crs, dst_crs)[0]
 
     def _get_bbox(self):
         """
@@ -176,6 +139,41 @@ class YTPolygon(YTSelectionContainer3D):
         right_edge[:2] = self.polygon.bounds[2:]
         return left_edge, right_edge
 
+    _selection_polygon = None
+    _prepared_polygon = None
+
+    @property
+    def selection_polygon(self):
+        """
+        The polygon used to select pixels.
+
+        By default, this is the polygon itself. With a
+        selection_tolerance, it is a copy simplified (preserving
+        topology) to that fraction of a pixel, which makes selecting
+        very detailed shapes cheaper but may change a few pixels along
+        the edge. The original is kept as the polygon attribute.
+        """
+
+        if self._selection_polygon is None:
+            if self.selection_tolerance:
+                tolerance = self.selection_tolerance * min(self.ds.parameters["res"])
+                self._selection_polygon = self.polygon.simplify(
+                    tolerance, preserve_topology=True
+                )
+            else:
+                self._selection_polygon = self.polygon
+        return self._selection_polygon
+
+    @property
+    def prepared_polygon(self):
+        """
+        The selection polygon prepared for fast repeated intersection tests.
+        """
+
+        if self._prepared_polygon is None:
+            self._prepared_polygon = prep(self.selection_polygon)
+        return self._prepared_polygon
+
     _selector = None
 
     @property
@@ -185,6 +183,182 @@ class YTPolygon(YTSelectionContainer3D):
         return self._selector
 
 
+def _get_parts(geom):
+    """
+    Return the Polygons making up a Polygon or MultiPolygon.
+    """
+
+    if isinstance(geom, MultiPolygon):
+        return list(geom.geoms)
+    return [geom]
+
+
+def _read_shapefile(filename, id_field=None):
+    """
+    Read all polygon features of a Shapefile.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the file.
+    id_field : optional, str
+        Property to return as the id of each feature. If not given,
+        features are numbered by their position in the file.
+
+    Returns
+    -------
+    polygons : list of Polygons and MultiPolygons
+        The features, with holes and all parts.
+    crs : CRS or None
+        The CRS of the file, if set.
+    ids : list
+        The id of each polygon.
+    """
+
+    import fiona
+
+    geoms = []
+    ids = []
+    with fiona.open(filename, "r") as shapefile:
+        crs = CRS.from_wkt(shapefile.crs_wkt) if shapefile.crs_wkt else None
+        for i, feature in enumerate(shapefile):
+            if feature["geometry"] is None:
+                continue
+            geoms.append(shape(feature["geometry"]))
+            ids.append(i if id_field is None else feature["properties"][id_field])
+
+    polygons = []
+    polygon_ids = []
+    for geom, fid in zip(geoms, ids):
+        if isinstance(geom, (Polygon, MultiPolygon)):
+            polygons.append(geom)
+            polygon_ids.append(fid)
+    if len(polygons) < len(geoms):
+        mylog.warning(
+            f"Ignoring {len(geoms) - len(polygons)} features of {filename} "
+            "that are not polygons."
+        )
+    return polygons, crs, polygon_ids
+
+
+def _transform_polygons(polygons, src_crs, dst_crs):
+    """
+    Reproject a list of Polygons and MultiPolygons.
+
+    The coordinates of all rings, including holes, are transformed
+    together in a single call.
+    """
+
+    src_crs = CRS.from_user_input(src_crs)
+    dst_crs = CRS.from_user_input(dst_crs)
+    if src_crs == dst_crs or not polygons:
+        return list(polygons)
+
+    def transform_coords(coords):
+        xs, ys = warp.transform(src_crs, dst_crs, coords[:, 0], coords[:, 1])
+        return np.column_stack([xs, ys])
+
+    # shapely >= 2 can rebuild the geometries itself
+    if hasattr(shapely, "transform"):
+        geoms = np.empty(len(polygons), dtype=object)
+        geoms[:] = polygons
+        return list(shapely.transform(geoms, transform_coords))
+
+    rings = []
+    for geom in polygons:
+        for part in _get_parts(geom):
+            rings.append(np.asarray(part.exterior.coords)[:, :2])
+            rings.extend(np.asarray(ring.coords)[:, :2] for ring in part.interiors)
+    coords = transform_coords(np.concatenate(rings))
+    offsets = np.cumsum([0] + [len(ring) for ring in rings])
+
+    # rebuild the geometries in the same order
+    new_polygons = []
+    iring = 0
+    for geom in polygons:
+        parts = []
+        for part in _get_parts(geom):
+            nrings = 1 + len(part.interiors)
+            new_rings = [coords[offsets[i]:offsets[i + 1]]
+                         for i in range(iring, iring + nrings)]
+            iring += nrings
+            parts.append(Polygon(new_rings[0], new_rings[1:]))
+        if isinstance(geom, MultiPolygon):
+            new_polygons.append(MultiPolygon(parts))
+        else:
+            new_polygons.append(parts[0])
+    return new_polygons
+
+
+def _get_polygon_mask(polygon, left_edge, dds, shape):
+    """
+    Return a mask of the cells of a regular grid intersecting a polygon.
+
+    This gives the same result as testing each cell, but only cells
+    near the boundary of the polygon are tested with shapely. The
+    rest are inside if their centers are.
+
+    Parameters
+    ----------
+    polygon : Polygon or MultiPolygon
+        The polygon.
+    left_edge : tuple of (float, float)
+        Coordinates of the lower left corner of the grid.
+    dds : tuple of (float, float)
+        Cell widths in x and y.
+    shape : tuple of (int, int)
+        Number of cells in x and y.
+
+    Returns
+    -------
+    mask : array of bools
+        Mask of shape (nx, ny).
+    """
+
+    from rasterio.features import rasterize
+    from rasterio.transform import from_origin
+    from scipy.ndimage import binary_dilation
+
+    nx, ny = shape
+    dx, dy = dds
+    x0, y0 = left_edge
+    # rows run from the top, so flip to index from the bottom
+    transform = from_origin(x0, y0 + ny * dy, dx, dy)
+
+    def rasterize_rows(geom, all_touched):
+        data = rasterize([geom], out_shape=(ny, nx), transform=transform,
+                         all_touched=all_touched, dtype="uint8")
+        return data[::-1].T.astype(bool)
+
+    # cells inside or crossing the polygon are decided by their centers
+    mask = rasterize_rows(polygon, False)
+    # Cells near the boundary are tested exactly. Neighbors of cells the
+    # boundary passes through are included to catch lines exactly along
+    # cell edges.
+    edge = binary_dilation(
+        rasterize_rows(polygon.boundary, True), structure=np.ones((3, 3), dtype=bool)
+    )
+    ii, jj = np.nonzero(edge)
+    if ii.size == 0:
+        return mask
+
+    left = x0 + ii * dx
+    bottom = y0 + jj * dy
+    if hasattr(shapely, "intersects"):
+        # shapely >= 2 tests all cells at once
+        boxes = shapely.box(left, bottom, left + dx, bottom + dy)
+        shapely.prepare(polygon)
+        hits = shapely.intersects(polygon, boxes)
+    else:
+        prepared = prep(polygon)
+        hits = np.array([
+            prepared.intersects(box(*bounds))
+            for bounds in zip(left, bottom, left + dx, bottom + dy)
+        ], dtype=bool)
+    mask[ii, jj] = hits
+    return mask
+
+
 def poly_from_utm(polygon, transform):
     poly_pts = []
 
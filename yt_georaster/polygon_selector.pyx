@@ -35,7 +35,7 @@ cdef class PolygonSelector(SelectorObject):
             cell_polygon = box(*bbox, ccw=True)
 
             # Determine if grid cell polygon is within polygon
-            if cell_polygon.intersects(self.dobj.polygon):
+            if self.dobj.prepared_polygon.intersects(cell_polygon):
                 binary = 1
             else:
                 binary = 0
@@ -52,7 +52,7 @@ cdef class PolygonSelector(SelectorObject):
                 my_pos[i] = pos[i]
 
             # Determine if point within polygon 
-            if Point(my_pos).within(self.dobj.polygon):
+            if Point(my_pos).within(self.dobj.selection_polygon):
                 binary = 1
             else:
                 binary = 0
@@ -73,7 +73,7 @@ cdef class PolygonSelector(SelectorObject):
             bbox_polygon = box(*bbox, ccw=True)
 
             # Determine if bbox polygon is within polygon
-            if (self.dobj.polygon).intersects(bbox_polygon):
+            if self.dobj.prepared_polygon.intersects(bbox_polygon):
                 binary = 1
             else:
                 binary = 0
@@ -93,13 +93,28 @@ cdef class PolygonSelector(SelectorObject):
             sphere_polygon = Point(my_pos).buffer(radius)
 
             # Determine if bbox polygon is within polygon
-            if sphere_polygon.intersects(self.dobj.polygon):
+            if self.dobj.prepared_polygon.intersects(sphere_polygon):
                 binary = 1
             else:
                 binary = 0
         
         return binary
 
+    def fill_mask_regular_grid(self, gobj):
+        # The default tests every cell with select_cell. Instead, only
+        # cells near the polygon boundary are tested individually.
+        from yt_georaster.polygon import _get_polygon_mask
+
+        dds = gobj.dds.d
+        left_edge = gobj.LeftEdge.d
+        dims = gobj.ActiveDimensions
+        mask = _get_polygon_mask(
+            self.dobj.selection_polygon, left_edge[:2], dds[:2], dims[:2]
+        )
+        if not mask.any():
+            return None
+        return np.repeat(mask[:, :, None], dims[2], axis=2)
+
     def fill_mask(self, grid):
         # this takes a grid object and fills a mask of which zones should be
         # included. It must take into account the child mask of the grid.
@@ -130,8 +145,4 @@ cdef class PolygonSelector(SelectorObject):
         # this must return some combination of parameters that semi-uniquely
         # identifies the selector.
 
-        if self.dobj._number_features > 1:
-            return tuple([self.dobj.polygon[x].exterior.coords for x in \
-                          range(self.dobj._number_features)])
-        else:
-            return tuple([self.dobj.polygon.exterior.coords])
+        return (self.dobj.polygon.wkb,)
@@ -0,0 +1,646 @@
+"""
+Streaming histograms, quantiles, and zonal statistics.
+
+The sketches here summarize the distribution of a field without ever
+holding all of its values. They are filled one tile at a time and
+partial results can be merged, so they can be combined across
+parallel runs.
+"""
+
+from contextlib import ExitStack
+import math
+import numpy as np
+
+from yt.data_objects.derived_quantities import DerivedQuantity
+from yt.utilities.parallel_tools.parallel_analysis_interface import parallel_objects
+
+
+class StreamingHistogram:
+    """
+    A histogram that can be filled in pieces and merged.
+
+    With a range, bins are fixed and evenly spaced, and values outside
+    the range are counted separately as underflow and overflow. Without
+    a range, bins adapt to the data: bin widths are powers of two and
+    bin edges are multiples of the bin width, so any two histograms
+    can be merged exactly. When new values fall outside the current
+    bins, neighboring bins are combined in pairs until there are no
+    more than the requested number of bins.
+
+    Parameters
+    ----------
+    bins : optional, int
+        Number of bins. For adaptive bins, this is the maximum number.
+        Default: 256.
+    range : optional, tuple of (float, float)
+        Lower and upper edges of the bins. If not given, bins adapt
+        to the data.
+
+    Attributes
+    ----------
+    units : str or None
+        Units of the histogrammed values, if known.
+
+    Examples
+    --------
+    >>> hist = StreamingHistogram(bins=100, range=(0, 1))
+    >>> hist.add(np.random.random(1000))
+    >>> hist.edges, hist.counts
+    """
+
+    def __init__(self, bins=256, range=None):
+        self.bins = int(bins)
+        if self.bins < 2:
+            raise ValueError(f"Need at least 2 bins, not {bins}.")
+        self.range = None
+        if range is not None:
+            lo, hi = (float(val) for val in range)
+            if not hi > lo:
+                raise ValueError(f"Invalid histogram range: {range}.")
+            self.range = (lo, hi)
+            self._counts = np.zeros(self.bins, dtype=np.int64)
+        else:
+            self._counts = np.zeros(0, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.units = None
+        # adaptive bins: bin i spans [i, i + 1) * 2**_exponent
+        self._exponent = None
+        self._start = 0
+
+    def __repr__(self):
+        return f"StreamingHistogram ({self.counts.size} bins, {self.total} values)"
+
+    @property
+    def adaptive(self):
+        return self.range is None
+
+    @property
+    def counts(self):
+        return self._counts.copy()
+
+    @property
+    def edges(self):
+        if not self.adaptive:
+            return np.linspace(*self.range, self.bins + 1)
+        if self._exponent is None:
+            return np.zeros(0)
+        indices = np.arange(self._start, self._start + self._counts.size + 1)
+        return np.ldexp(indices.astype("float64"), self._exponent)
+
+    @property
+    def total(self):
+        return int(self._counts.sum()) + self.underflow + self.overflow
+
+    def add(self, values):
+        """
+        Add an array of values to the histogram.
+
+        Non-finite values are ignored.
+        """
+
+        values = np.asarray(values).ravel()
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        if self.adaptive:
+            self._add_adaptive(values)
+        else:
+            self._add_fixed(values)
+
+    def _add_fixed(self, values):
+        lo, hi = self.range
+        under = values < lo
+        over = values > hi
+        self.underflow += int(under.sum())
+        self.overflow += int(over.sum())
+        values = values[~(under | over)]
+        indices = ((values - lo) * (self.bins / (hi - lo))).astype(np.int64)
+        # the upper edge belongs to the last bin
+        np.minimum(indices, self.bins - 1, out=indices)
+        self._counts += np.bincount(indices, minlength=self.bins)
+
+    def _get_exponent(self, vmin, vmax):
+        """
+        Return the smallest allowed bin width exponent for a range.
+        """
+
+        # keep bin indices within the precision of a float64
+        largest = max(abs(vmin), abs(vmax), np.finfo("float64").tiny)
+        exponent = math.frexp(largest)[1] - 52
+        span = vmax - vmin
+        if span > 0:
+            exponent = max(exponent, math.frexp(span / self.bins)[1] - 1)
+        if self._exponent is not None:
+            exponent = max(exponent, self._exponent)
+        while math.floor(math.ldexp(vmax, -exponent)) - \
+          math.floor(math.ldexp(vmin, -exponent)) >= self.bins:
+            exponent += 1
+        return exponent
+
+    def _rebin(self, exponent):
+        """
+        Combine bins until their width is 2**exponent.
+        """
+
+        shift = exponent - self._exponent
+        if shift == 0:
+            return
+        indices = np.arange(self._start, self._start + self._counts.size)
+        # floor division for negative indices as well
+        indices >>= shift
+        start = int(indices[0])
+        self._counts = np.bincount(indices - start, weights=self._counts).astype(np.int64)
+        self._start = start
+        self._exponent = exponent
+
+    def _add_adaptive(self, values):
+        vmin = float(values.min())
+        vmax = float(values.max())
+        if self._exponent is not None:
+            edges = self.edges
+            vmin = min(vmin, edges[0])
+            # the upper edge is exclusive, so step back one bin
+            vmax = max(vmax, math.ldexp(self._start + self._counts.size - 1, self._exponent))
+
+        exponent = self._get_exponent(vmin, vmax)
+        if self._exponent is None:
+            self._exponent = exponent
+            self._start = math.floor(math.ldexp(vmin, -exponent))
+        else:
+            self._rebin(exponent)
+
+        start = math.floor(math.ldexp(vmin, -exponent))
+        stop = math.floor(math.ldexp(vmax, -exponent)) + 1
+        indices = np.floor(np.ldexp(values, -exponent)).astype(np.int64) - start
+        counts = np.bincount(indices, minlength=stop - start)
+        pad = self._start - start
+        counts[pad:pad + self._counts.size] += self._counts
+        self._counts = counts
+        self._start = start
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram to this one.
+
+        Fixed histograms must have the same bins.
+        """
+
+        if self.adaptive != other.adaptive:
+            raise ValueError("Cannot merge fixed and adaptive histograms.")
+        if not self.adaptive:
+            if self.bins != other.bins or self.range != other.range:
+                raise ValueError("Cannot merge histograms with different bins.")
+            self._counts += other._counts
+            self.underflow += other.underflow
+            self.overflow += other.overflow
+            return self
+
+        if other._exponent is None:
+            return self
+        if self._exponent is None:
+            self._counts = other._counts.copy()
+            self._exponent = other._exponent
+            self._start = other._start
+            return self
+
+        other = other.copy()
+        vmin = min(self.edges[0], other.edges[0])
+        vmax = max(
+            math.ldexp(hist._start + hist._counts.size - 1, hist._exponent)
+            for hist in (self, other)
+        )
+        exponent = max(self._get_exponent(vmin, vmax), other._exponent)
+        self._rebin(exponent)
+        other._rebin(exponent)
+
+        start = min(self._start, other._start)
+        stop = max(
+            hist._start + hist._counts.size for hist in (self, other)
+        )
+        counts = np.zeros(stop - start, dtype=np.int64)
+        for hist in (self, other):
+            pad = hist._start - start
+            counts[pad:pad + hist._counts.size] += hist._counts
+        self._counts = counts
+        self._start = start
+        return self
+
+    def copy(self):
+        new = StreamingHistogram.__new__(StreamingHistogram)
+        new.__dict__.update(self.__dict__)
+        new._counts = self._counts.copy()
+        return new
+
+
+class TDigest:
+    """
+    A t-digest for estimating quantiles in one pass.
+
+    Values are summarized by a small number of weighted centroids
+    which are smallest near the ends of the distribution, so extreme
+    quantiles are estimated most accurately. Digests can be filled in
+    pieces and merged.
+
+    Parameters
+    ----------
+    compression : optional, float
+        Controls the number of centroids kept (about half this
+        number) and with it the accuracy.
+        Default: 200.
+
+    Examples
+    --------
+    >>> digest = TDigest()
+    >>> digest.add(np.random.random(100000))
+    >>> digest.quantile([0.02, 0.98])
+    """
+
+    def __init__(self, compression=200):
+        self.compression = float(compression)
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __repr__(self):
+        return f"TDigest ({self.means.size} centroids, {self.count} values)"
+
+    @property
+    def count(self):
+        return int(self.weights.sum())
+
+    def add(self, values):
+        """
+        Add an array of values to the digest.
+
+        Non-finite values are ignored.
+        """
+
+        values = np.asarray(values).ravel()
+        values = np.sort(values[np.isfinite(values)]).astype("float64", copy=False)
+        if values.size == 0:
+            return
+        # summarize the new values first, then merge the centroids
+        other = TDigest(compression=self.compression)
+        starts = np.ceil(other._get_bounds(values.size)).astype(np.int64)
+        starts = np.unique(np.concatenate([[0], starts[starts < values.size]]))
+        other.weights = np.diff(np.append(starts, values.size)).astype("float64")
+        other.means = np.add.reduceat(values, starts) / other.weights
+        other.min = values[0]
+        other.max = values[-1]
+        self.merge(other)
+
+    def merge(self, other):
+        """
+        Add the centroids of another digest to this one.
+        """
+
+        if other.means.size == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        means = np.concatenate([self.means, other.means])
+        weights = np.concatenate([self.weights, other.weights])
+        order = np.argsort(means, kind="stable")
+        self._compress(means[order], weights[order])
+        return self
+
+    def _get_bounds(self, total):
+        """
+        Return the cumulative weight at each whole unit of k.
+        """
+
+        k = np.arange(1, math.ceil(self.compression / 2)) - self.compression / 4
+        return total * (np.sin(2 * np.pi * k / self.compression) + 1) / 2
+
+    def _compress(self, means, weights):
+        """
+        Combine sorted values into centroids.
+
+        Values are assigned to centroids by their position on the
+        k-scale, k(q) = compression / (2 pi) * arcsin(2q - 1), so that
+        each centroid spans at most about one unit of k.
+        """
+
+        cumulative = np.cumsum(weights)
+        starts = np.searchsorted(cumulative - weights, self._get_bounds(cumulative[-1]))
+        starts = np.unique(np.concatenate([[0], starts[starts < weights.size]]))
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(weights * means, starts) / self.weights
+
+    def quantile(self, q):
+        """
+        Estimate the value at one or more quantiles.
+
+        Parameters
+        ----------
+        q : float or array_like
+            Quantiles between 0 and 1.
+        """
+
+        scalar = np.ndim(q) == 0
+        q = np.atleast_1d(np.asarray(q, dtype="float64"))
+        if ((q < 0) | (q > 1)).any():
+            raise ValueError("Quantiles must be between 0 and 1.")
+        if self.means.size == 0:
+            values = np.full(q.shape, np.nan)
+        else:
+            total = self.weights.sum()
+            centers = np.cumsum(self.weights) - self.weights / 2
+            positions = np.concatenate([[0], centers, [total]])
+            means = np.concatenate([[self.min], self.means, [self.max]])
+            values = np.interp(q * total, positions, means)
+        if scalar:
+            return values[0]
+        return values
+
+
+def _get_chunks(data_source, tile_size=None):
+    """
+    Iterate over a data container in io chunks.
+
+    For GeoRaster datasets, the selection is split into tiles so
+    memory use stays bounded. Cut regions chunk their base objects.
+    """
+
+    index = data_source.ds.index
+    if not hasattr(index, "_chunk_tiles"):
+        yield from data_source.chunks([], "io")
+        return
+
+    objs = [data_source]
+    while hasattr(objs[-1], "base_object"):
+        objs.append(objs[-1].base_object)
+    base = objs[-1]
+    for chunk in index._chunk_tiles(base, tile_size=tile_size):
+        with ExitStack() as stack:
+            for obj in objs[::-1]:
+                stack.enter_context(obj._chunked_read(chunk))
+            yield data_source
+
+
+def _get_valid_mask(data, field, values, exclude_nodata=True):
+    """
+    Return a mask of the finite values of a field.
+
+    If exclude_nodata is True, pixels where any of the on-disk fields
+    the field depends on are equal to their nodata value are masked.
+    """
+
+    valid = np.isfinite(values)
+
+    geo_manager = getattr(data.ds.index, "geo_manager", None)
+    if exclude_nodata and geo_manager is not None:
+        for dep in data.ds.field_info.get_disk_dependencies([field]):
+            nodata = data.ds.nodata
+            if nodata is None:
+                nodata = geo_manager.fields[dep]["nodata"]
+            if nodata is None or np.isnan(nodata):
+                continue
+            valid &= data[dep].d != nodata
+
+    return valid
+
+
+def _get_field_values(data, field, exclude_nodata=True):
+    """
+    Return the finite values of a field as an ndarray.
+
+    If exclude_nodata is True, pixels where any of the on-disk fields
+    the field depends on are equal to their nodata value are dropped.
+    """
+
+    values = data[field]
+    units = values.units
+    values = values.d
+    valid = _get_valid_mask(data, field, values, exclude_nodata=exclude_nodata)
+    return values[valid], units
+
+
+def _stream_sketches(quantity, field, make_sketch, tile_size, exclude_nodata):
+    """
+    Fill a sketch for each chunk and merge the results.
+    """
+
+    data_source = quantity.data_source
+    field = data_source._determine_fields(field)[0]
+    chunks = _get_chunks(data_source, tile_size=tile_size)
+
+    storage = {}
+    units = None
+    for sto, data in parallel_objects(chunks, -1, storage=storage):
+        values, units = _get_field_values(data, field, exclude_nodata=exclude_nodata)
+        sketch = make_sketch()
+        sketch.add(values)
+        sto.result = (sketch, str(units))
+
+    sketch = make_sketch()
+    for key in sorted(storage):
+        part, units = storage[key]
+        sketch.merge(part)
+    if units is None:
+        units = data_source.ds.field_info[field].units
+    return sketch, units
+
+
+class Histogram(DerivedQuantity):
+    r"""
+    Calculates a histogram of a field in a single streaming pass.
+
+    Data are read one tile at a time, so the field is never held in
+    memory all at once. Returns a
+    :class:`~yt_georaster.quantities.StreamingHistogram`.
+
+    Parameters
+    ----------
+    field : field
+        The field to histogram.
+    bins : optional, int
+        Number of bins, or the maximum number for adaptive bins.
+        Default: 256.
+    range : optional, tuple of (float, float)
+        Bin range in the units of the field. If not given, bins
+        adapt to the data.
+    exclude_nodata : optional, bool
+        If True, nodata pixels are excluded.
+        Default: True.
+    tile_size : optional, int
+        Size in pixels of the tiles read at once.
+
+    Examples
+    --------
+    >>> ad = ds.all_data()
+    >>> hist = ad.quantities.histogram(("S2", "NDVI"), bins=100, range=(-1, 1))
+    >>> hist.edges, hist.counts
+    """
+
+    def __call__(self, field, bins=256, range=None, exclude_nodata=True,
+                 tile_size=None):
+        hist, units = _stream_sketches(
+            self, field, lambda: StreamingHistogram(bins=bins, range=range),
+            tile_size, exclude_nodata
+        )
+        hist.units = units
+        return hist
+
+
+class Quantiles(DerivedQuantity):
+    r"""
+    Estimates quantiles of a field in a single streaming pass.
+
+    Data are read one tile at a time and summarized with a
+    :class:`~yt_georaster.quantities.TDigest`, so no full copy of
+    the field is made or sorted.
+
+    Parameters
+    ----------
+    field : field
+        The field.
+    q : float or array_like
+        Quantiles between 0 and 1.
+    compression : optional, float
+        Accuracy parameter for the t-digest.
+        Default: 200.
+    exclude_nodata : optional, bool
+        If True, nodata pixels are excluded.
+        Default: True.
+    tile_size : optional, int
+        Size in pixels of the tiles read at once.
+
+    Examples
+    --------
+    >>> ad = ds.all_data()
+    >>> vmin, vmax = ad.quantities.quantiles(("S2", "red"), [0.02, 0.98])
+    """
+
+    def __call__(self, field, q, compression=200, exclude_nodata=True,
+                 tile_size=None):
+        digest, units = _stream_sketches(
+            self, field, lambda: TDigest(compression=compression),
+            tile_size, exclude_nodata
+        )
+        values = digest.quantile(q)
+        if np.ndim(values) == 0:
+            return self.data_source.ds.quan(values, units)
+        return self.data_source.ds.arr(values, units)
+
+
+def _get_zonal_sums(labels, values, nlabels):
+    """
+    Return the count, sum, sum of squares, minimum, and maximum of
+    values for each label from 0 to nlabels.
+    """
+
+    n = nlabels + 1
+    labels = labels.astype("intp", copy=False)
+    sums = {
+        "count": np.bincount(labels, minlength=n).astype("int64"),
+        # bincount of no values gives integers
+        "sum": np.bincount(labels, weights=values, minlength=n).astype("float64"),
+        "sumsq": np.bincount(
+            labels, weights=values * values, minlength=n
+        ).astype("float64"),
+        "min": np.full(n, np.inf),
+        "max": np.full(n, -np.inf),
+    }
+    np.minimum.at(sums["min"], labels, values)
+    np.maximum.at(sums["max"], labels, values)
+    return sums
+
+
+def _merge_zonal_sums(sums, other):
+    for key in ("count", "sum", "sumsq"):
+        sums[key] += other[key]
+    np.minimum(sums["min"], other["min"], out=sums["min"])
+    np.maximum(sums["max"], other["max"], out=sums["max"])
+
+
+class ZonalStatistics(DerivedQuantity):
+    r"""
+    Calculates statistics of a field for each feature of a
+    :class:`~yt_georaster.label_cache.LabelRaster`.
+
+    Data are read one tile at a time, and the labels of the pixels in
+    each tile are read from the label file, so all features are
+    summarized in a single pass over the data container.
+
+    Parameters
+    ----------
+    field : field
+        The field.
+    labels : LabelRaster
+        Feature labels on the grid of the dataset, as returned by
+        :meth:`~yt_georaster.data_structures.GeoRasterDataset.label_raster`.
+    exclude_nodata : optional, bool
+        If True, nodata pixels are excluded.
+        Default: True.
+    tile_size : optional, int
+        Size in pixels of the tiles read at once.
+
+    Returns
+    -------
+    stats : dict
+        Arrays with one value per feature, in the order of the file,
+        for "id", "count", "sum", "mean", "std", "min", and "max".
+        Statistics of features with no valid pixels are NaN.
+
+    Examples
+    --------
+    >>> labels = ds.label_raster("parcels.shp", "label_cache")
+    >>> stats = ds.all_data().quantities.zonal_statistics(("S2", "NDVI"), labels)
+    >>> stats["id"], stats["mean"]
+    """
+
+    def __call__(self, field, labels, exclude_nodata=True, tile_size=None):
+        data_source = self.data_source
+        labels.check_grid(data_source.ds)
+        field = data_source._determine_fields(field)[0]
+        chunks = _get_chunks(data_source, tile_size=tile_size)
+
+        storage = {}
+        units = None
+        for sto, data in parallel_objects(chunks, -1, storage=storage):
+            values = data[field]
+            units = values.units
+            values = values.d
+            valid = _get_valid_mask(data, field, values, exclude_nodata=exclude_nodata)
+            pixel_labels = labels.labels_at(
+                data["index", "x"].d[valid], data["index", "y"].d[valid]
+            )
+            sums = _get_zonal_sums(
+                pixel_labels, values[valid].astype("float64"), labels.nlabels
+            )
+            sto.result = (sums, str(units))
+
+        sums = _get_zonal_sums(
+            np.zeros(0, dtype="int64"), np.zeros(0), labels.nlabels
+        )
+        for key in sorted(storage):
+            part, units = storage[key]
+            _merge_zonal_sums(sums, part)
+
+        # label 0 is pixels outside all features
+        count = sums["count"][1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sums["sum"][1:] / count
+            var = np.maximum(sums["sumsq"][1:] / count - mean ** 2, 0)
+        empty = count == 0
+        vmin = sums["min"][1:]
+        vmax = sums["max"][1:]
+        vmin[empty] = np.nan
+        vmax[empty] = np.nan
+
+        ds = data_source.ds
+        if units is None:
+            units = ds.field_info[field].units
+        return {
+            "id": labels.ids,
+            "count": count,
+            "sum": ds.arr(sums["sum"][1:], units),
+            "mean": ds.arr(mean, units),
+            "std": ds.arr(np.sqrt(var), units),
+            "min": ds.arr(vmin, units),
+            "max": ds.arr(vmax, units),
+        }
@@ -1,16 +1,48 @@
 """
 Testing functions.
 
-
-
+This includes functions for writing synthetic Landsat-8 and
+Sentinel-2 scenes, so tests and benchmarks can run without the
+sample data.
 """
 
+import math
+import numpy as np
 import os
 import shutil
 import tempfile
 from unittest import TestCase
 from yt.config import ytcfg
 
+# band: (resolution relative to the finest band, mean, amplitude)
+landsat8_bands = {
+    "SR_B1": (1, 9000, 1500),
+    "SR_B2": (1, 9500, 1800),
+    "SR_B3": (1, 10500, 2200),
+    "SR_B4": (1, 11000, 3000),
+    "SR_B5": (1, 20000, 5000),
+    "SR_B6": (1, 16000, 4000),
+    "SR_B7": (1, 13000, 3500),
+    "ST_B10": (1, 45000, 3000),
+}
+landsat8_prefix = "LC08_L2SP_171060_20210227_20210304_02_T1"
+
+sentinel2_bands = {
+    "B01": (6, 1500, 300),
+    "B02": (1, 1300, 400),
+    "B03": (1, 1200, 500),
+    "B04": (1, 1100, 700),
+    "B05": (2, 1500, 600),
+    "B06": (2, 2200, 900),
+    "B07": (2, 2500, 1000),
+    "B08": (1, 2700, 1100),
+    "B8A": (2, 2800, 1100),
+    "B09": (6, 900, 200),
+    "B11": (2, 2000, 800),
+    "B12": (2, 1400, 600),
+}
+sentinel2_prefix = "S2A_MSIL1C_20210315T075701_N0209_R035_T36MVE_20210315T092856"
+
 
 def check_path(filename):
     """
@@ -68,3 +100,287 @@ class TempDirTest(TestCase):
     def tearDown(self):
         os.chdir(self.curdir)
         shutil.rmtree(self.tmpdir)
+
+
+def _synthetic_band(x, y, mean, amplitude, rng):
+    """
+    Return smoothly varying values with noise on a grid of coordinates.
+    """
+
+    # features a few km across, like fields, forests, and water
+    pattern = (
+        np.sin(x / 1700.0) * np.cos(y / 2300.0)
+        + 0.5 * np.sin((x + y) / 900.0)
+        + 0.25 * np.cos((x - 2 * y) / 400.0)
+    ) / 1.75
+    noise = rng.normal(scale=0.05, size=pattern.shape)
+    return mean + amplitude * (pattern + noise)
+
+
+def write_synthetic_image(filename, width, height, transform, crs,
+                          mean=10000, amplitude=3000, dtype="uint16",
+                          nodata=0, nodata_corner=True, driver=None,
+                          tiled=True, blocksize=256, compress=None, seed=0):
+    """
+    Write a single band image of synthetic data.
+
+    Data are written block by block, so images of any size can be
+    made with little memory.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file. The driver is chosen from the extension
+        (.tif or .jp2) if not given.
+    width, height : int
+        Dimensions in pixels.
+    transform : Affine
+        The image transform.
+    crs : str or CRS
+        The coordinate reference system.
+    mean, amplitude : optional, float
+        Mean and amplitude of the data values.
+    dtype : optional, str
+        Data type.
+        Default: "uint16".
+    nodata : optional, float
+        The nodata value.
+        Default: 0.
+    nodata_corner : optional, bool
+        If True, the upper left corner of the image is set to nodata,
+        as at the edge of a satellite swath.
+        Default: True.
+    driver : optional, str
+        The GDAL driver, "GTiff" or "JP2OpenJPEG".
+    tiled : optional, bool
+        If True, write a tiled image. Otherwise, write strips.
+        Default: True.
+    blocksize : optional, int
+        Size of tiles (or height of strips).
+        Default: 256.
+    compress : optional, str
+        GeoTIFF compression (e.g., "deflate" or "lzw"). JPEG 2000
+        images are always compressed losslessly.
+    seed : optional, int
+        Random seed.
+    """
+
+    import rasterio
+    from rasterio.windows import Window
+
+    if driver is None:
+        ext = os.path.splitext(filename)[1].lower()
+        driver = "JP2OpenJPEG" if ext == ".jp2" else "GTiff"
+
+    profile = {
+        "driver": driver,
+        "width": width,
+        "height": height,
+        "count": 1,
+        "dtype": dtype,
+        "crs": crs,
+        "transform": transform,
+        "nodata": nodata,
+    }
+    if driver == "GTiff":
+        if tiled:
+            profile.update(tiled=True, blockxsize=blocksize, blockysize=blocksize)
+        else:
+            profile.update(tiled=False, blockysize=min(blocksize, height))
+        if compress is not None:
+            profile["compress"] = compress
+    elif driver == "JP2OpenJPEG":
+        profile.update(quality=100, reversible=True)
+        # smaller images are written as a single block
+        if min(width, height) > blocksize * 4:
+            profile.update(blockxsize=blocksize * 4, blockysize=blocksize * 4)
+
+    info = np.iinfo(dtype) if np.dtype(dtype).kind in "iu" else np.finfo(dtype)
+    # write in strips of whole blocks
+    rows = blocksize * max(1, 1024 // blocksize)
+    with rasterio.open(filename, "w", **profile) as f:
+        for row_off in range(0, height, rows):
+            window = Window(0, row_off, width, min(rows, height - row_off))
+            rng = np.random.default_rng((seed, row_off))
+            cols, rws = np.meshgrid(
+                np.arange(window.width) + 0.5,
+                np.arange(window.height) + row_off + 0.5,
+            )
+            x, y = transform * (cols, rws)
+            data = _synthetic_band(x, y, mean, amplitude, rng)
+            if nodata_corner:
+                # a diagonal swath edge cutting off a tenth of the image
+                data[cols / width + rws / height < 0.45] = np.nan
+            data = np.clip(data, info.min, info.max)
+            if nodata is not None:
+                data[np.isnan(data)] = nodata
+            f.write(data.astype(dtype), 1, window=window)
+    return filename
+
+
+def _write_synthetic_scene(directory, prefix, bands, selected, extension,
+                           size, pixel_size, origin, crs, **kwargs):
+    from rasterio.transform import from_origin
+
+    if isinstance(size, int):
+        size = (size, size)
+    if selected is None:
+        selected = list(bands)
+    os.makedirs(directory, exist_ok=True)
+
+    seed = kwargs.pop("seed", 0)
+    filenames = []
+    for i, band in enumerate(selected):
+        factor, mean, amplitude = bands[band]
+        res = pixel_size * factor
+        width = max(1, math.ceil(size[0] / factor))
+        height = max(1, math.ceil(size[1] / factor))
+        filename = os.path.join(directory, f"{prefix}_{band}.{extension}")
+        write_synthetic_image(
+            filename, width, height, from_origin(*origin, res, res), crs,
+            mean=mean, amplitude=amplitude, seed=seed + i,
+            **kwargs
+        )
+        filenames.append(filename)
+    return filenames
+
+
+def make_landsat8_scene(directory, size=1000, pixel_size=30, origin=(399960, -100020),
+                        crs="EPSG:32636", bands=None, **kwargs):
+    """
+    Write a synthetic Landsat-8 level 2 scene.
+
+    Files are named like Landsat-8 collection 2 surface reflectance
+    products and are identified as such when loaded.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write the files.
+    size : optional, int or tuple of (int, int)
+        Width and height in pixels.
+        Default: 1000.
+    pixel_size : optional, float
+        Pixel size in units of the CRS.
+        Default: 30.
+    origin : optional, tuple of (float, float)
+        Coordinates of the upper left corner. The default is near
+        Lake Victoria, where the sample data are from.
+    crs : optional, str or CRS
+        The coordinate reference system.
+        Default: "EPSG:32636".
+    bands : optional, list of str
+        Bands to write (e.g., ["SR_B4", "SR_B5"]). By default, all
+        bands in landsat8_bands are written.
+
+    Additional keyword arguments (e.g., tiled, blocksize, compress,
+    and seed) are passed to write_synthetic_image.
+
+    Returns
+    -------
+    filenames : list of str
+
+    Examples
+    --------
+    >>> from yt_georaster.testing import make_landsat8_scene
+    >>> fns = make_landsat8_scene("landsat", size=2000, compress="deflate")
+    >>> ds = yt.load(*fns)
+    """
+
+    return _write_synthetic_scene(
+        directory, landsat8_prefix, landsat8_bands, bands, "TIF",
+        size, pixel_size, origin, crs, **kwargs
+    )
+
+
+def make_sentinel2_scene(directory, size=1098, pixel_size=10, origin=(399960, 9900000),
+                         crs="EPSG:32736", bands=None, **kwargs):
+    """
+    Write a synthetic Sentinel-2 level 1C scene.
+
+    Files are named like Sentinel-2 products and are identified as
+    such when loaded. Bands are written at their relative native
+    resolutions, i.e., the 20 m and 60 m bands have pixels two and six
+    times the size of the 10 m bands.
+
+    Parameters
+    ----------
+    directory : str
+        Directory in which to write the files.
+    size : optional, int or tuple of (int, int)
+        Width and height in pixels of the finest bands.
+        Default: 1098.
+    pixel_size : optional, float
+        Pixel size of the finest bands in units of the CRS.
+        Default: 10.
+    origin : optional, tuple of (float, float)
+        Coordinates of the upper left corner. The default places
+        the scene over the default Landsat-8 scene, as in the sample
+        data.
+    crs : optional, str or CRS
+        The coordinate reference system.
+        Default: "EPSG:32736".
+    bands : optional, list of str
+        Bands to write (e.g., ["B04", "B8A"]). By default, all bands
+        in sentinel2_bands are written.
+
+    Additional keyword arguments (e.g., tiled, blocksize, compress,
+    and seed) are passed to write_synthetic_image.
+
+    Returns
+    -------
+    filenames : list of str
+
+    Examples
+    --------
+    >>> from yt_georaster.testing import make_sentinel2_scene
+    >>> fns = make_sentinel2_scene("s2", bands=["B04", "B8A"])
+    >>> ds = yt.load(*fns)
+    """
+
+    return _write_synthetic_scene(
+        directory, sentinel2_prefix, sentinel2_bands, bands, "jp2",
+        size, pixel_size, origin, crs, **kwargs
+    )
+
+
+def make_polygon_file(filename, center, radius, crs, vertices=64):
+    """
+    Write a shapefile containing a single (roughly circular) polygon.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the shapefile.
+    center : tuple of (float, float)
+        Center of the polygon in units of the CRS.
+    radius : float
+        Radius of the polygon in units of the CRS.
+    crs : str or CRS
+        The coordinate reference system.
+    vertices : optional, int
+        Number of vertices.
+        Default: 64.
+    """
+
+    import fiona
+    from rasterio.crs import CRS
+
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    # an irregular outline so the polygon is not a circle
+    radii = radius * (1 + 0.2 * np.sin(3 * angles))
+    ring = [
+        (float(center[0] + r * np.cos(a)), float(center[1] + r * np.sin(a)))
+        for r, a in zip(radii, angles)
+    ]
+    ring.append(ring[0])
+
+    schema = {"geometry": "Polygon", "properties": {"id": "int"}}
+    crs_wkt = CRS.from_user_input(crs).to_wkt()
+    with fiona.open(filename, "w", driver="ESRI Shapefile", schema=schema,
+                    crs_wkt=crs_wkt) as f:
+        f.write({
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {"id": 1},
+        })
+    return filename
@@ -0,0 +1,489 @@
+"""
+Rendering of web-mercator (XYZ) map tiles.
+
+Tiles can be rendered directly from a dataset with
+:func:`~yt_georaster.data_structures.GeoRasterDataset.render_tile`,
+cached on disk with a :class:`~yt_georaster.tiles.TileCache`, and served
+locally with :func:`~yt_georaster.tiles.serve_tiles`.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_bounds
+
+from yt.funcs import mylog
+
+# half the width of the web-mercator world in metres
+WEB_MERCATOR_EXTENT = 20037508.342789244
+WEB_MERCATOR_CRS = CRS.from_epsg(3857)
+
+
+def tile_bounds(z, x, y):
+    """
+    Return the web-mercator bounds (left, bottom, right, top) of a tile.
+
+    Tiles are numbered from the top left as in the XYZ (slippy map)
+    convention.
+    """
+
+    size = 2 * WEB_MERCATOR_EXTENT / 2 ** z
+    left = -WEB_MERCATOR_EXTENT + x * size
+    top = WEB_MERCATOR_EXTENT - y * size
+    return left, top - size, left + size, top
+
+
+class _FieldEvaluator:
+    """
+    Minimal data object for evaluating derived fields on arrays.
+
+    On-disk fields are provided up front. Derived fields (including
+    aliases) are generated on request with their field functions.
+    """
+
+    def __init__(self, ds, disk_data):
+        self.ds = ds
+        self._disk_data = disk_data
+        self._data = {}
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def __contains__(self, field):
+        return field in self._data
+
+    def __delitem__(self, field):
+        del self._data[field]
+
+    def __getitem__(self, field):
+        if field in self._data:
+            return self._data[field]
+
+        finfo = self.ds.field_info[field]
+        if field in self._disk_data:
+            value = self.ds.arr(self._disk_data[field], finfo.units)
+        else:
+            value = finfo._function(finfo, self)
+            if not hasattr(value, "units"):
+                value = self.ds.arr(value, finfo.units)
+            elif finfo.units is not None and value.units.dimensions == \
+                    self.ds.quan(1, finfo.units).units.dimensions:
+                value = value.to(finfo.units)
+        self._data[field] = value
+        return value
+
+
+def get_field_on_grid(ds, field, dst_crs, dst_transform, width, height):
+    """
+    Return the values of a field on an arbitrary target grid.
+
+    Only the on-disk fields needed are read, directly onto the target
+    grid. Derived fields are then calculated from them.
+
+    Returns
+    -------
+    data : unyt_array
+        Field values of shape (height, width), in row-major image order.
+        Pixels with no data are NaN.
+    """
+
+    disk_fields = ds.field_info.get_disk_dependencies([field])
+    disk_data = ds.index.io.read_warped(
+        disk_fields, dst_crs, dst_transform, width, height
+    )
+    return _FieldEvaluator(ds, disk_data)[field]
+
+
+def _get_colormap(cmap):
+    import matplotlib
+
+    if not isinstance(cmap, str):
+        return cmap
+    try:
+        return matplotlib.colormaps[cmap]
+    except AttributeError:
+        from matplotlib import cm
+
+        return cm.get_cmap(cmap)
+
+
+def colorize(data, cmap="viridis", vmin=None, vmax=None, log=False):
+    """
+    Map an array of values to an RGBA image.
+
+    NaN values are fully transparent.
+
+    Returns
+    -------
+    image : ndarray
+        uint8 array of shape data.shape + (4,).
+    """
+
+    data = np.asarray(data, dtype="float64")
+    if log:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            data = np.log10(data)
+            vmin = None if vmin is None else np.log10(vmin)
+            vmax = None if vmax is None else np.log10(vmax)
+    valid = np.isfinite(data)
+
+    if vmin is None or vmax is None:
+        if valid.any():
+            dmin, dmax = data[valid].min(), data[valid].max()
+        else:
+            dmin, dmax = 0, 1
+        vmin = dmin if vmin is None else vmin
+        vmax = dmax if vmax is None else vmax
+    scale = vmax - vmin if vmax != vmin else 1
+
+    norm = np.zeros(data.shape)
+    norm[valid] = np.clip((data[valid] - vmin) / scale, 0, 1)
+    image = _get_colormap(cmap)(norm, bytes=True)
+    image[~valid] = 0
+    return image
+
+
+def to_png(image):
+    """
+    Encode an RGBA image as PNG bytes.
+    """
+
+    from matplotlib.image import imsave
+
+    buf = io.BytesIO()
+    imsave(buf, image, format="png")
+    return buf.getvalue()
+
+
+class TileCache:
+    """
+    A size-limited on-disk cache of rendered tiles.
+
+    Tiles are stored as files in a directory. When the total size
+    exceeds max_bytes, the least recently used tiles are removed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory where tiles are stored. It will be created if needed.
+    max_bytes : optional, int
+        Maximum total size of cached tiles in bytes.
+        Default: 256 MB.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 ** 2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for fn in os.listdir(directory):
+            if fn.endswith(".tile"):
+                path = os.path.join(directory, fn)
+                self._sizes[path] = os.path.getsize(path)
+        self._size = sum(self._sizes.values())
+
+    def __repr__(self):
+        return f"TileCache ({self.directory}: {len(self._sizes)} tiles)"
+
+    def __len__(self):
+        return len(self._sizes)
+
+    @staticmethod
+    def get_key(*args):
+        """
+        Return a cache key for a set of json-serializable arguments.
+        """
+
+        text = json.dumps(args, sort_keys=True, default=str)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.tile")
+
+    def get(self, key):
+        """
+        Return the cached bytes for a key, or None.
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, mode="rb") as f:
+                value = f.read()
+        except OSError:
+            return None
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        Store bytes for a key and evict old tiles if needed.
+        """
+
+        path = self._path(key)
+        tmppath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmppath, mode="wb") as f:
+            f.write(value)
+        os.replace(tmppath, path)
+
+        with self._lock:
+            self._size += len(value) - self._sizes.get(path, 0)
+            self._sizes[path] = len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+
+        for path in sorted(self._sizes, key=mtime):
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._size -= self._sizes.pop(path)
+
+    def clear(self):
+        """
+        Remove all cached tiles.
+        """
+
+        with self._lock:
+            for path in self._sizes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._sizes = {}
+            self._size = 0
+
+
+def _get_function_id(function):
+    """
+    Return a string identifying a derived field function.
+    """
+
+    expression = getattr(function, "expression", None)
+    if expression is not None:
+        return str(expression)
+    code = getattr(function, "__code__", None)
+    module = getattr(function, "__module__", "")
+    name = f"{module}.{getattr(function, '__qualname__', repr(function))}"
+    if code is None:
+        return name
+    digest = hashlib.sha1(code.co_code + repr(code.co_consts).encode())
+    return f"{name}:{digest.hexdigest()}"
+
+
+def _get_tile_cache_key(ds, field, z, x, y, cmap, vmin, vmax, log, tile_size, output):
+    disk_fields = ds.field_info.get_disk_dependencies([field])
+    io = ds.index.io
+    files = {}
+    bands = []
+    for f in sorted(disk_fields):
+        read_info = io._get_read_info(f)
+        filename = read_info["filename"]
+        if filename not in files:
+            st = os.stat(filename)
+            files[filename] = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+        # band metadata affecting values read, as for block cache keys
+        bands.append((f, read_info["band"]) + tuple(
+            read_info.get(key) for key in ("scale", "offset", "nodata", "fill_value")))
+    function = ds.band_math.get(field)
+    if function is None and field in ds.field_info:
+        function = ds.field_info[field]._function
+    return TileCache.get_key(
+        [files[fn] for fn in sorted(files)], bands, field, _get_function_id(function),
+        z, x, y, str(cmap), vmin, vmax, log, tile_size, output,
+        str(ds.resample_method), ds.nodata, ds.mask_nodata, str(ds.crs),
+    )
+
+
+def render_tile(ds, field, z, x, y, cmap="viridis", vmin=None, vmax=None,
+                log=False, tile_size=256, output="png", cache=None):
+    """
+    Render a web-mercator (XYZ) map tile of a field.
+
+    See :func:`~yt_georaster.data_structures.GeoRasterDataset.render_tile`.
+    """
+
+    if output not in ("png", "rgba"):
+        raise ValueError(f"output must be 'png' or 'rgba', not {output!r}.")
+    if isinstance(cache, str):
+        cache = TileCache(cache)
+
+    key = None
+    if cache is not None and output == "png":
+        key = _get_tile_cache_key(
+            ds, field, z, x, y, cmap, vmin, vmax, log, tile_size, output
+        )
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    bounds = tile_bounds(z, x, y)
+    if _overlaps_dataset(ds, bounds):
+        dst_transform = from_bounds(*bounds, tile_size, tile_size)
+        data = get_field_on_grid(
+            ds, field, WEB_MERCATOR_CRS, dst_transform, tile_size, tile_size
+        )
+        image = colorize(data.d, cmap=cmap, vmin=vmin, vmax=vmax, log=log)
+    else:
+        image = np.zeros((tile_size, tile_size, 4), dtype=np.uint8)
+
+    if output == "rgba":
+        return image
+
+    value = to_png(image)
+    if key is not None:
+        cache.put(key, value)
+    return value
+
+
+def _overlaps_dataset(ds, bounds):
+    """
+    Return True if web-mercator bounds overlap the dataset domain.
+    """
+
+    ds_bounds = getattr(ds, "_web_mercator_bounds", None)
+    if ds_bounds is None:
+        left, bottom = ds.domain_left_edge.d[:2]
+        right, top = ds.domain_right_edge.d[:2]
+        ds_bounds = transform_bounds(
+            ds.parameters["crs"], WEB_MERCATOR_CRS, left, bottom, right, top
+        )
+        ds._web_mercator_bounds = ds_bounds
+    return not (
+        bounds[2] <= ds_bounds[0] or bounds[0] >= ds_bounds[2] or
+        bounds[3] <= ds_bounds[1] or bounds[1] >= ds_bounds[3]
+    )
+
+
+def get_tile_server(ds, host="127.0.0.1", port=8000, cache=None, **render_kwargs):
+    """
+    Create an HTTP server for map tiles of a dataset.
+
+    Tiles are served from
+    http://host:port/<field type>/<field name>/<z>/<x>/<y>.png and the
+    cmap, vmin, vmax, and log keywords of
+    :func:`~yt_georaster.data_structures.GeoRasterDataset.render_tile`
+    can be given as query parameters.
+
+    Returns
+    -------
+    server : http.server.ThreadingHTTPServer
+    """
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, unquote, urlparse
+
+    if isinstance(cache, str):
+        cache = TileCache(cache)
+
+    class TileRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [unquote(part) for part in url.path.strip("/").split("/")]
+            try:
+                ftype, fname, z, x, y = parts
+                if not y.endswith(".png"):
+                    raise ValueError
+                z, x, y = int(z), int(x), int(y[:-4])
+            except ValueError:
+                self.send_error(404, "Tile URLs are /ftype/fname/z/x/y.png")
+                return
+
+            kwargs = dict(render_kwargs)
+            query = parse_qs(url.query)
+            for key in ("cmap", "vmin", "vmax", "log"):
+                if key not in query:
+                    continue
+                value = query[key][-1]
+                if key in ("vmin", "vmax"):
+                    value = float(value)
+                elif key == "log":
+                    value = value.lower() in ("1", "true", "yes")
+                kwargs[key] = value
+
+            field = (ftype, fname)
+            if field not in ds.field_info:
+                self.send_error(404, f"Unknown field {field}.")
+                return
+            try:
+                png = ds.render_tile(field, z, x, y, cache=cache, **kwargs)
+            except Exception as e:
+                mylog.error(f"Failed to render tile {self.path}: {e}")
+                self.send_error(500, str(e))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(png)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(png)
+
+        def log_message(self, format, *args):
+            mylog.debug(format, *args)
+
+    return ThreadingHTTPServer((host, port), TileRequestHandler)
+
+
+def serve_tiles(ds, host="127.0.0.1", port=8000, cache=None, **render_kwargs):
+    """
+    Serve map tiles of a dataset over HTTP until interrupted.
+
+    This is intended for local use, e.g., as an XYZ tile layer in a
+    web map viewer. See :func:`~yt_georaster.tiles.get_tile_server`.
+
+    Examples
+    --------
+    >>> from yt_georaster.tiles import serve_tiles
+    >>> serve_tiles(ds, port=8000, cache="tile_cache", vmin=0, vmax=0.3)
+    """
+
+    server = get_tile_server(ds, host=host, port=port, cache=cache, **render_kwargs)
+    mylog.info(
+        f"Serving tiles at http://{host}:{server.server_port}/"
+        "<ftype>/<fname>/{z}/{x}/{y}.png"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(args=None):
+    import argparse
+    import yt
+
+    parser = argparse.ArgumentParser(description="Serve map tiles of image files.")
+    parser.add_argument("filenames", nargs="+", help="Image files to load.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache", default=None, help="Directory for cached tiles.")
+    parser.add_argument("--field-map", default=None, help="Field map yaml file.")
+    pargs = parser.parse_args(args)
+
+    ds = yt.load(*pargs.filenames, field_map=pargs.field_map)
+    serve_tiles(ds, host=pargs.host, port=pargs.port, cache=pargs.cache)
+
+
+if __name__ == "__main__":
+    main()
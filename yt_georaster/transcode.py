@@ -0,0 +1,432 @@
+"""
+Transcoding of JPEG 2000 images to tiled GeoTIFF.
+
+JPEG 2000 files (e.g., Sentinel-2 bands) are much slower to decode than
+tiled GeoTIFFs. A :class:`~yt_georaster.transcode.TranscodeCache`
+converts them to tiled, compressed GeoTIFFs in a cache directory, which
+are then read instead. Files can be transcoded ahead of time with
+:func:`~yt_georaster.transcode.pretranscode`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import hashlib
+import os
+import threading
+import time
+
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from yt.funcs import mylog
+
+
+class TranscodeCache:
+    """
+    A size-limited directory of JPEG 2000 images transcoded to tiled
+    GeoTIFF.
+
+    Copies are named by the path, size, and modification time of the
+    original, so a changed file is transcoded again. Values are
+    unchanged (compression is lossless) and the CRS, transform, nodata,
+    scales, offsets, and tags are kept. Overviews are added for the
+    same levels as the original, so low resolution reads (e.g., for
+    plots) stay fast.
+
+    With background=True, files are transcoded in a background thread
+    the first time they are needed and the original is read until the
+    copy is ready. When the total size of the directory exceeds
+    max_bytes, the least recently used copies are removed. Several
+    processes can share one directory.
+
+    Parameters
+    ----------
+    directory : str
+        Directory for transcoded files. It will be created if needed.
+    max_bytes : optional, int
+        Maximum total size of transcoded files in bytes.
+        Default: 10 GB.
+    compress : optional, str
+        GeoTIFF compression.
+        Default: "deflate".
+    blocksize : optional, int
+        Width and height of GeoTIFF tiles.
+        Default: 512.
+    background : optional, bool
+        If True, transcode in a background thread. If False, transcode
+        when first needed and wait.
+        Default: True.
+
+    Examples
+    --------
+    >>> import glob
+    >>> fns = glob.glob("M2_Sentinel-2_test_data/*.jp2")
+    >>> ds = yt.load(*fns, transcode_cache="jp2_cache")
+    """
+
+    # seconds after which a lock left by another process is ignored
+    _lock_timeout = 3600
+    # seconds between checks for a file being transcoded elsewhere
+    _poll_interval = 1.0
+
+    def __init__(self, directory, max_bytes=10 * 1024 ** 3, compress="deflate",
+                 blocksize=512, background=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.blocksize = blocksize
+        self.background = background
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._used = set()
+        self._executor = None
+
+    def __repr__(self):
+        return f"TranscodeCache ({self.directory}: {len(self._list_files())} files)"
+
+    def __reduce__(self):
+        # locks and threads are not picklable
+        return (
+            self.__class__,
+            (self.directory, self.max_bytes, self.compress, self.blocksize,
+             self.background),
+        )
+
+    @staticmethod
+    def is_transcodable(filename):
+        """
+        Return True if a file is a JPEG 2000 image.
+        """
+
+        return filename.lower().endswith(".jp2")
+
+    def get_path(self, filename):
+        """
+        Return the path of the transcoded copy of a file.
+        """
+
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        key = f"{path}:{st.st_size}:{st.st_mtime_ns}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return os.path.join(self.directory, f"{name}.{digest}.tif")
+
+    def get(self, filename):
+        """
+        Return the file to read in place of a file.
+
+        This is the transcoded copy if it exists. Otherwise, the copy
+        is made (in the background, if enabled) and the original is
+        returned until it is ready.
+        """
+
+        if not self.is_transcodable(filename):
+            return filename
+        path = self.get_path(filename)
+        if os.path.exists(path):
+            self._touch(path)
+            return path
+
+        if not self.background:
+            return self.transcode(filename)
+
+        with self._lock:
+            if path not in self._pending:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                self._pending[path] = self._executor.submit(
+                    self._transcode_pending, filename, path
+                )
+        return filename
+
+    def wait(self):
+        """
+        Wait for all background transcoding to finish.
+        """
+
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            future.result()
+
+    def _transcode_pending(self, filename, path):
+        try:
+            return self.transcode(filename)
+        except Exception as e:
+            mylog.warning(f"Could not transcode {filename}: {e}.")
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def _touch(self, path):
+        """
+        Mark a copy as used, once per process.
+        """
+
+        if path in self._used:
+            return
+        try:
+            os.utime(path)
+        except OSError:
+            return
+        self._used.add(path)
+
+    def transcode(self, filename):
+        """
+        Transcode a file now, if not already done, and return the path
+        of the copy.
+
+        If another process is transcoding the file, the original path
+        is returned without waiting. Use transcode_and_wait to wait for
+        the copy.
+        """
+
+        path = self.get_path(filename)
+        if os.path.exists(path):
+            return path
+
+        # only one process transcodes a file
+        lockfile = f"{path}.lock"
+        try:
+            fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                stale = time.time() - os.path.getmtime(lockfile) > self._lock_timeout
+            except OSError:
+                stale = True
+            if not stale:
+                return filename
+            os.remove(lockfile)
+            return self.transcode(filename)
+        os.close(fd)
+
+        tmppath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            start = time.perf_counter()
+            transcode_file(
+                filename, tmppath, compress=self.compress, blocksize=self.blocksize
+            )
+            os.replace(tmppath, path)
+            mylog.info(
+                f"Transcoded {os.path.basename(filename)} in "
+                f"{time.perf_counter() - start:.1f} s."
+            )
+        finally:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            os.remove(lockfile)
+
+        self._used.add(path)
+        self.cleanup()
+        return path
+
+    def transcode_and_wait(self, filename):
+        """
+        Transcode a file, waiting for any other process already doing
+        so, and return the path of the copy.
+
+        The wait ends when the other process finishes, or takes over
+        if it fails or its lock is older than _lock_timeout.
+        """
+
+        waiting = False
+        while True:
+            path = self.transcode(filename)
+            if path != filename:
+                return path
+            if not waiting:
+                mylog.info(
+                    f"Waiting for another process transcoding "
+                    f"{os.path.basename(filename)}."
+                )
+                waiting = True
+            time.sleep(self._poll_interval)
+
+    def _list_files(self):
+        return glob.glob(os.path.join(self.directory, "*.tif"))
+
+    def cleanup(self, max_bytes=None):
+        """
+        Remove the least recently used copies until the directory is
+        within max_bytes.
+
+        Returns
+        -------
+        removed : list of str
+            The files removed.
+        """
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        files = []
+        for path in self._list_files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        size = sum(fsize for _, fsize, _ in files)
+
+        removed = []
+        for _, fsize, path in sorted(files):
+            if size <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= fsize
+            removed.append(path)
+            self._used.discard(path)
+        if removed:
+            mylog.info(f"Removed {len(removed)} files from {self.directory}.")
+        return removed
+
+
+def transcode_file(filename, output, compress="deflate", blocksize=512):
+    """
+    Losslessly convert an image to a tiled GeoTIFF.
+
+    Data are copied in strips of tiles, so little memory is needed.
+
+    Parameters
+    ----------
+    filename : str
+        The image to convert.
+    output : str
+        Path of the GeoTIFF to write.
+    compress : optional, str
+        GeoTIFF compression.
+        Default: "deflate".
+    blocksize : optional, int
+        Width and height of GeoTIFF tiles.
+        Default: 512.
+    """
+
+    with rasterio.open(filename) as src:
+        profile = {
+            "driver": "GTiff",
+            "width": src.width,
+            "height": src.height,
+            "count": src.count,
+            "dtype": src.dtypes[0],
+            "crs": src.crs,
+            "transform": src.transform,
+            "nodata": src.nodata,
+            "tiled": True,
+            "blockxsize": blocksize,
+            "blockysize": blocksize,
+            "BIGTIFF": "IF_SAFER",
+        }
+        if compress is not None:
+            profile["compress"] = compress
+            profile["predictor"] = 3 if src.dtypes[0].startswith("float") else 2
+        overviews = src.overviews(1)
+
+        with rasterio.open(output, "w", **profile) as dst:
+            dst.scales = src.scales
+            dst.offsets = src.offsets
+            dst.update_tags(**src.tags())
+            for i in range(1, src.count + 1):
+                dst.update_tags(i, **src.tags(i))
+                if src.descriptions[i - 1]:
+                    dst.set_band_description(i, src.descriptions[i - 1])
+
+            rows = blocksize * 4
+            for row_off in range(0, src.height, rows):
+                window = Window(0, row_off, src.width, min(rows, src.height - row_off))
+                dst.write(src.read(window=window), window=window)
+
+            if overviews:
+                dst.build_overviews(overviews, Resampling.average)
+
+
+def pretranscode(paths, directory, threads=None, **kwargs):
+    """
+    Transcode JPEG 2000 images to tiled GeoTIFF ahead of time.
+
+    Parameters
+    ----------
+    paths : str or list of str
+        Image files or directories, which are searched recursively for
+        .jp2 files.
+    directory : str or TranscodeCache
+        The cache directory (or cache) to use when loading data.
+    threads : optional, int
+        Number of files to transcode at once. By default, the number
+        of cores is used.
+
+    Additional keyword arguments (e.g., compress and max_bytes) are
+    passed to TranscodeCache.
+
+    Returns
+    -------
+    paths : list of str
+        The transcoded files. Files being transcoded by another process
+        are waited for.
+
+    Examples
+    --------
+    >>> from yt_georaster import pretranscode
+    >>> pretranscode("M2_Sentinel-2_test_data", "jp2_cache")
+    >>> fns = glob.glob("M2_Sentinel-2_test_data/*.jp2")
+    >>> ds = yt.load(*fns, transcode_cache="jp2_cache")
+    """
+
+    if isinstance(directory, TranscodeCache):
+        cache = directory
+    else:
+        cache = TranscodeCache(directory, **kwargs)
+    if isinstance(paths, str):
+        paths = [paths]
+
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, fns in os.walk(path):
+                filenames.extend(
+                    os.path.join(root, fn) for fn in sorted(fns)
+                    if cache.is_transcodable(fn)
+                )
+        elif cache.is_transcodable(path):
+            filenames.append(path)
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        return list(executor.map(cache.transcode_and_wait, filenames))
+
+
+def get_transcode_cache(transcode_cache):
+    """
+    Return a TranscodeCache from a directory or cache, or None.
+    """
+
+    if transcode_cache is None or isinstance(transcode_cache, TranscodeCache):
+        return transcode_cache
+    return TranscodeCache(transcode_cache)
+
+
+def main(args=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Transcode JPEG 2000 images to tiled GeoTIFF."
+    )
+    parser.add_argument("paths", nargs="+", help="Image files or directories.")
+    parser.add_argument("--cache", required=True, help="Cache directory.")
+    parser.add_argument("--compress", default="deflate")
+    parser.add_argument("--threads", type=int, default=None)
+    pargs = parser.parse_args(args)
+
+    paths = pretranscode(
+        pargs.paths, pargs.cache, threads=pargs.threads, compress=pargs.compress
+    )
+    mylog.info(f"Transcoded {len(paths)} files to {pargs.cache}.")
+
+
+if __name__ == "__main__":
+    main()
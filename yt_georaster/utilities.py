@@ -4,15 +4,65 @@ Utility functions for yt_georaster.
 
 
 """
+import json
 import numpy as np
+import os
 import rasterio
 from rasterio.warp import reproject, Resampling, calculate_default_transform
 from unyt import unyt_array, unyt_quantity, uconcatenate
-import yaml
 
 from yt.utilities.logger import ytLogger
 
 
+def _get_grid_record(ds, values=False):
+    """
+    Return the grid of a dataset as stored in cache sidecar files.
+
+    If values is True, also include the dataset settings that change
+    values resampled onto the grid.
+    """
+
+    params = ds.parameters
+    record = {
+        "crs": params["crs"].to_wkt(),
+        "transform": list(params["transform"])[:6],
+        "width": int(params["width"]),
+        "height": int(params["height"]),
+    }
+    if values:
+        nodata = ds.nodata
+        record["resample_method"] = ds.resample_method.name
+        record["nodata"] = None if nodata is None else repr(float(nodata))
+    # compare as stored on disk
+    return json.loads(json.dumps(record))
+
+
+def _write_json(filename, data, **kwargs):
+    """
+    Write data to a json file.
+
+    The file is replaced atomically, so readers (e.g., in other
+    processes) never see a partial file. Keyword arguments are passed
+    to json.dump.
+    """
+
+    tmpfn = f"{filename}.{os.getpid()}.tmp"
+    with open(tmpfn, mode="w") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmpfn, filename)
+
+
+def _get_selection_mask(data_source, wgrid):
+    """
+    Return a 2D mask of the pixels of a window grid in a data container.
+    """
+
+    mask = wgrid._get_selector_mask(data_source.selector)
+    if mask is None:
+        return np.zeros(tuple(wgrid.ActiveDimensions[:2]), dtype=bool)
+    return mask[..., 0]
+
+
 def get_field_as_raster_array(ds, data_source, field, nodata=None):
     r"""
     Return field within data_source as 2d raster image array and its transform.
@@ -41,7 +91,7 @@ def get_field_as_raster_array(ds, data_source, field, nodata=None):
     )
     data = wgrid[field].d[..., 0]
     if not (nodata is None):
-        mask = data_source.selector.fill_mask(wgrid)[..., 0]
+        mask = _get_selection_mask(data_source, wgrid)
         data[~mask] = nodata
     if ds._flip_axes:
         data = np.flip(data, axis=ds._flip_axes)
@@ -74,6 +124,10 @@ def get_raster_arrays_and_transform(
     if dtype is None:
         dtype = ds.parameters['dtype']
 
+    # read all required bands in one pass
+    wgrid = ds.index.grids[0]._get_window_grid(data_source.selector)
+    ds.index.io.prefetch(wgrid.selector, wgrid, fields)
+
     arrays = []
     for field in fields:
         data, transform, width, height, bounds = get_field_as_raster_array(
@@ -203,7 +257,10 @@ def save_as_geotiff(ds, filename, fields=None, data_source=None,
         ytLogger.info(f"{filename} dtype set to {dtype}.")
 
     # get the mask to remove data not in the container
-    mask = data_source.selector.fill_mask(wgrid)[..., 0]
+    mask = _get_selection_mask(data_source, wgrid)
+
+    # read all required bands in one pass
+    ds.index.io.prefetch(wgrid.selector, wgrid, fields)
 
     field_info = {}
     transform, _width, _height = wgrid._get_rasterio_window_transform(
@@ -294,6 +351,8 @@ def save_as_geotiff(ds, filename, fields=None, data_source=None,
                 )
 
     if save_fmap:
+        import yaml
+
         yfn = f"{filename[:filename.rfind('.')]}_fields.yaml"
         with open(yfn, mode="w") as f:
             yaml.dump({prefix: field_info}, stream=f)